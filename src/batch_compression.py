@@ -0,0 +1,237 @@
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from compression_manager import compression, file_hash
+from custom_exceptions import InvalidBlockSizeError, InvalidFrequenciesNumberError
+from lazy_import import lazy_module
+
+iio = lazy_module("imageio.v3")
+
+DEFAULT_OUTPUT_FOLDER = "output_images"
+MANIFEST_NAME = "manifest.json"
+
+# Every finished job is appended to the journal next to the manifest (one JSON entry per line), so that a run
+# that is killed can be resumed. The journal is merged into the manifest at the end of the run
+JOURNAL_SUFFIX = ".journal"
+
+# Ways of deciding whether an output is already up to date, both only trust outputs recorded in the previous
+# manifest (or its journal) with their size:
+# "mtime" compares the modification time of the output with the one of the source,
+# "hash" compares the content hash of the source with the one recorded in the previous manifest
+SKIP_MODES = ("mtime", "hash")
+
+
+def parse_setting(value):
+    """Parse a compression setting written as F:d (e.g. 8:6)."""
+    try:
+        block_size, frequences_cut = (int(number) for number in value.split(":"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid setting {value!r}, expected F:d (e.g. 8:6)")
+    return block_size, frequences_cut
+
+
+def find_images(source):
+    """Return the sorted .bmp files of a directory, or the files matched by a glob pattern."""
+    if os.path.isdir(source):
+        paths = glob.glob(os.path.join(source, "*.bmp"))
+    else:
+        paths = glob.glob(source)
+    return sorted(path for path in paths if os.path.isfile(path))
+
+
+def output_name(image_path, block_size, frequences_cut):
+    file_name = os.path.splitext(os.path.basename(image_path))[0]
+    return f"compressed_{file_name}_F{block_size}_d{frequences_cut}.bmp"
+
+
+def load_manifest(manifest_path):
+    """Return the entries of a previous manifest and of its journal (the jobs of an interrupted run), keyed by output path."""
+    entries = []
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as manifest_file:
+            entries.extend(json.load(manifest_file).get("files", []))
+
+    if os.path.exists(manifest_path + JOURNAL_SUFFIX):
+        with open(manifest_path + JOURNAL_SUFFIX) as journal_file:
+            for line in journal_file:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # The last line of a killed run may be cut
+                    pass
+
+    return {entry["output"]: entry for entry in entries if entry["status"] != "error"}
+
+
+def is_up_to_date(image_path, output_path, skip_mode, previous_entry=None, source_hash=None):
+    # An output is only trusted when it was recorded, and still has the recorded size
+    if previous_entry is None or not os.path.exists(output_path):
+        return False
+    if os.path.getsize(output_path) != previous_entry.get("output_bytes"):
+        return False
+
+    if skip_mode == "mtime":
+        return os.path.getmtime(output_path) >= os.path.getmtime(image_path)
+
+    return previous_entry.get("source_hash") == source_hash
+
+
+def partial_path(output_path):
+    """Path where an output is written before being moved into place, with the same extension."""
+    root, extension = os.path.splitext(output_path)
+    return f"{root}.partial-{os.getpid()}{extension}"
+
+
+def compress_job(image_path, block_size, frequences_cut, output_path):
+    """
+    Compress a single image, returning its manifest entry.
+    It runs inside the worker processes, so errors are reported in the entry instead of being raised.
+
+    The image is written to a partial file first and then moved to output_path, so that a job that is
+    killed never leaves a truncated output behind.
+    """
+    entry = {
+        "source": image_path,
+        "output": output_path,
+        "F": block_size,
+        "d": frequences_cut,
+        "source_bytes": os.path.getsize(image_path),
+    }
+
+    start_time = time.perf_counter()
+    temporary_path = partial_path(output_path)
+    try:
+        rows, columns = iio.improps(image_path).shape[:2]
+        compression(image_path, block_size, frequences_cut, output_path=temporary_path)
+        os.replace(temporary_path, output_path)
+    except (InvalidBlockSizeError, InvalidFrequenciesNumberError, OSError, ValueError) as e:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        entry.update(status="error", error=str(e))
+        return entry
+    elapsed_time = time.perf_counter() - start_time
+
+    blocks = (rows // block_size) * (columns // block_size)
+    entry.update(
+        status="done",
+        output_bytes=os.path.getsize(output_path),
+        seconds=elapsed_time,
+        blocks=blocks,
+        mb_per_second=entry["source_bytes"] / 1e6 / elapsed_time,
+        blocks_per_second=blocks / elapsed_time,
+    )
+    return entry
+
+
+def batch_compression(source, settings, jobs=1, output_folder=DEFAULT_OUTPUT_FOLDER, skip_mode="mtime", manifest_path=None):
+    """
+    Compress every image of a directory (or glob pattern) with every (F, d) setting.
+
+    Args:
+        source (str): Directory containing .bmp images, or a glob pattern.
+        settings (list): (F, d) pairs, every image is compressed once for each of them.
+        jobs (int): Number of worker processes.
+        output_folder (str): Folder of the compressed images.
+        skip_mode (str): "mtime" or "hash", see SKIP_MODES.
+        manifest_path (str): Path of the manifest, by default manifest.json inside the output folder.
+
+    Returns:
+        dict: The manifest, also saved in JSON format.
+    """
+    if skip_mode not in SKIP_MODES:
+        raise ValueError(f"Unknown skip mode {skip_mode!r}, expected one of {SKIP_MODES}")
+
+    os.makedirs(output_folder, exist_ok=True)
+    if manifest_path is None:
+        manifest_path = os.path.join(output_folder, MANIFEST_NAME)
+    previous_entries = load_manifest(manifest_path)
+
+    entries = []
+    pending_jobs = []
+    for image_path in find_images(source):
+        source_hash = file_hash(image_path) if skip_mode == "hash" else None
+
+        for block_size, frequences_cut in settings:
+            output_path = os.path.join(output_folder, output_name(image_path, block_size, frequences_cut))
+            previous_entry = previous_entries.get(output_path)
+
+            if is_up_to_date(image_path, output_path, skip_mode, previous_entry, source_hash):
+                entry = dict(previous_entry)
+                entry["status"] = "skipped"
+                entry["source_hash"] = source_hash
+                entries.append(entry)
+            else:
+                pending_jobs.append((image_path, block_size, frequences_cut, output_path, source_hash))
+
+    # Biggest files are scheduled first, so that a long job does not start last
+    pending_jobs.sort(key=lambda job: os.path.getsize(job[0]), reverse=True)
+
+    total_jobs = len(entries) + len(pending_jobs)
+    start_time = time.perf_counter()
+    journal_path = manifest_path + JOURNAL_SUFFIX
+    with ProcessPoolExecutor(max_workers=jobs) as pool, open(journal_path, "a") as journal_file:
+        futures = {pool.submit(compress_job, *job[:4]): job for job in pending_jobs}
+        for future in as_completed(futures):
+            entry = future.result()
+            entry["source_hash"] = futures[future][4]
+            entries.append(entry)
+            # Recorded as soon as it is done, see load_manifest
+            journal_file.write(json.dumps(entry) + "\n")
+            journal_file.flush()
+            print(f"[{len(entries)}/{total_jobs}] {entry['status']}: {entry['output']}")
+    elapsed_time = time.perf_counter() - start_time
+
+    compressed = [entry for entry in entries if entry["status"] == "done"]
+    total_bytes = sum(entry["source_bytes"] for entry in compressed)
+    total_blocks = sum(entry["blocks"] for entry in compressed)
+    manifest = {
+        "settings": [list(setting) for setting in settings],
+        "jobs": jobs,
+        "skip_mode": skip_mode,
+        "summary": {
+            "compressed": len(compressed),
+            "skipped": sum(entry["status"] == "skipped" for entry in entries),
+            "errors": sum(entry["status"] == "error" for entry in entries),
+            "seconds": elapsed_time,
+            "mb_per_second": total_bytes / 1e6 / elapsed_time if compressed else 0.0,
+            "blocks_per_second": total_blocks / elapsed_time if compressed else 0.0,
+        },
+        "files": sorted(entries, key=lambda entry: entry["output"]),
+    }
+
+    # The complete manifest replaces the previous one and the journal at once
+    temporary_path = partial_path(manifest_path)
+    with open(temporary_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    os.replace(temporary_path, manifest_path)
+    os.remove(journal_path)
+
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compress a directory of gray-scale bitmap images.")
+    parser.add_argument("source", help="Directory containing .bmp images, or a glob pattern (quote it)")
+    parser.add_argument("-s", "--settings", nargs="+", type=parse_setting, default=[(8, 6)],
+                        help="Compression settings written as F:d (default: 8:6)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="Number of worker processes")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT_FOLDER, help="Output folder")
+    parser.add_argument("--skip", choices=SKIP_MODES, default="mtime",
+                        help="How to detect outputs that are already up to date")
+    parser.add_argument("--manifest", help="Manifest path (default: manifest.json in the output folder)")
+    args = parser.parse_args(argv)
+
+    manifest = batch_compression(args.source, args.settings, args.jobs, args.output, args.skip, args.manifest)
+
+    summary = manifest["summary"]
+    print(f"Compressed {summary['compressed']}, skipped {summary['skipped']}, errors {summary['errors']} "
+          f"in {summary['seconds']:.2f} s ({summary['mb_per_second']:.2f} MB/s, {summary['blocks_per_second']:.0f} blocks/s)")
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
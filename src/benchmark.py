@@ -0,0 +1,289 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import re
+import sys
+import tempfile
+import timeit
+import tracemalloc
+import imageio.v3 as iio
+import numpy as np
+import scipy
+
+from compression_manager import compression, compress_blocks, split_blocks
+from dct import custom_dct2, scipy_dct2_fft
+from dct_backends import BACKENDS, available_backends
+
+PATH_MATRICES = "benchmark_matrices"
+PATH_IMAGES = "images"
+RESULTS_PATH = "dct_benchmark_results.json"
+
+WARMUP = 2
+REPEATS = 10
+
+# Relative slowdown of the median above which a benchmark is flagged as a regression
+REGRESSION_THRESHOLD = 0.10
+
+BLOCK_SIZES = [8, 16, 32]
+BATCH_BLOCKS = 4096
+SYNTHETIC_SIZES = [1024, 2048]
+
+
+def measure(function, *args, warmup=WARMUP, repeats=REPEATS, **kwargs):
+    """
+    Time a function with warm-up runs followed by repeated runs.
+
+    Args:
+        function (callable): Function to time.
+        warmup (int): Number of untimed runs, filling caches and FFT plans.
+        repeats (int): Number of timed runs.
+
+    Returns:
+        dict: median, first and third quartile, interquartile range, min and max (in seconds) and every run time.
+    """
+    for _ in range(warmup):
+        function(*args, **kwargs)
+
+    times = np.array(timeit.repeat(lambda: function(*args, **kwargs), number=1, repeat=repeats))
+    q1, median, q3 = np.percentile(times, [25, 50, 75])
+    return {
+        "median": float(median),
+        "q1": float(q1),
+        "q3": float(q3),
+        "iqr": float(q3 - q1),
+        "min": float(times.min()),
+        "max": float(times.max()),
+        "repeats": repeats,
+        "times": times.tolist(),
+    }
+
+
+def peak_memory(function, *args, **kwargs):
+    """Peak memory (in bytes) allocated by a single call, tracked by tracemalloc."""
+    tracemalloc.start()
+    try:
+        function(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def matrix_paths(folder=PATH_MATRICES):
+    """Benchmark matrices ordered by size, parsed from their matrix_[n]x[n].npy name."""
+    paths = []
+    for file_name in os.listdir(folder):
+        match = re.fullmatch(r"matrix_(\d+)x(\d+)\.npy", file_name)
+        if match:
+            paths.append((int(match.group(1)), os.path.join(folder, file_name)))
+    return [path for _, path in sorted(paths)]
+
+
+def benchmark_dct(warmup=WARMUP, repeats=REPEATS, folder=PATH_MATRICES):
+    """
+    Single matrix DCT2 of every benchmark matrix, and batched DCT2 of BATCH_BLOCKS blocks of every block size
+    with every registered backend.
+    """
+    results = []
+    for matrix_path in matrix_paths(folder):
+        matrix = np.load(matrix_path)
+        for name, function in [("custom_dct2", custom_dct2), ("scipy_dct2_fft", scipy_dct2_fft)]:
+            results.append({
+                "suite": "dct",
+                "name": name,
+                "params": {"size": len(matrix)},
+                **measure(function, matrix, warmup=warmup, repeats=repeats),
+            })
+
+    rng = np.random.default_rng(23)
+    for block_size in BLOCK_SIZES:
+        blocks = rng.uniform(0, 255, size=(BATCH_BLOCKS, block_size, block_size))
+        for name in available_backends(block_size):
+            results.append({
+                "suite": "dct_batch",
+                "name": name,
+                "params": {"block_size": block_size, "blocks": BATCH_BLOCKS},
+                **measure(BACKENDS[name].dct2, blocks, warmup=warmup, repeats=repeats),
+            })
+    return results
+
+
+def benchmark_images(folder=PATH_IMAGES):
+    """The images of the images folder, plus synthetic images, as {name: uint8 array}."""
+    images = {}
+    for file_name in sorted(os.listdir(folder)):
+        images[file_name] = iio.imread(os.path.join(folder, file_name), pilmode='L')
+    rng = np.random.default_rng(23)
+    for size in SYNTHETIC_SIZES:
+        images[f"synthetic_{size}x{size}"] = rng.integers(0, 256, size=(size, size), dtype=np.uint8)
+    return images
+
+
+def benchmark_compression(warmup=WARMUP, repeats=REPEATS, folder=PATH_IMAGES):
+    """
+    Throughput of compression() (read, transform and write) on every image and block size,
+    and peak memory of the block engine.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as work_folder:
+        for image_name, image in benchmark_images(folder).items():
+            # Every image is written again as BMP, so that compression() reads it from disk as usual
+            image_path = os.path.join(work_folder, os.path.splitext(image_name)[0] + ".bmp")
+            iio.imwrite(image_path, image)
+            output_path = os.path.join(work_folder, "output.bmp")
+
+            for block_size in BLOCK_SIZES:
+                if min(image.shape) < block_size:
+                    continue
+                frequences_cut = block_size - 1
+                params = {"image": image_name, "block_size": block_size, "frequences_cut": frequences_cut}
+                megapixels = image.size / 1e6
+
+                timing = measure(compression, image_path, block_size, frequences_cut,
+                                 output_path=output_path, warmup=warmup, repeats=repeats)
+                timing["megapixels_per_second"] = megapixels / timing["median"]
+                results.append({"suite": "compression", "name": "compression", "params": params, **timing})
+
+                rows = (image.shape[0] // block_size) * block_size
+                columns = (image.shape[1] // block_size) * block_size
+                blocks = split_blocks(image[:rows, :columns], block_size)
+                results.append({
+                    "suite": "memory",
+                    "name": "compress_blocks",
+                    "params": params,
+                    "peak_bytes": peak_memory(compress_blocks, blocks, frequences_cut),
+                    "image_bytes": int(image.nbytes),
+                })
+    return results
+
+
+SUITES = {
+    "dct": benchmark_dct,
+    "compression": benchmark_compression,
+}
+
+
+def run_benchmarks(suites=tuple(SUITES), warmup=WARMUP, repeats=REPEATS, output_path=RESULTS_PATH):
+    """
+    Run the given suites and save the results in JSON format.
+
+    Returns:
+        dict: The saved results, with the environment they were measured in.
+    """
+    results = []
+    for suite in suites:
+        results.extend(SUITES[suite](warmup=warmup, repeats=repeats))
+
+    report = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "scipy": scipy.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "warmup": warmup,
+        "repeats": repeats,
+        # Process high-water mark: kilobytes on Linux, bytes on macOS
+        "max_rss": _max_rss(),
+        "results": results,
+    }
+
+    if output_path is not None:
+        with open(output_path, "w") as results_file:
+            json.dump(report, results_file, indent=2)
+    return report
+
+
+def result_key(result):
+    return result["suite"], result["name"], json.dumps(result["params"], sort_keys=True)
+
+
+def compare_results(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """
+    Compare two benchmark reports, matching the results by suite, name and parameters.
+
+    A timing is a regression when its median grew by more than threshold and by more than the
+    baseline interquartile range, so that noisy benchmarks are not flagged. A peak memory is a
+    regression when it grew by more than threshold.
+
+    Returns:
+        list: One dict per matched result, with its baseline and current value, ratio and regression flag.
+    """
+    baseline_results = {result_key(result): result for result in baseline["results"]}
+    comparison = []
+
+    for result in current["results"]:
+        previous = baseline_results.get(result_key(result))
+        if previous is None:
+            continue
+
+        if "median" in result:
+            old_value, new_value = previous["median"], result["median"]
+            regression = new_value > old_value * (1 + threshold) and new_value - old_value > previous["iqr"]
+        else:
+            old_value, new_value = previous["peak_bytes"], result["peak_bytes"]
+            regression = new_value > old_value * (1 + threshold)
+
+        comparison.append({
+            "suite": result["suite"],
+            "name": result["name"],
+            "params": result["params"],
+            "baseline": old_value,
+            "current": new_value,
+            "ratio": new_value / old_value if old_value else float("inf"),
+            "regression": bool(regression),
+        })
+    return comparison
+
+
+def _max_rss():
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="DCT and compression benchmark suite.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmarks")
+    run_parser.add_argument("--suites", nargs="+", choices=list(SUITES), default=list(SUITES))
+    run_parser.add_argument("--warmup", type=int, default=WARMUP)
+    run_parser.add_argument("--repeats", type=int, default=REPEATS)
+    run_parser.add_argument("-o", "--output", default=RESULTS_PATH)
+
+    compare_parser = commands.add_parser("compare", help="Compare two result files and flag regressions")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        report = run_benchmarks(args.suites, args.warmup, args.repeats, args.output)
+        for result in report["results"]:
+            value = f"{result['median'] * 1e3:10.3f} ms  IQR {result['iqr'] * 1e3:8.3f} ms" if "median" in result \
+                else f"{result['peak_bytes'] / 1e6:10.2f} MB peak"
+            print(f"{result['suite']:<12}{result['name']:<16}{value}  {result['params']}")
+        print(f"Results saved in {args.output}")
+        return 0
+
+    with open(args.baseline) as baseline_file, open(args.current) as current_file:
+        comparison = compare_results(json.load(baseline_file), json.load(current_file), args.threshold)
+
+    for row in comparison:
+        flag = "REGRESSION" if row["regression"] else "ok"
+        print(f"{flag:<12}{row['suite']:<12}{row['name']:<16}{row['ratio']:7.2f}x  {row['params']}")
+
+    regressions = sum(row["regression"] for row in comparison)
+    print(f"{regressions} regressions out of {len(comparison)} results")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
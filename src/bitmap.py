@@ -0,0 +1,192 @@
+import os
+import struct
+from collections import namedtuple
+import numpy as np
+
+# BITMAPFILEHEADER: magic, file size, two reserved fields, offset of the pixels
+FILE_HEADER = struct.Struct("<2sIHHI")
+# BITMAPINFOHEADER: header size, width, height (negative for top-down rows), planes, bits per pixel, compression,
+# size of the pixels, horizontal and vertical resolution, colors of the palette, important colors
+INFO_HEADER = struct.Struct("<IiiHHIIiiII")
+MAGIC = b"BM"
+
+# Only uncompressed (BI_RGB) files with a palette of gray levels or 24-bit pixels are mapped
+BI_RGB = 0
+SUPPORTED_BITS = (8, 24)
+
+# Resolution written in the new files, 2835 pixels per meter (72 DPI)
+PIXELS_PER_METER = 2835
+
+# Gray levels palette of the 8-bit files, in BGRA order
+GRAY_PALETTE = np.repeat(np.arange(256, dtype=np.uint8), 4).reshape(256, 4) * np.array([1, 1, 1, 0], dtype=np.uint8)
+
+BMPHeader = namedtuple(
+    "BMPHeader", ["width", "height", "bits_per_pixel", "top_down", "data_offset", "row_bytes", "palette"]
+)
+
+
+def row_bytes(width, bits_per_pixel):
+    """Size of a row of pixels in the file: every row is padded to a multiple of 4 bytes."""
+    return (width * bits_per_pixel + 31) // 32 * 4
+
+
+def luma(rgb):
+    """
+    Gray levels of (..., 3) uint8 RGB pixels, with the integer ITU-R 601 weights of PIL, so that the result
+    is identical to imageio.imread(..., pilmode='L').
+    """
+    rgb = rgb.astype(np.uint32)
+    gray = rgb[..., 0] * 19595
+    gray += rgb[..., 1] * 38470
+    gray += rgb[..., 2] * 7471
+    gray += 0x8000
+    gray >>= 16
+    return gray.astype(np.uint8)
+
+
+def read_header(path):
+    """
+    Parse the headers and the palette of a BMP file.
+
+    Raises:
+        ValueError: If the file is not a BMP file, or a variant that is not supported (compressed, 1, 4, 16 or 32 bits).
+    """
+    with open(path, "rb") as bmp_file:
+        data = bmp_file.read(FILE_HEADER.size + INFO_HEADER.size)
+        if len(data) < FILE_HEADER.size + INFO_HEADER.size:
+            raise ValueError("Not a BMP file")
+        magic, _, _, _, data_offset = FILE_HEADER.unpack_from(data)
+        (info_size, width, height, _, bits_per_pixel, compression, _, _, _, colors_used,
+         _) = INFO_HEADER.unpack_from(data, FILE_HEADER.size)
+        if magic != MAGIC or info_size < INFO_HEADER.size:
+            raise ValueError("Not a BMP file, or an unsupported header version")
+        if compression != BI_RGB or bits_per_pixel not in SUPPORTED_BITS:
+            raise ValueError(f"Unsupported BMP file: {bits_per_pixel} bits per pixel, compression {compression}")
+
+        palette = None
+        if bits_per_pixel == 8:
+            n_colors = colors_used or 256
+            bmp_file.seek(FILE_HEADER.size + info_size)
+            palette = np.frombuffer(bmp_file.read(4 * n_colors), dtype=np.uint8).reshape(-1, 4)
+
+    return BMPHeader(width, abs(height), bits_per_pixel, height < 0, data_offset, row_bytes(width, bits_per_pixel), palette)
+
+
+class BMPFile:
+    """
+    Memory-mapped pixels of an uncompressed 8-bit or 24-bit BMP file.
+
+    The pixels array is a view of the mapped file in top to bottom row order, whatever the order of the
+    rows in the file, and without the padding at the end of every row: (height, width) palette indexes
+    for 8-bit files, (height, width, 3) RGB pixels for 24-bit files. Reading a strip of rows reads only
+    its pages from the disk, and with mode "r+" writing into the view writes the file in place.
+
+    Args:
+        path (str): Path of the file.
+        mode (str): "r" (read-only) or "r+" (read and write).
+    """
+
+    def __init__(self, path, mode="r"):
+        self.path = path
+        self.header = read_header(path)
+        header = self.header
+
+        self._data = np.memmap(path, dtype=np.uint8, mode=mode, offset=header.data_offset,
+                               shape=(header.height, header.row_bytes))
+        rows = self._data if header.top_down else self._data[::-1]
+        if header.bits_per_pixel == 8:
+            self.pixels = rows[:, :header.width]
+        else:
+            # Pixels are stored in BGR order
+            self.pixels = rows[:, :header.width * 3].reshape(header.height, header.width, 3)[..., ::-1]
+
+        # Palettes of gray levels map every index to itself, the other ones through a lookup table
+        self._lookup = None
+        if header.palette is not None:
+            lookup = np.zeros(256, dtype=np.uint8)
+            lookup[:len(header.palette)] = luma(header.palette[:, 2::-1])[:256]
+            if not np.array_equal(lookup, np.arange(256)):
+                self._lookup = lookup
+
+    @property
+    def shape(self):
+        return self.header.height, self.header.width
+
+    @property
+    def is_gray(self):
+        """Whether the pixels are gray levels already, so that gray() is a view of the file."""
+        return self.header.bits_per_pixel == 8 and self._lookup is None
+
+    def gray(self):
+        """(height, width) uint8 gray levels, a view of the file when is_gray, converted in memory otherwise."""
+        return self.read_rows(0, self.header.height)
+
+    def read_rows(self, start, stop):
+        """Gray levels of the rows from start to stop (top to bottom), see luma."""
+        rows = self.pixels[start:stop]
+        if self.header.bits_per_pixel == 24:
+            return luma(rows)
+        if self._lookup is not None:
+            return self._lookup[rows]
+        return rows
+
+    def write_rows(self, start, rows):
+        """Write a (n_rows, width) strip of gray levels from row start, in a gray 8-bit file opened with mode "r+"."""
+        if not self.is_gray:
+            raise ValueError("Only 8-bit gray-scale files can be written")
+        self.pixels[start:start + len(rows)] = rows
+
+    def flush(self):
+        self._data.flush()
+
+    def close(self):
+        """Flush the changes and release the memory map, the pixels views must not be used anymore."""
+        if self._data is not None:
+            self.flush()
+        self.pixels = None
+        self._data = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def create_bmp(path, height, width):
+    """
+    Create an 8-bit gray-scale BMP file of the given size, with bottom-up rows as most readers expect,
+    and return it opened with mode "r+" so that its pixels can be written in place.
+    """
+    if height <= 0 or width <= 0:
+        raise ValueError("The size of a BMP file must be positive")
+    data_offset = FILE_HEADER.size + INFO_HEADER.size + GRAY_PALETTE.nbytes
+    image_size = row_bytes(width, 8) * height
+
+    with open(path, "wb") as bmp_file:
+        bmp_file.write(FILE_HEADER.pack(MAGIC, data_offset + image_size, 0, 0, data_offset))
+        bmp_file.write(INFO_HEADER.pack(
+            INFO_HEADER.size, width, height, 1, 8, BI_RGB, image_size, PIXELS_PER_METER, PIXELS_PER_METER, 256, 0
+        ))
+        bmp_file.write(GRAY_PALETTE.tobytes())
+        bmp_file.truncate(data_offset + image_size)
+
+    return BMPFile(path, mode="r+")
+
+
+def read_bmp(path):
+    """Gray levels of a BMP file, mapped without copies when it is an 8-bit gray-scale file, see BMPFile.gray."""
+    return BMPFile(path).gray()
+
+
+def write_bmp(path, image):
+    """Write a (height, width) uint8 image as an 8-bit gray-scale BMP file and return its path."""
+    if image.ndim != 2:
+        raise ValueError(f"Expected a gray-scale image, got an array of shape {image.shape}")
+    with create_bmp(path, *image.shape) as bmp_file:
+        bmp_file.write_rows(0, image)
+    return path
+
+
+def is_bmp(path):
+    return os.path.splitext(path)[1].lower() == ".bmp"
@@ -0,0 +1,276 @@
+import heapq
+import os
+import struct
+from functools import lru_cache
+import numpy as np
+
+import compression_manager
+from compression_manager import BLOCK_AXES, check_frequences_cut, count_blocks, split_blocks, merge_blocks
+from dct import scipy_dct2_fft, scipy_idct2_fft
+from lazy_import import lazy_module
+
+iio = lazy_module("imageio.v3")
+
+# Container layout (little endian):
+#   header: magic, version, F, d, rows, columns, quantization step, number of non zero coefficients
+#   runs stream, values stream: each one made of its Huffman table, its sync points and its payload
+MAGIC = b"DCTC"
+VERSION = 2
+HEADER = struct.Struct("<4sBHHIIfI")
+TABLE_HEADER = struct.Struct("<IQI")
+EXTENSION = ".dctc"
+
+DEFAULT_QUANTIZATION_STEP = 1.0
+
+# Huffman codes are limited to 16 bits, so that every code can be decoded with a single table lookup
+MAX_CODE_LENGTH = 16
+
+# Number of symbols between two sync points, the bit offsets where the decoder can start: every segment
+# between two sync points is decoded at the same time, one symbol of all of them per numpy step.
+# The sync points are stored as the differences between consecutive offsets, on 2 bytes since a segment
+# holds at most SYNC_INTERVAL * MAX_CODE_LENGTH bits, about 0.2% of the payload at 4 bits per symbol
+SYNC_INTERVAL = 2048
+
+
+@lru_cache(maxsize=64)
+def zigzag_indices(block_size, frequences_cut):
+    """
+    Zigzag scan of the coefficients kept by the frequences cut (the k + l < d triangle).
+
+    Args:
+        block_size (int): Size of the square blocks (F).
+        frequences_cut (int): Frequency threshold (d).
+
+    Returns:
+        tuple: (rows, columns) read-only index arrays, in zigzag order.
+    """
+    positions = [
+        (k, l)
+        for k in range(block_size)
+        for l in range(block_size)
+        if k + l < frequences_cut
+    ]
+    # Anti-diagonals are visited in increasing order, alternating their direction as in JPEG
+    positions.sort(key=lambda position: (sum(position), position[1] if sum(position) % 2 == 0 else position[0]))
+
+    rows = np.array([k for k, _ in positions], dtype=np.intp)
+    columns = np.array([l for _, l in positions], dtype=np.intp)
+    rows.setflags(write=False)
+    columns.setflags(write=False)
+    return rows, columns
+
+
+def encode(image, block_size, frequences_cut, quantization_step=DEFAULT_QUANTIZATION_STEP):
+    """
+    Encode a gray-scale image into the compressed container.
+
+    Args:
+        image (np.ndarray): 2D uint8 image, the elements that are not part of a block are cut.
+        block_size (int): Size of the square blocks (F).
+        frequences_cut (int): Frequency threshold (d).
+        quantization_step (float): Step of the uniform quantizer of the kept coefficients.
+
+    Returns:
+        bytes: The encoded image.
+    """
+    check_frequences_cut(block_size, frequences_cut)
+    if quantization_step <= 0:
+        raise ValueError("The quantization step must be positive")
+
+    rows, columns = image.shape
+    blocks_per_row, blocks_per_column = count_blocks(rows, columns, block_size)
+    image = image[:blocks_per_row * block_size, :blocks_per_column * block_size]
+
+    # Forward DCT of every block, keeping only the zigzag scan of the k + l < d triangle
+    coef_blocks = scipy_dct2_fft(split_blocks(image, block_size), axes=BLOCK_AXES)
+    zigzag_rows, zigzag_columns = zigzag_indices(block_size, frequences_cut)
+    coefficients = coef_blocks[:, zigzag_rows, zigzag_columns]
+
+    # Uniform quantization, with the DC coefficients coded as differences between consecutive blocks
+    quantized = np.rint(coefficients / quantization_step).astype(np.int32)
+    if quantized.shape[1] > 0:
+        quantized[1:, 0] = np.diff(quantized[:, 0])
+
+    # Run-length coding: every non zero value is preceded by the number of zeros before it,
+    # the trailing zeros are implicit since the total number of coefficients is known
+    flat = quantized.ravel()
+    positions = np.flatnonzero(flat)
+    runs = np.diff(positions, prepend=-1) - 1
+    values = flat[positions]
+
+    header = HEADER.pack(
+        MAGIC, VERSION, block_size, frequences_cut,
+        blocks_per_row * block_size, blocks_per_column * block_size,
+        quantization_step, len(positions)
+    )
+    return header + _huffman_encode(runs) + _huffman_encode(values)
+
+
+def decode(data):
+    """
+    Decode an image encoded by encode.
+
+    Args:
+        data (bytes): The encoded image.
+
+    Returns:
+        np.ndarray: 2D uint8 image.
+    """
+    data = memoryview(data)
+    magic, version, block_size, frequences_cut, rows, columns, quantization_step, n_values = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a compressed image, or unsupported container version")
+
+    offset = HEADER.size
+    runs, offset = _huffman_decode(data, offset, n_values)
+    values, offset = _huffman_decode(data, offset, n_values)
+
+    blocks_per_row, blocks_per_column = rows // block_size, columns // block_size
+    zigzag_rows, zigzag_columns = zigzag_indices(block_size, frequences_cut)
+
+    # Undo the run-length coding and the DC differences
+    quantized = np.zeros((blocks_per_row * blocks_per_column, len(zigzag_rows)), dtype=np.int32)
+    quantized.ravel()[np.cumsum(runs + 1) - 1] = values
+    if quantized.shape[1] > 0:
+        np.cumsum(quantized[:, 0], out=quantized[:, 0])
+
+    coef_blocks = np.zeros((len(quantized), block_size, block_size))
+    coef_blocks[:, zigzag_rows, zigzag_columns] = quantized * np.float64(quantization_step)
+
+    rebuilt_blocks = scipy_idct2_fft(coef_blocks, axes=BLOCK_AXES, overwrite_x=True)
+    np.around(rebuilt_blocks, 0, out=rebuilt_blocks)
+    np.clip(rebuilt_blocks, 0, 255, out=rebuilt_blocks)
+    return merge_blocks(rebuilt_blocks, blocks_per_row, blocks_per_column)
+
+
+def encode_file(image_path, block_size, frequences_cut, quantization_step=DEFAULT_QUANTIZATION_STEP, output_path=None):
+    """Encode a gray-scale image file, by default into compressed_[original_name].dctc inside the output folder."""
+    image = iio.imread(image_path, pilmode='L')
+    data = encode(image, block_size, frequences_cut, quantization_step)
+
+    if output_path is None:
+        os.makedirs(compression_manager.OUTPUT_FOLDER, exist_ok=True)
+        file_name = os.path.splitext(os.path.basename(image_path))[0]
+        output_path = os.path.join(compression_manager.OUTPUT_FOLDER, f"compressed_{file_name}{EXTENSION}")
+
+    with open(output_path, "wb") as output_file:
+        output_file.write(data)
+    return output_path
+
+
+def decode_file(path):
+    with open(path, "rb") as encoded_file:
+        return decode(encoded_file.read())
+
+
+def huffman_code_lengths(counts, max_length=MAX_CODE_LENGTH):
+    """
+    Compute the Huffman code length of every symbol, limited to max_length bits.
+
+    Args:
+        counts (np.ndarray): Occurrences of every symbol (all positive).
+        max_length (int): Maximum code length.
+
+    Returns:
+        np.ndarray: Code length of every symbol.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    if len(counts) == 1:
+        return np.ones(1, dtype=np.int64)
+
+    while True:
+        lengths = np.zeros(len(counts), dtype=np.int64)
+        heap = [(int(count), [symbol]) for symbol, count in enumerate(counts)]
+        heapq.heapify(heap)
+        while len(heap) > 1:
+            first_count, first_symbols = heapq.heappop(heap)
+            second_count, second_symbols = heapq.heappop(heap)
+            merged_symbols = first_symbols + second_symbols
+            lengths[merged_symbols] += 1
+            heapq.heappush(heap, (first_count + second_count, merged_symbols))
+
+        if lengths.max() <= max_length:
+            return lengths
+
+        # Flatten the distribution until the longest code fits
+        counts = (counts + 1) // 2
+
+
+def canonical_codes(lengths):
+    """Canonical Huffman codes for the given lengths, the symbols are ordered by (length, index)."""
+    order = np.lexsort((np.arange(len(lengths)), lengths))
+    codes = np.zeros(len(lengths), dtype=np.int64)
+    code = 0
+    previous_length = lengths[order[0]] if len(order) else 0
+    for symbol in order:
+        code <<= int(lengths[symbol] - previous_length)
+        codes[symbol] = code
+        previous_length = lengths[symbol]
+        code += 1
+    return codes
+
+
+def _huffman_encode(symbols):
+    alphabet, inverse, counts = np.unique(symbols, return_inverse=True, return_counts=True)
+    lengths = huffman_code_lengths(counts) if len(alphabet) else np.zeros(0, dtype=np.int64)
+    codes = canonical_codes(lengths)
+
+    # Every symbol is expanded into its bits at once: the j-th bit of a code of length n is (code >> (n - 1 - j)) & 1
+    symbol_lengths = lengths[inverse]
+    n_bits = int(symbol_lengths.sum())
+    bit_offsets = np.arange(n_bits) - np.repeat(np.cumsum(symbol_lengths) - symbol_lengths, symbol_lengths)
+    bits = (np.repeat(codes[inverse], symbol_lengths) >> (np.repeat(symbol_lengths, symbol_lengths) - 1 - bit_offsets)) & 1
+    payload = np.packbits(bits.astype(np.uint8))
+
+    # Bit offset of the first symbol of every segment, stored as the bit length of the previous segment
+    sync_points = np.diff((np.cumsum(symbol_lengths) - symbol_lengths)[::SYNC_INTERVAL], prepend=0)
+
+    return (
+        TABLE_HEADER.pack(len(alphabet), n_bits, SYNC_INTERVAL)
+        + alphabet.astype("<i4").tobytes()
+        + lengths.astype(np.uint8).tobytes()
+        + sync_points.astype("<u2").tobytes()
+        + payload.tobytes()
+    )
+
+
+def _huffman_decode(data, offset, n_symbols):
+    alphabet_size, n_bits, sync_interval = TABLE_HEADER.unpack_from(data, offset)
+    offset += TABLE_HEADER.size
+    alphabet = np.frombuffer(data, dtype="<i4", count=alphabet_size, offset=offset).astype(np.int32)
+    offset += 4 * alphabet_size
+    lengths = np.frombuffer(data, dtype=np.uint8, count=alphabet_size, offset=offset).astype(np.int64)
+    offset += alphabet_size
+    n_segments = -(-n_symbols // sync_interval)
+    positions = np.cumsum(np.frombuffer(data, dtype="<u2", count=n_segments, offset=offset), dtype=np.int64)
+    offset += 2 * n_segments
+    n_bytes = (n_bits + 7) // 8
+    payload = np.frombuffer(data, dtype=np.uint8, count=n_bytes, offset=offset)
+    offset += n_bytes
+
+    if n_symbols == 0:
+        return np.zeros(0, dtype=np.int32), offset
+
+    # Lookup table indexed by the next MAX_CODE_LENGTH bits: every code fills the entries starting with it
+    codes = canonical_codes(lengths)
+    table_symbols = np.zeros(1 << MAX_CODE_LENGTH, dtype=np.int64)
+    table_lengths = np.zeros(1 << MAX_CODE_LENGTH, dtype=np.int64)
+    for symbol in range(alphabet_size):
+        first = int(codes[symbol]) << (MAX_CODE_LENGTH - int(lengths[symbol]))
+        last = first + (1 << (MAX_CODE_LENGTH - int(lengths[symbol])))
+        table_symbols[first:last] = symbol
+        table_lengths[first:last] = lengths[symbol]
+
+    # Every segment advances by one symbol per step, reading the MAX_CODE_LENGTH bits window at its position
+    # from three consecutive bytes. The segments past their last symbol stop at the end of the payload
+    padded = np.concatenate([payload, np.zeros(3, dtype=np.uint8)]).astype(np.int64)
+    symbols = np.empty((sync_interval, n_segments), dtype=np.int64)
+    for step in range(min(sync_interval, n_symbols)):
+        byte_positions = positions >> 3
+        three_bytes = (padded[byte_positions] << 16) | (padded[byte_positions + 1] << 8) | padded[byte_positions + 2]
+        windows = (three_bytes >> (8 - (positions & 7))) & ((1 << MAX_CODE_LENGTH) - 1)
+        symbols[step] = table_symbols[windows]
+        positions += table_lengths[windows]
+        np.minimum(positions, n_bits, out=positions)
+
+    return alphabet[symbols.T.ravel()[:n_symbols]], offset
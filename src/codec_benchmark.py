@@ -0,0 +1,46 @@
+import os
+import tempfile
+import timeit
+import imageio.v3 as iio
+
+from codec import encode, decode
+from compression_manager import compression
+
+PATH_IMAGES = "images"
+
+# (F, d) pairs used for every image
+PARAMETERS = [(8, 6), (8, 10), (16, 10)]
+REPEATS = 3
+
+
+def best_time(function, *args, **kwargs):
+    return min(timeit.repeat(lambda: function(*args, **kwargs), number=1, repeat=REPEATS))
+
+
+if __name__ == "__main__":
+
+    print(f"{'image':<16}{'F':>4}{'d':>4}{'BMP B/px':>10}{'DCTC B/px':>11}{'ratio':>8}"
+          f"{'BMP MB/s':>10}{'enc MB/s':>10}{'dec MB/s':>10}")
+
+    with tempfile.TemporaryDirectory() as output_folder:
+        for image_name in sorted(os.listdir(PATH_IMAGES)):
+            image_path = os.path.join(PATH_IMAGES, image_name)
+            image = iio.imread(image_path, pilmode='L')
+
+            for block_size, frequences_cut in PARAMETERS:
+                if image.shape[0] < block_size or image.shape[1] < block_size:
+                    continue
+                pixels = (image.shape[0] // block_size) * (image.shape[1] // block_size) * block_size ** 2
+
+                # Current output: a full 8-bit BMP, written by compression()
+                bmp_path = os.path.join(output_folder, f"{image_name}_{block_size}_{frequences_cut}.bmp")
+                bmp_time = best_time(compression, image_path, block_size, frequences_cut, output_path=bmp_path)
+                bmp_bytes = os.path.getsize(bmp_path)
+
+                data = encode(image, block_size, frequences_cut)
+                encode_time = best_time(encode, image, block_size, frequences_cut)
+                decode_time = best_time(decode, data)
+
+                print(f"{image_name:<16}{block_size:>4}{frequences_cut:>4}"
+                      f"{bmp_bytes / pixels:>10.3f}{len(data) / pixels:>11.3f}{bmp_bytes / len(data):>7.1f}x"
+                      f"{pixels / 1e6 / bmp_time:>10.1f}{pixels / 1e6 / encode_time:>10.1f}{pixels / 1e6 / decode_time:>10.1f}")
@@ -0,0 +1,168 @@
+import os
+import threading
+from collections import OrderedDict, namedtuple
+import numpy as np
+
+from compression_manager import (
+    check_frequences_cut, count_blocks, file_hash, block_view, merge_blocks, forward_blocks, reconstruct_blocks,
+    for_each_block_rows, compute_dtype, read_image, resolve_backend, DEFAULT_BACKEND
+)
+
+# Default memory (in bytes) available to the cached coefficients and reconstructions
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+CacheInfo = namedtuple(
+    "CacheInfo",
+    ["coefficient_hits", "coefficient_misses", "reconstruction_hits", "reconstruction_misses", "entries", "bytes", "max_bytes"]
+)
+
+
+class CoefficientCache:
+    """
+    Memory-bounded LRU cache of the forward DCT coefficients of the images, keyed by (file hash, F),
+    and of their reconstructions, keyed by (file hash, F, d).
+
+    Once the coefficients of an image are cached, a new value of d costs only the frequences cut and the IDCT,
+    and a value of d that was already used costs nothing.
+
+    Args:
+        max_bytes (int): Maximum memory used by the cached arrays, the least recently used ones are evicted first.
+        backend (str): Name of the DCT backend used for the transforms, or "auto".
+        precision (str): "float32" or "float64", see compute_dtype. The coefficients are kept in this type.
+
+    Notes:
+        - The cached arrays are read-only, since they are shared between all the callers.
+        - The file hash is recomputed only when the size or the modification time of the file change.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, backend=DEFAULT_BACKEND, precision=None):
+        self.max_bytes = max_bytes
+        self.backend = backend
+        self.precision = precision
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._hashes = {}
+        self._lock = threading.RLock()
+        self._stats = {"coefficient_hits": 0, "coefficient_misses": 0, "reconstruction_hits": 0, "reconstruction_misses": 0}
+
+    def coefficients(self, image_path, block_size, progress=None, cancel_event=None):
+        """
+        Return the forward DCT coefficients of an image.
+
+        Returns:
+            tuple: (n_blocks, block_size, block_size) coefficients tensor, blocks_per_row, blocks_per_column.
+        """
+        key = ("coefficients", self._file_hash(image_path), block_size, self.precision)
+        with self._lock:
+            entry = self._get(key, "coefficient")
+        if entry is not None:
+            return entry
+
+        # Open the image in a grayscale format, leaving out the remaining elements that are not part of a block
+        image = read_image(image_path)
+        blocks_per_row, blocks_per_column = count_blocks(*image.shape, block_size)
+        blocks = block_view(image, block_size)
+
+        # The blocks are copied once in the compute type, then transformed in place
+        coef_blocks = blocks.astype(compute_dtype(blocks.dtype, self.precision)).reshape(-1, block_size, block_size)
+        # Every chunk uses the backend of the whole image, see resolve_backend
+        backend = resolve_backend(self.backend, block_size, len(coef_blocks), coef_blocks.dtype)
+        if progress is None and cancel_event is None:
+            coef_blocks = forward_blocks(coef_blocks, backend, overwrite=True)
+        else:
+            def forward_chunk(start, end):
+                coef_blocks[start:end] = forward_blocks(coef_blocks[start:end], backend, overwrite=True)
+
+            for_each_block_rows(forward_chunk, blocks_per_row, blocks_per_column, progress, cancel_event)
+
+        coef_blocks.setflags(write=False)
+        entry = (coef_blocks, blocks_per_row, blocks_per_column)
+        with self._lock:
+            self._put(key, entry, coef_blocks.nbytes)
+        return entry
+
+    def reconstruction(self, image_path, block_size, frequences_cut, progress=None, cancel_event=None, coefficients=None):
+        """
+        Return the compressed (uint8) image for the given F and d.
+
+        Args:
+            progress (callable): Called with (done_rows, total_rows) while the block rows are transformed.
+                When the coefficients are not cached yet, the forward DCT is reported before the reconstruction.
+            cancel_event (threading.Event): When it is set, the work stops before the next chunk of block rows.
+            coefficients (tuple): Result of coefficients() for this image and F, used instead of the cached one,
+                which may have been evicted (or never stored, when it is larger than max_bytes).
+        """
+        check_frequences_cut(block_size, frequences_cut)
+
+        key = ("reconstruction", self._file_hash(image_path), block_size, frequences_cut, self.precision)
+        with self._lock:
+            final_image = self._get(key, "reconstruction")
+        if final_image is not None:
+            if progress is not None:
+                progress(1, 1)
+            return final_image
+
+        if coefficients is None:
+            coefficients = self.coefficients(image_path, block_size, progress, cancel_event)
+        coef_blocks, blocks_per_row, blocks_per_column = coefficients
+
+        backend = resolve_backend(self.backend, block_size, len(coef_blocks), coef_blocks.dtype)
+        if progress is None and cancel_event is None:
+            rebuilt_blocks = reconstruct_blocks(coef_blocks, frequences_cut, backend=backend)
+        else:
+            rebuilt_blocks = np.empty(coef_blocks.shape, dtype=np.uint8)
+
+            def reconstruct_chunk(start, end):
+                rebuilt_blocks[start:end] = reconstruct_blocks(coef_blocks[start:end], frequences_cut, backend=backend)
+
+            for_each_block_rows(reconstruct_chunk, blocks_per_row, blocks_per_column, progress, cancel_event)
+
+        final_image = merge_blocks(rebuilt_blocks, blocks_per_row, blocks_per_column)
+        final_image.setflags(write=False)
+        with self._lock:
+            self._put(key, final_image, final_image.nbytes)
+        return final_image
+
+    def cache_info(self):
+        with self._lock:
+            return CacheInfo(entries=len(self._entries), bytes=self._bytes, max_bytes=self.max_bytes, **self._stats)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._hashes.clear()
+            self._bytes = 0
+
+    def _file_hash(self, image_path):
+        stat = os.stat(image_path)
+        signature = (stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            cached = self._hashes.get(image_path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        digest = file_hash(image_path)
+        with self._lock:
+            self._hashes[image_path] = (signature, digest)
+        return digest
+
+    def _get(self, key, kind):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self._stats[f"{kind}_hits"] += 1
+            return self._entries[key][0]
+        self._stats[f"{kind}_misses"] += 1
+        return None
+
+    def _put(self, key, value, size):
+        # Arrays bigger than the whole cache are not stored
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+
+        self._entries[key] = (value, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
@@ -0,0 +1,147 @@
+import os
+import struct
+import numpy as np
+
+import compression_manager
+from codec import zigzag_indices
+from compression_manager import (
+    block_view, check_frequences_cut, count_blocks, compute_dtype, forward_blocks, reconstruct_blocks, merge_blocks,
+    DEFAULT_BACKEND
+)
+from lazy_import import lazy_module
+
+iio = lazy_module("imageio.v3")
+
+# Store layout (little endian):
+#   header: magic, version, F, largest d, rows, columns, coefficient type, quantization step, number of blocks,
+#   offset of the coefficients, then the (coefficients, blocks) array of the k + l < d triangle, in zigzag order,
+#   so that the coefficients of any smaller d are a prefix of the array
+MAGIC = b"DCTS"
+VERSION = 1
+HEADER = struct.Struct("<4sBHHIIBfII")
+EXTENSION = ".dcts"
+
+# The coefficients start on a 64 bytes boundary, so that the memory map is aligned
+ALIGNMENT = 64
+
+# Coefficient types: float16 keeps about 3 significant digits, int16 keeps the multiples of the quantization step
+DTYPES = {"float16": (1, np.float16), "int16": (2, np.int16)}
+DTYPE_CODES = {code: (name, dtype) for name, (code, dtype) in DTYPES.items()}
+
+
+def save_coefficients(path, coef_blocks, blocks_per_row, blocks_per_column, max_frequences_cut, dtype="float16",
+                      quantization_step=1.0):
+    """
+    Save the low frequency coefficients of a (n_blocks, F, F) coefficients tensor.
+
+    Args:
+        path (str): Path of the store.
+        coef_blocks (np.ndarray): Forward DCT coefficients, see compression_manager.forward_blocks.
+        blocks_per_row (int): Number of block rows of the image.
+        blocks_per_column (int): Number of blocks in every block row.
+        max_frequences_cut (int): Largest d that the store can rebuild, only the k + l < d triangle is saved.
+        dtype (str): "float16" or "int16".
+        quantization_step (float): Step of the int16 coefficients, ignored for float16.
+
+    Returns:
+        str: The path of the store.
+    """
+    block_size = coef_blocks.shape[-1]
+    check_frequences_cut(block_size, max_frequences_cut)
+    if dtype not in DTYPES:
+        raise ValueError(f"Unknown coefficient type {dtype!r}, expected one of {list(DTYPES)}")
+    if quantization_step <= 0:
+        raise ValueError("The quantization step must be positive")
+    dtype_code, numpy_dtype = DTYPES[dtype]
+    if dtype == "float16":
+        quantization_step = 1.0
+
+    zigzag_rows, zigzag_columns = zigzag_indices(block_size, max_frequences_cut)
+    coefficients = coef_blocks[:, zigzag_rows, zigzag_columns].T
+    if dtype == "int16":
+        coefficients = np.clip(np.rint(coefficients / quantization_step), -32768, 32767)
+
+    data_offset = -(-HEADER.size // ALIGNMENT) * ALIGNMENT
+    header = HEADER.pack(
+        MAGIC, VERSION, block_size, max_frequences_cut,
+        blocks_per_row * block_size, blocks_per_column * block_size,
+        dtype_code, quantization_step, len(coef_blocks), data_offset
+    )
+    with open(path, "wb") as output_file:
+        output_file.write(header.ljust(data_offset, b"\0"))
+        np.ascontiguousarray(coefficients, dtype=numpy_dtype).tofile(output_file)
+    return path
+
+
+def save_file(image_path, block_size, max_frequences_cut, dtype="float16", quantization_step=1.0, output_path=None,
+              backend=DEFAULT_BACKEND):
+    """
+    Forward transform a gray-scale image once and save its coefficients,
+    by default into [original_name]_F[F].dcts inside the output folder.
+    """
+    check_frequences_cut(block_size, max_frequences_cut)
+    image = iio.imread(image_path, pilmode='L')
+    blocks_per_row, blocks_per_column = count_blocks(*image.shape, block_size)
+
+    coef_blocks = block_view(image, block_size).astype(compute_dtype(image.dtype)).reshape(-1, block_size, block_size)
+    coef_blocks = forward_blocks(coef_blocks, backend, overwrite=True)
+
+    if output_path is None:
+        os.makedirs(compression_manager.OUTPUT_FOLDER, exist_ok=True)
+        file_name = os.path.splitext(os.path.basename(image_path))[0]
+        output_path = os.path.join(compression_manager.OUTPUT_FOLDER, f"{file_name}_F{block_size}{EXTENSION}")
+
+    return save_coefficients(output_path, coef_blocks, blocks_per_row, blocks_per_column, max_frequences_cut, dtype,
+                             quantization_step)
+
+
+class CoefficientStore:
+    """
+    Memory-mapped coefficient store, rebuilding the image for any d up to the one it was saved with.
+
+    Only the coefficients of the requested d are read from the file: they are a prefix of the stored array.
+
+    Args:
+        path (str): Path of a store written by save_coefficients.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as input_file:
+            header = input_file.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError("Not a coefficient store, or unsupported store version")
+
+        (magic, version, self.block_size, self.max_frequences_cut, self.rows, self.columns, dtype_code,
+         self.quantization_step, self.n_blocks, data_offset) = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION or dtype_code not in DTYPE_CODES:
+            raise ValueError("Not a coefficient store, or unsupported store version")
+        self.dtype, numpy_dtype = DTYPE_CODES[dtype_code]
+
+        n_coefficients = len(zigzag_indices(self.block_size, self.max_frequences_cut)[0])
+        if n_coefficients * self.n_blocks == 0:
+            self._coefficients = np.zeros((n_coefficients, self.n_blocks), dtype=numpy_dtype)
+        else:
+            self._coefficients = np.memmap(
+                path, dtype=numpy_dtype, mode='r', offset=data_offset, shape=(n_coefficients, self.n_blocks)
+            )
+
+    def coefficients(self, frequences_cut, dtype=np.float32):
+        """
+        Return the (n_blocks, F, F) coefficients tensor of the k + l < d triangle, the other coefficients are zeros.
+        """
+        if not 0 <= frequences_cut <= self.max_frequences_cut:
+            raise ValueError(f"The store keeps the coefficients up to d={self.max_frequences_cut}")
+
+        zigzag_rows, zigzag_columns = zigzag_indices(self.block_size, frequences_cut)
+        coef_blocks = np.zeros((self.n_blocks, self.block_size, self.block_size), dtype=dtype)
+        coefficients = self._coefficients[:len(zigzag_rows)]
+        if self.dtype == "int16":
+            coefficients = coefficients * dtype(self.quantization_step)
+        coef_blocks[:, zigzag_rows, zigzag_columns] = coefficients.T
+        return coef_blocks
+
+    def reconstruction(self, frequences_cut, backend=DEFAULT_BACKEND, precision=None):
+        """Return the compressed (uint8) image for the given d."""
+        coef_blocks = self.coefficients(frequences_cut, compute_dtype(np.dtype(np.uint8), precision).type)
+        rebuilt_blocks = reconstruct_blocks(coef_blocks, frequences_cut, overwrite=True, backend=backend)
+        return merge_blocks(rebuilt_blocks, self.rows // self.block_size, self.columns // self.block_size)
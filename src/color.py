@@ -0,0 +1,90 @@
+import numpy as np
+
+# Full range YCbCr of JPEG/JFIF (ITU-R BT.601 weights)
+RGB_TO_YCBCR = np.array([
+    [0.299, 0.587, 0.114],
+    [-0.168736, -0.331264, 0.5],
+    [0.5, -0.418688, -0.081312],
+], dtype=np.float32)
+YCBCR_TO_RGB = np.array([
+    [1.0, 0.0, 1.402],
+    [1.0, -0.344136, -0.714136],
+    [1.0, 1.772, 0.0],
+], dtype=np.float32)
+CHROMA_OFFSET = np.array([0.0, 128.0, 128.0], dtype=np.float32)
+
+# Chroma subsampling schemes, as (rows, columns) factors of the Cb and Cr planes
+SUBSAMPLING = {
+    "4:4:4": (1, 1),
+    "4:2:2": (1, 2),
+    "4:2:0": (2, 2),
+}
+
+
+def subsampling_factors(subsampling):
+    if subsampling not in SUBSAMPLING:
+        raise ValueError(f"Unknown chroma subsampling {subsampling!r}, expected one of {list(SUBSAMPLING)}")
+    return SUBSAMPLING[subsampling]
+
+
+def split_alpha(image):
+    """
+    Split a (rows, columns, channels) image into its color channels and its alpha channel.
+
+    Returns:
+        tuple: (rows, columns, 1 or 3) color channels, (rows, columns) alpha channel or None.
+    """
+    if image.ndim == 2:
+        return image[..., np.newaxis], None
+    if image.shape[-1] in (2, 4):
+        return image[..., :-1], image[..., -1]
+    return image, None
+
+
+def rgb_to_ycbcr(image):
+    """Convert a (rows, columns, 3) uint8 RGB image into three uint8 planes (Y, Cb, Cr)."""
+    ycbcr = image.astype(np.float32) @ RGB_TO_YCBCR.T
+    ycbcr += CHROMA_OFFSET
+    np.around(ycbcr, 0, out=ycbcr)
+    np.clip(ycbcr, 0, 255, out=ycbcr)
+    return [ycbcr[..., channel].astype(np.uint8) for channel in range(3)]
+
+
+def ycbcr_to_rgb(luma, blue_chroma, red_chroma):
+    """Convert three (rows, columns) uint8 planes (Y, Cb, Cr) of the same shape into a (rows, columns, 3) uint8 RGB image."""
+    ycbcr = np.stack([luma, blue_chroma, red_chroma], axis=-1).astype(np.float32)
+    ycbcr -= CHROMA_OFFSET
+    rgb = ycbcr @ YCBCR_TO_RGB.T
+    np.around(rgb, 0, out=rgb)
+    np.clip(rgb, 0, 255, out=rgb)
+    return rgb.astype(np.uint8)
+
+
+def subsample(plane, factors):
+    """
+    Average every (rows factor, columns factor) group of pixels of a plane.
+
+    The borders that do not fill a whole group are replicated, so the result has
+    ceil(rows / rows factor) x ceil(columns / columns factor) pixels.
+    """
+    row_factor, column_factor = factors
+    if factors == (1, 1):
+        return plane
+
+    rows, columns = plane.shape
+    padding = ((0, -rows % row_factor), (0, -columns % column_factor))
+    if any(after for _, after in padding):
+        plane = np.pad(plane, padding, mode='edge')
+
+    groups = plane.reshape(plane.shape[0] // row_factor, row_factor, plane.shape[1] // column_factor, column_factor)
+    averaged = groups.mean(axis=(1, 3), dtype=np.float32)
+    np.around(averaged, 0, out=averaged)
+    return averaged.astype(np.uint8)
+
+
+def upsample(plane, factors, shape):
+    """Replicate every pixel of a subsampled plane over its group, cropping the result to shape."""
+    row_factor, column_factor = factors
+    if factors != (1, 1):
+        plane = np.repeat(np.repeat(plane, row_factor, axis=0), column_factor, axis=1)
+    return plane[:shape[0], :shape[1]]
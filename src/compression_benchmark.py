@@ -0,0 +1,73 @@
+import os
+import timeit
+import numpy as np
+import imageio.v3 as iio
+
+import flat_blocks
+from compression_manager import split_blocks, merge_blocks, compress_blocks
+from dct import scipy_dct2_fft, scipy_idct2_fft
+
+PATH_IMAGES = "images"
+
+# (F, d) pairs used for every image
+PARAMETERS = [(8, 4), (8, 10), (16, 8), (32, 16)]
+REPEATS = 5
+
+
+def loop_compression(image, block_size, frequences_cut):
+    """
+    Block by block compression, as it was performed before the batched engine.
+    It is kept only as a reference for the benchmark.
+    """
+    image_new = []
+    for block in split_blocks(image, block_size):
+        coef_matrix = np.array(scipy_dct2_fft(block))
+        coef_matrix_cut = np.zeros(shape=(block_size, block_size))
+        for k in range(block_size):
+            for l in range(block_size):
+                if (k + l) < frequences_cut:
+                    coef_matrix_cut[k, l] = coef_matrix[k, l]
+        ff = np.array(scipy_idct2_fft(coef_matrix_cut))
+        ff = np.around(ff, 0)
+        ff = np.clip(ff, 0, 255)
+        image_new.append(ff)
+    return np.array(image_new)
+
+
+def batched_compression(image, block_size, frequences_cut):
+    # Transformed in float64 like the loop, so that both results are identical
+    return compress_blocks(split_blocks(image, block_size), frequences_cut, precision="float64")
+
+
+def best_time(function, *args):
+    # Best of REPEATS runs, after a warm-up run that fills the caches
+    function(*args)
+    return min(timeit.repeat(lambda: function(*args), number=1, repeat=REPEATS))
+
+
+if __name__ == "__main__":
+
+    print(f"{'image':<16}{'F':>4}{'d':>4}{'blocks':>9}{'loop (s)':>12}{'batched (s)':>14}{'speedup':>10}{'flat':>8}")
+
+    for image_name in sorted(os.listdir(PATH_IMAGES)):
+        image = iio.imread(os.path.join(PATH_IMAGES, image_name), pilmode='L')
+
+        for block_size, frequences_cut in PARAMETERS:
+            blocks_per_row = image.shape[0] // block_size
+            blocks_per_column = image.shape[1] // block_size
+            if blocks_per_row <= 0 or blocks_per_column <= 0:
+                continue
+            cropped = image[:blocks_per_row * block_size, :blocks_per_column * block_size]
+
+            # Both engines must produce the same pixels, the constant blocks skip the transforms of the batched one
+            flat_blocks.stats.reset()
+            expected = merge_blocks(loop_compression(cropped, block_size, frequences_cut), blocks_per_row, blocks_per_column)
+            result = merge_blocks(batched_compression(cropped, block_size, frequences_cut), blocks_per_row, blocks_per_column)
+            assert np.array_equal(expected, result)
+            skipped_fraction = flat_blocks.stats.skipped_fraction
+
+            loop_time = best_time(loop_compression, cropped, block_size, frequences_cut)
+            batched_time = best_time(batched_compression, cropped, block_size, frequences_cut)
+
+            print(f"{image_name:<16}{block_size:>4}{frequences_cut:>4}{blocks_per_row * blocks_per_column:>9}"
+                  f"{loop_time:>12.5f}{batched_time:>14.5f}{loop_time / batched_time:>9.1f}x{skipped_fraction:>8.0%}")
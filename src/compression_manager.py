@@ -1,89 +1,842 @@
+import hashlib
 import warnings
-import imageio.v3 as iio
+from functools import lru_cache
 import numpy as np
 import os
-from custom_exceptions import InvalidBlockSizeError, InvalidFrequenciesNumberError
+from custom_exceptions import InvalidBlockSizeError, InvalidFrequenciesNumberError, CompressionCancelledError
 
-from dct import scipy_dct2_fft, scipy_idct2_fft
+from bitmap import is_bmp, read_bmp, write_bmp
+from color import rgb_to_ycbcr, ycbcr_to_rgb, split_alpha, subsample, subsampling_factors, upsample
+from dct_backends import get_backend
+from flat_blocks import classify_blocks, rebuild_flat_blocks, DEFAULT_FLAT_MODE, FLAT_MODES
+from instrumentation import profiling, stage
+from lazy_import import lazy_module
+from parallel_engine import map_chunks
+from pruned_dct import pruned_reconstruction, use_pruned
+
+# imageio (and PIL) are only imported by the code that decodes or encodes an image, see lazy_import
+iio = lazy_module("imageio.v3")
 
 OUTPUT_FOLDER = "output_images"
 
-def compression(image_path, block_size, frequences_cut):
+# Axes of a (n_blocks, block_size, block_size) tensor on which the 2D transforms are applied
+BLOCK_AXES = (1, 2)
+
+# DCT backend of the block engine: "scipy" is the reference one, "auto" picks the fastest backend
+# for every (F, batch size, dtype), see dct_backends, and the pruned transform for the low values of d, see pruned_dct
+DEFAULT_BACKEND = "scipy"
+
+# Name "auto" resolves to when the pruned transform is picked, see resolve_backend
+PRUNED_BACKEND = "pruned"
+
+# Floating point types of the block engine. By default uint8 pixels are transformed in float32,
+# which is more than enough for 8-bit values and halves the memory traffic
+PRECISIONS = {"float32": np.float32, "float64": np.float64}
+
+# Border handling of the images whose sides are not multiples of F: "crop" cuts the incomplete blocks,
+# the other modes extend the image to whole blocks (replicating the last pixel, mirroring the border,
+# or with zeros) and crop the result back to the original shape
+PADDING_MODES = ("crop", "edge", "reflect", "zero")
+
+# Formats of the encoded images returned by compress_bytes
+OUTPUT_FORMATS = ("bmp", "png")
+
+# Minimum number of blocks transformed at a time when the compression reports its progress
+CHUNK_BLOCKS = 4096
+
+
+@lru_cache(maxsize=64)
+def frequency_mask(block_size, frequences_cut):
+    """
+    Build the boolean mask of the coefficients kept by the frequences cut.
+
+    Args:
+        block_size (int): Size of the square blocks (F).
+        frequences_cut (int): Frequency threshold (d), the coefficient (k, l) is kept when k + l < d.
+
+    Returns:
+        np.ndarray: Read-only (block_size, block_size) boolean mask.
+
+    Notes:
+        - The mask is cached for every (F, d) pair, so it is computed only once.
+    """
+    indexes = np.arange(block_size)
+    mask = (indexes[:, None] + indexes[None, :]) < frequences_cut
+    mask.setflags(write=False)
+    return mask
+
+
+@lru_cache(maxsize=64)
+def cut_mask(block_size, frequences_cut):
+    """Read-only boolean mask of the coefficients removed by the frequences cut, the complement of frequency_mask."""
+    mask = ~frequency_mask(block_size, frequences_cut)
+    mask.setflags(write=False)
+    return mask
+
+
+def compute_dtype(input_dtype, precision=None):
+    """
+    Floating point type used to transform blocks of the given type.
+
+    Args:
+        input_dtype (np.dtype): Type of the pixels.
+        precision (str): "float32" or "float64", by default float32 for uint8 pixels and float64 otherwise.
+    """
+    if precision is None:
+        return np.dtype(np.float32 if input_dtype == np.uint8 else np.float64)
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision {precision!r}, expected one of {list(PRECISIONS)}")
+    return np.dtype(PRECISIONS[precision])
+
+
+class BlockWorkspace:
+    """
+    Reusable work buffer of the block engine: compressing consecutive chunks of blocks with the same
+    workspace allocates the buffer only once, instead of once per chunk.
+
+    Notes:
+        - The arrays returned by compress_blocks are views of the workspace, they are overwritten by the next call.
+        - A workspace must not be shared between threads.
+    """
+
+    def __init__(self):
+        self._buffer = None
+
+    def get(self, shape, dtype):
+        size = int(np.prod(shape))
+        if self._buffer is None or self._buffer.dtype != dtype or self._buffer.size < size:
+            self._buffer = np.empty(size, dtype=dtype)
+        return self._buffer[:size].reshape(shape)
+
+
+def file_hash(path):
+    """SHA-256 of the content of a file, read in chunks of 1 MB."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as image_file:
+        for chunk in iter(lambda: image_file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def check_frequences_cut(block_size, frequences_cut):
     # Check on the frequences_cut value
     if(frequences_cut < 0) or  (frequences_cut > block_size*2 - 2):
         warnings.warn("Error: frequences_cut value is not valid")
         raise InvalidFrequenciesNumberError
 
 
-    # Open the image in a grayscale format
-    image = iio.imread(image_path, pilmode='L')
-
-    rows, columns = image.shape
-
+def count_blocks(rows, columns, block_size):
     # Calculate the number of blocks in the original image
     blocks_per_row = rows // block_size
     blocks_per_column = columns // block_size
-    
+
     if(blocks_per_column <= 0 or blocks_per_row <= 0):
         warnings.warn("Error: image block ")
         raise InvalidBlockSizeError
 
+    return blocks_per_row, blocks_per_column
+
+
+def block_view(image, block_size):
+    """
+    (blocks_per_row, blocks_per_column, block_size, block_size) view of the whole blocks of an image, without copies.
+
+    The view shares the memory of the image, whatever its strides (cropped images and memory maps included):
+    the blocks are read from the image itself, and writing into the view of an output image writes its pixels.
+    The elements that are not part of a whole block are left out.
+    """
+    blocks_per_row, blocks_per_column = image.shape[0] // block_size, image.shape[1] // block_size
+    row_stride, column_stride = image.strides
+    return np.lib.stride_tricks.as_strided(
+        image,
+        shape=(blocks_per_row, blocks_per_column, block_size, block_size),
+        strides=(block_size * row_stride, block_size * column_stride, row_stride, column_stride),
+        writeable=image.flags.writeable,
+    )
+
+
+def split_blocks(image, block_size):
+    """
+    Split a block-aligned image into a contiguous (n_blocks, block_size, block_size) tensor.
+
+    For example, a 160x160 image with a block size of 8 results in a (400 blocks, 8, 8) tensor.
+    The blocks are copied, block_view reads them without copies.
+    """
+    return block_view(image, block_size).reshape(-1, block_size, block_size)
+
+
+def padding_indices(length, padded_length, padding):
+    """
+    Indices of the source pixels of a padded axis.
+
+    Args:
+        length (int): Number of pixels of the axis.
+        padded_length (int): Number of pixels after the padding.
+        padding (str): "edge" repeats the last pixel, "reflect" mirrors the axis (the border pixel included),
+            "zero" is handled by the caller, see padded_segments.
+
+    Returns:
+        np.ndarray: padded_length indices, the identity on the first length ones.
+    """
+    indices = np.arange(padded_length)
+    if padding == "reflect":
+        indices %= 2 * length
+        return np.where(indices < length, indices, 2 * length - 1 - indices)
+    return np.minimum(indices, length - 1)
+
+
+def padded_segments(plane, block_size, padding):
+    """
+    Blocks of a plane extended to whole blocks, without padding a copy of the whole plane.
+
+    The plane is split into up to three segments: the whole blocks, taken from the plane itself, the column of
+    right border blocks and the row of bottom border blocks (corner included), gathered from the padded indices.
+
+    Returns:
+        list: (block view, first row, first column) of every non empty segment.
+    """
+    if padding not in PADDING_MODES[1:]:
+        raise ValueError(f"Unknown padding mode {padding!r}, expected one of {list(PADDING_MODES)}")
+
+    rows, columns = plane.shape
+    whole_rows, whole_columns = rows // block_size, columns // block_size
+    padded_rows, padded_columns = -(-rows // block_size), -(-columns // block_size)
+    row_indices = padding_indices(rows, padded_rows * block_size, padding)
+    column_indices = padding_indices(columns, padded_columns * block_size, padding)
+
+    def gather(first_row, last_row, first_column):
+        region = plane[np.ix_(row_indices[first_row:last_row], column_indices[first_column:])]
+        if padding == "zero":
+            region[max(0, rows - first_row):] = 0
+            region[:, max(0, columns - first_column):] = 0
+        return region
+
+    segments = []
+    if whole_rows and whole_columns:
+        segments.append((block_view(plane, block_size), 0, 0))
+    if whole_rows and padded_columns > whole_columns:
+        border = gather(0, whole_rows * block_size, whole_columns * block_size)
+        segments.append((block_view(border, block_size), 0, whole_columns * block_size))
+    if padded_rows > whole_rows:
+        border = gather(whole_rows * block_size, None, 0)
+        segments.append((block_view(border, block_size), whole_rows * block_size, 0))
+    return segments
+
+
+def merge_blocks(blocks, blocks_per_row, blocks_per_column, out=None):
+    """
+    Rebuild an image from a (n_blocks, block_size, block_size) tensor.
+
+    The blocks are copied straight into the block view of the (height, width) output, casting them to its dtype
+    in the same pass. The output may be any writeable array, such as a slice of a larger image.
+    """
+    block_size = blocks.shape[-1]
+    if out is None:
+        out = np.empty((blocks_per_row * block_size, blocks_per_column * block_size), dtype=np.uint8)
+
+    grid = blocks.reshape(blocks_per_row, blocks_per_column, block_size, block_size)
+    np.copyto(block_view(out, block_size), grid, casting='unsafe')
+    return out
+
+
+def resolve_backend(backend, block_size, n_blocks, dtype, frequences_cut=None):
+    """
+    Name of the backend of a whole call, "auto" being resolved once from the total number of blocks.
+
+    The autotuner picks a backend per batch size, so the chunks of a call (workers, progress chunks,
+    incremental patches) resolving "auto" on their own could use different backends, and the output
+    would not be bit-identical to the serial path anymore.
+
+    Args:
+        frequences_cut (int): Frequency threshold (d) of a compress_blocks call, for which "auto" resolves to
+            PRUNED_BACKEND when the pruned transform is faster, see pruned_dct.use_pruned.
+    """
+    if backend != "auto":
+        return backend
+    if frequences_cut is not None and use_pruned(block_size, frequences_cut, dtype):
+        return PRUNED_BACKEND
+    return get_backend("auto", block_size, max(1, n_blocks), dtype).name
+
+
+def block_backend(blocks, backend=DEFAULT_BACKEND):
+    """Return the DCT backend used for a (..., block_size, block_size) tensor."""
+    dtype = np.float32 if blocks.dtype == np.float32 else np.float64
+    block_size = blocks.shape[-1]
+    return get_backend(backend, block_size, blocks.size // (block_size * block_size), dtype)
+
+
+def forward_blocks(blocks, backend=DEFAULT_BACKEND, overwrite=False):
+    """Perform dct2 on every block of a (n_blocks, block_size, block_size) tensor, in place when overwrite is allowed."""
+    return block_backend(blocks, backend).dct2(blocks, overwrite=overwrite)
+
+
+def reconstruct_blocks(coef_blocks, frequences_cut, overwrite=False, backend=DEFAULT_BACKEND):
+    """
+    Apply the frequences cut and the IDCT to a tensor of DCT coefficients.
+
+    Args:
+        coef_blocks (np.ndarray): (n_blocks, block_size, block_size) tensor of coefficients.
+        frequences_cut (int): Frequency threshold (d).
+        overwrite (bool): Whether coef_blocks may be used as working buffer, otherwise it is left untouched.
+        backend (str): Name of the DCT backend, or "auto".
+
+    Returns:
+        np.ndarray: (n_blocks, block_size, block_size) float tensor of the rebuilt pixels,
+        rounded and clipped inside the (0, 255) scale.
+    """
+    block_size = coef_blocks.shape[-1]
+
+    # Perform the frequences cut with the cached masks
+    with stage("cut"):
+        if overwrite:
+            np.copyto(coef_blocks, 0, where=cut_mask(block_size, frequences_cut))
+        else:
+            coef_blocks = np.where(frequency_mask(block_size, frequences_cut), coef_blocks, coef_blocks.dtype.type(0))
+
+    # Perform idct2 on the filtered coefficients, reusing their buffer when the backend allows it
+    with stage("idct"):
+        rebuilt_blocks = block_backend(coef_blocks, backend).idct2(coef_blocks, overwrite=True)
+
+    # Round the elements of the blocks, clipping the values inside the (0, 255) scale
+    with stage("round"):
+        np.around(rebuilt_blocks, 0, out=rebuilt_blocks)
+        np.clip(rebuilt_blocks, 0, 255, out=rebuilt_blocks)
+    return rebuilt_blocks
+
+
+def compress_blocks(blocks, frequences_cut, backend=DEFAULT_BACKEND, precision=None, workspace=None, out=None,
+                    flat_blocks=DEFAULT_FLAT_MODE):
+    """
+    Apply DCT, frequences cut and IDCT to a whole tensor of blocks at once.
+
+    A pre-pass over the blocks of integer pixels finds the flat ones, which are rebuilt without the full
+    transform (see flat_blocks): only the remaining blocks are gathered and transformed.
+
+    Args:
+        blocks (np.ndarray): (..., block_size, block_size) tensor of pixels, such as a (n_blocks, block_size, block_size)
+            tensor or a block_view of an image.
+        frequences_cut (int): Frequency threshold (d).
+        backend (str): Name of the DCT backend, PRUNED_BACKEND for the pruned transform, or "auto", which also picks
+            the pruned transform when d is low, see resolve_backend.
+        precision (str): "float32" or "float64", see compute_dtype.
+        workspace (BlockWorkspace): Reusable work buffer, by default a new one is allocated.
+        out (np.ndarray): Tensor with the shape of blocks receiving the rebuilt pixels, cast to its dtype,
+            such as the block_view of the output image.
+        flat_blocks (str): "off", "constant" (bit-identical) or "low_energy" (within one gray level), see FLAT_MODES.
+
+    Returns:
+        np.ndarray: The out tensor, or by default the float tensor of the rebuilt pixels,
+        rounded and clipped inside the (0, 255) scale.
+    """
+    dtype = compute_dtype(blocks.dtype, precision)
+    block_size = blocks.shape[-1]
+    backend = resolve_backend(backend, block_size, blocks.size // (block_size * block_size), dtype, frequences_cut)
+
+    if flat_blocks != "off" and frequences_cut > 0 and np.issubdtype(blocks.dtype, np.integer):
+        if flat_blocks not in FLAT_MODES:
+            raise ValueError(f"Unknown flat blocks mode {flat_blocks!r}, expected one of {list(FLAT_MODES)}")
+        with stage("classify"):
+            routes = classify_blocks(blocks, frequences_cut, flat_blocks)
+        if routes.n_flat:
+            if out is None:
+                out = np.empty(blocks.shape, dtype=dtype)
+            # The blocks that need the full transform are gathered into a single batch
+            transformed = (routes.orders == 0) & ~routes.constant
+            if transformed.any():
+                rebuilt_blocks = compress_blocks(
+                    blocks[transformed], frequences_cut, backend, precision, workspace, flat_blocks="off"
+                )
+                with stage("merge"):
+                    out[transformed] = rebuilt_blocks
+            with stage("flat"):
+                rebuild_flat_blocks(blocks, routes, frequences_cut, out, dtype)
+            return out
+
+    # Every stage works in place on a single buffer of the compute type
+    with stage("convert"):
+        if workspace is None:
+            work_blocks = np.empty(blocks.shape, dtype=dtype)
+        else:
+            work_blocks = workspace.get(blocks.shape, dtype)
+        np.copyto(work_blocks, blocks, casting='unsafe')
+
+    if backend == PRUNED_BACKEND:
+        # With a low d only the coefficients kept by the cut are computed, see pruned_dct
+        with stage("pruned"):
+            rebuilt_blocks = pruned_reconstruction(work_blocks, frequences_cut, overwrite=True)
+        with stage("round"):
+            np.around(rebuilt_blocks, 0, out=rebuilt_blocks)
+            np.clip(rebuilt_blocks, 0, 255, out=rebuilt_blocks)
+    else:
+        with stage("dct"):
+            coef_blocks = forward_blocks(work_blocks, backend, overwrite=True)
+        rebuilt_blocks = reconstruct_blocks(coef_blocks, frequences_cut, overwrite=True, backend=backend)
+    if out is None:
+        return rebuilt_blocks
+
+    with stage("merge"):
+        np.copyto(out, rebuilt_blocks, casting='unsafe')
+    return out
+
+
+def parallel_compress_blocks(blocks, frequences_cut, workers=1, chunk_size=None, executor="thread", backend=DEFAULT_BACKEND,
+                             precision=None, workspace=None, out=None, flat_blocks=DEFAULT_FLAT_MODE):
+    """
+    Same as compress_blocks, splitting the tensor into chunks of blocks handled by a pool of workers.
+
+    Args:
+        blocks (np.ndarray): (n_blocks, block_size, block_size) tensor of pixels,
+            or (blocks_per_row, blocks_per_column, block_size, block_size) block view, split by whole block rows.
+        frequences_cut (int): Frequency threshold (d).
+        workers (int): Number of workers, with a single worker the blocks are compressed serially.
+        chunk_size (int): Number of blocks handed to a worker at a time, by default the blocks are split evenly.
+        executor (str): "thread" for a thread pool, "process" for a process pool sharing the blocks through shared memory.
+        backend (str): Name of the DCT backend, or "auto".
+        precision (str): "float32" or "float64", see compute_dtype.
+        workspace (BlockWorkspace): Reusable work buffer of the serial path.
+        out (np.ndarray): uint8 tensor with the shape of blocks receiving the rebuilt pixels.
+        flat_blocks (str): Handling of the flat blocks, see compress_blocks.
 
-    # Cut the remaining elements that are not part of a block
-    image = image[:blocks_per_row * block_size, :blocks_per_column * block_size]
-
-    # Split the image into blocks of size block_size x block_size
-    # Initially, it reshapes the image into (blocks_per_row, block_size, remaining_blocks, block_size)
-    # Then, it swaps axes to group block dimensions together
-    # Lastly, it reshapes the image into (total_blocks, block_size, block_size)
-    # for example, having a 160x160 image with a block size of 8, it will result in a three dimenisional 
-    # vector split into (400 blocks, 8, 8)
-    image = image.reshape(blocks_per_row, block_size, -1, block_size).swapaxes(1, 2).reshape(-1, block_size, block_size)
-
-    image_new = []
-    for block in image:
-        # Perform scipy dct2 on each block
-        coef_matrix = scipy_dct2_fft(block)
-        coef_matrix = np.array(coef_matrix)
-        coef_matrix_cut = np.zeros(shape=(block_size, block_size))
-
-        # Perform frequences cut using given values
-        for k in range(block_size):
-            for l in range (block_size):
-                if (k + l) < frequences_cut:
-                    coef_matrix_cut[k, l] = coef_matrix[k, l]
-        
-        # Perform scipy idct2 on the matrix obtained combining the operations above
-        ff = scipy_idct2_fft(coef_matrix_cut)
-        ff = np.array(ff)
-        # Round the elements of the block, clipping the values inside the (0, 255) scale 
-        ff = np.around(ff, 0)
-        ff = np.clip(ff, 0, 255)
-        image_new.append(ff)
-        
-
-    image_new = np.array(image_new)
-
-    # Rebuild the compressed image by reshaping the 3d vector:
-    # Initially, it reshapes blocks back into grid structure (blocks_per_row, blocks_per_column, block_size, block_size)  
-    # Then, it rearranges dimensions to group pixels that belong to the same image row
-    # From (blocks_per_row, blocks_per_column, block_size, block_size) To   (blocks_per_row, block_size, blocks_per_column, block_size)
-    # Finally, it reshapes to final 2D image by combining block dimensions: (height, width) where height = blocks_per_row * block_size
-    
-    blocks_grid = image_new.reshape(blocks_per_row, blocks_per_column, block_size, block_size)
-    blocks_rearranged = blocks_grid.transpose(0, 2, 1, 3)
-    final_image = blocks_rearranged.reshape(
-        blocks_per_row * block_size, 
-        blocks_per_column* block_size
+    Returns:
+        np.ndarray: uint8 tensor of the rebuilt pixels, bit-identical to the serial path.
+    """
+    if out is None:
+        out = np.empty(blocks.shape, dtype=np.uint8)
+    block_size = blocks.shape[-1]
+    backend = resolve_backend(
+        backend, block_size, blocks.size // (block_size * block_size), compute_dtype(blocks.dtype, precision), frequences_cut
     )
-    
-    # Convert matrix data to uint for conversion issues
-    final_image = final_image.astype(np.uint8)
-
-    # Saves the compressed image in the output folder
-    os.makedirs(OUTPUT_FOLDER, exist_ok=True)
-    file_name = os.path.splitext(os.path.basename(image_path))[0]
-    output_path = os.path.join(OUTPUT_FOLDER, f"compressed_{file_name}.bmp")
-    iio.imwrite(output_path, final_image)
-    
+    if workers <= 1 and chunk_size is None:
+        return compress_blocks(blocks, frequences_cut, backend, precision, workspace, out, flat_blocks)
+
+    if blocks.ndim == 4 and chunk_size is not None:
+        # Chunks of a block view are made of whole block rows
+        chunk_size = max(1, chunk_size // blocks.shape[1])
+    return map_chunks(
+        compress_blocks, blocks, out, (frequences_cut, backend, precision, None, None, flat_blocks), max(1, workers),
+        chunk_size, executor
+    )
+
+
+def for_each_block_rows(function, blocks_per_row, blocks_per_column, progress=None, cancel_event=None, chunk_blocks=CHUNK_BLOCKS):
+    """
+    Call function(start, end) on consecutive ranges of blocks made of whole block rows.
+
+    Args:
+        function (callable): Called with the (start, end) indexes of the blocks of every chunk.
+        blocks_per_row (int): Number of block rows of the image.
+        blocks_per_column (int): Number of blocks in every block row.
+        progress (callable): Called with (done_rows, total_rows) after every chunk.
+        cancel_event (threading.Event): When it is set, the work stops before the next chunk.
+        chunk_blocks (int): Minimum number of blocks of a chunk, a chunk is at least one block row.
+
+    Raises:
+        CompressionCancelledError: If cancel_event has been set.
+    """
+    rows_per_chunk = max(1, chunk_blocks // blocks_per_column)
+
+    for first_row in range(0, blocks_per_row, rows_per_chunk):
+        if cancel_event is not None and cancel_event.is_set():
+            raise CompressionCancelledError
+
+        last_row = min(first_row + rows_per_chunk, blocks_per_row)
+        function(first_row * blocks_per_column, last_row * blocks_per_column)
+
+        if progress is not None:
+            progress(last_row, blocks_per_row)
+
+
+def compress_all_blocks(blocks, frequences_cut, out, workers=1, chunk_size=None, executor="thread",
+                        progress=None, cancel_event=None, backend=DEFAULT_BACKEND, precision=None, flat_blocks=DEFAULT_FLAT_MODE):
+    """
+    Compress a (blocks_per_row, blocks_per_column, block_size, block_size) tensor, such as the block_view of an image,
+    in a single batch, spread over a pool of workers, or a chunk of block rows at a time when the progress
+    is reported or the work may be cancelled.
+
+    Args:
+        out (np.ndarray): uint8 tensor with the shape of blocks receiving the rebuilt pixels,
+            such as the block_view of the output image.
+
+    Returns:
+        np.ndarray: The out tensor.
+    """
+    block_size = blocks.shape[-1]
+    backend = resolve_backend(
+        backend, block_size, blocks.size // (block_size * block_size), compute_dtype(blocks.dtype, precision), frequences_cut
+    )
+    if progress is not None or cancel_event is not None:
+        # Block rows are compressed a chunk at a time, to report the progress and to check for cancellation
+        blocks_per_row, blocks_per_column = blocks.shape[:2]
+        workspace = BlockWorkspace()
+
+        def compress_chunk(start, end):
+            rows = slice(start // blocks_per_column, end // blocks_per_column)
+            parallel_compress_blocks(
+                blocks[rows], frequences_cut, workers, chunk_size, executor, backend, precision, workspace, out[rows],
+                flat_blocks
+            )
+
+        for_each_block_rows(compress_chunk, blocks_per_row, blocks_per_column, progress, cancel_event)
+        return out
+    return parallel_compress_blocks(
+        blocks, frequences_cut, workers, chunk_size, executor, backend, precision, out=out, flat_blocks=flat_blocks
+    )
+
+
+def compress_planes(planes, block_size, frequences_cut, padding="edge", **options):
+    """
+    Compress several planes, every plane rebuilt into its own output.
+
+    Planes whose sides are not multiples of block_size are extended to whole blocks, see padded_segments,
+    and cropped back once rebuilt. The whole blocks of every plane are compressed straight from the plane
+    into the padded output, only the border blocks are gathered into a single batch.
+
+    Args:
+        planes (list): (rows, columns) uint8 planes.
+        block_size (int): Size of the square blocks (F).
+        frequences_cut (int): Frequency threshold (d).
+        padding (str): "edge", "reflect" or "zero", see PADDING_MODES.
+        options: workers, chunk_size, executor, progress, cancel_event, backend, precision and flat_blocks,
+            see compress_all_blocks. The progress is reported in block rows for a single block-aligned plane, in blocks otherwise.
+
+    Returns:
+        list: The rebuilt uint8 planes, with the shapes of the input ones.
+    """
+    padded_planes = [
+        np.empty((-(-plane.shape[0] // block_size) * block_size, -(-plane.shape[1] // block_size) * block_size), dtype=np.uint8)
+        for plane in planes
+    ]
+    whole_segments, border_segments = [], []
+    for plane, padded_plane in zip(planes, padded_planes):
+        for blocks, first_row, first_column in padded_segments(plane, block_size, padding):
+            # Every segment is rebuilt straight into its region of the padded plane
+            target = block_view(padded_plane[first_row:, first_column:], block_size)[:blocks.shape[0], :blocks.shape[1]]
+            # The whole blocks are a view of the plane, the border blocks a gathered copy
+            (whole_segments if np.may_share_memory(blocks, plane) else border_segments).append((blocks, target))
+
+    if not border_segments:
+        stacked_segments = []
+    elif len(border_segments) == 1:
+        stacked_segments = border_segments
+    else:
+        # The border segments are small copies already, they are gathered in a single tensor to be transformed in one batch
+        n_blocks = sum(blocks.shape[0] * blocks.shape[1] for blocks, _ in border_segments)
+        stacked_blocks = np.empty((n_blocks, 1, block_size, block_size), dtype=np.uint8)
+        start = 0
+        for blocks, _ in border_segments:
+            end = start + blocks.shape[0] * blocks.shape[1]
+            np.copyto(stacked_blocks[start:end].reshape(blocks.shape), blocks)
+            start = end
+        stacked_segments = [(stacked_blocks, np.empty_like(stacked_blocks))]
+
+    # The whole blocks are compressed from the plane into the padded plane, without a copy
+    batches = whole_segments + stacked_segments
+    total_blocks = sum(blocks.shape[0] * blocks.shape[1] for blocks, _ in batches)
+    options["backend"] = resolve_backend(
+        options.get("backend", DEFAULT_BACKEND), block_size, total_blocks,
+        compute_dtype(np.dtype(np.uint8), options.get("precision")), frequences_cut
+    )
+    progress = options.pop("progress", None)
+    if progress is not None and len(batches) > 1:
+        # The progress of the batches is reported in blocks, over all of them
+        done_blocks = 0
+        for blocks, target in batches:
+            def batch_progress(done_rows, total_rows, done_before=done_blocks, row_blocks=blocks.shape[1]):
+                progress(done_before + done_rows * row_blocks, total_blocks)
+
+            compress_all_blocks(blocks, frequences_cut, target, progress=batch_progress, **options)
+            done_blocks += blocks.shape[0] * blocks.shape[1]
+    else:
+        for blocks, target in batches:
+            compress_all_blocks(blocks, frequences_cut, target, progress=progress, **options)
+
+    if len(border_segments) > 1:
+        rebuilt_blocks = stacked_segments[0][1]
+        start = 0
+        for blocks, target in border_segments:
+            end = start + blocks.shape[0] * blocks.shape[1]
+            np.copyto(target, rebuilt_blocks[start:end].reshape(blocks.shape))
+            start = end
+
+    return [padded_plane[:plane.shape[0], :plane.shape[1]] for plane, padded_plane in zip(planes, padded_planes)]
+
+
+def compress_color_image(image, block_size, frequences_cut, subsampling="4:4:4", padding="crop", **options):
+    """
+    Compress a color image: RGB channels are converted to YCbCr, the chroma planes are optionally subsampled,
+    and the three planes are transformed in a single batch. Gray-scale images are compressed as a single plane.
+
+    Args:
+        image (np.ndarray): (rows, columns) or (rows, columns, channels) uint8 image, with 1 to 4 channels
+            (gray, gray and alpha, RGB, RGBA).
+        block_size (int): Size of the square blocks (F).
+        frequences_cut (int): Frequency threshold (d).
+        subsampling (str): "4:4:4" (no subsampling), "4:2:2" (half the columns) or "4:2:0" (half the rows and columns)
+            of the Cb and Cr planes.
+        padding (str): Border handling, see PADDING_MODES.
+        options: See compress_all_blocks.
+
+    Returns:
+        np.ndarray: The compressed uint8 image, with the channels of the input image, cut to whole blocks
+        when padding is "crop".
+
+    Notes:
+        - The alpha channel is kept unchanged.
+        - Subsampled chroma planes that do not fill whole blocks are always extended, with "edge" when padding is "crop".
+    """
+    return compress_color_images([image], block_size, frequences_cut, subsampling, padding, **options)[0]
+
+
+def compress_color_images(images, block_size, frequences_cut, subsampling="4:4:4", padding="crop", **options):
+    """Same as compress_color_image for a list of images, the planes of all the images are transformed in a single batch."""
+    factors = subsampling_factors(subsampling)
+    planes, layouts = [], []
+    for image in images:
+        channels, alpha = split_alpha(image)
+
+        if padding == "crop":
+            rows, columns = channels.shape[:2]
+            blocks_per_row, blocks_per_column = count_blocks(rows, columns, block_size)
+
+            # Cut the remaining elements that are not part of a block
+            channels = channels[:blocks_per_row * block_size, :blocks_per_column * block_size]
+
+        if channels.shape[-1] == 1:
+            image_planes = [channels[..., 0]]
+        else:
+            luma, blue_chroma, red_chroma = rgb_to_ycbcr(channels)
+            image_planes = [luma, subsample(blue_chroma, factors), subsample(red_chroma, factors)]
+        planes.extend(image_planes)
+        layouts.append((len(image_planes), alpha))
+
+    # The incomplete chroma blocks of a cropped image are extended
+    rebuilt_planes = compress_planes(planes, block_size, frequences_cut, "edge" if padding == "crop" else padding, **options)
+
+    final_images = []
+    for n_planes, alpha in layouts:
+        image_planes, rebuilt_planes = rebuilt_planes[:n_planes], rebuilt_planes[n_planes:]
+        if n_planes == 1:
+            final_image = image_planes[0]
+        else:
+            luma, blue_chroma, red_chroma = image_planes
+            final_image = ycbcr_to_rgb(luma, upsample(blue_chroma, factors, luma.shape), upsample(red_chroma, factors, luma.shape))
+
+        if alpha is not None:
+            final_image = np.dstack([final_image, alpha[:final_image.shape[0], :final_image.shape[1]]])
+        final_images.append(final_image)
+    return final_images
+
+
+def compress_image(image, block_size, frequences_cut, color=False, subsampling="4:4:4", padding="crop", **options):
+    """
+    Compress an image held in memory, without touching the filesystem.
+
+    Args:
+        image (np.ndarray): (rows, columns) uint8 gray-scale image, or with color a (rows, columns, channels) one,
+            see compress_color_image.
+        block_size (int): Size of the square blocks (F).
+        frequences_cut (int): Frequency threshold (d).
+        color (bool): Whether the image has color channels to keep.
+        subsampling (str): Chroma subsampling of color images.
+        padding (str): Border handling, see PADDING_MODES.
+        options: workers, chunk_size, executor, progress, cancel_event, backend, precision and flat_blocks,
+            see compress_all_blocks.
+
+    Returns:
+        np.ndarray: The compressed uint8 image, cut to whole blocks when padding is "crop".
+    """
+    return compress_images(image[np.newaxis], block_size, frequences_cut, color, subsampling, padding, **options)[0]
+
+
+def compress_images(images, block_size, frequences_cut, color=False, subsampling="4:4:4", padding="crop", **options):
+    """
+    Compress a batch of images of the same shape with a single batched transform.
+
+    Args:
+        images: List of images, or (n_images, rows, columns[, channels]) array, see compress_image.
+        block_size (int): Size of the square blocks (F).
+        frequences_cut (int): Frequency threshold (d).
+        color (bool): Whether the images have color channels to keep.
+        subsampling (str): Chroma subsampling of color images.
+        padding (str): Border handling, see PADDING_MODES.
+        options: See compress_all_blocks. The progress is reported in block rows of the whole batch.
+
+    Returns:
+        np.ndarray: (n_images, ...) uint8 array of the compressed images.
+    """
+    check_frequences_cut(block_size, frequences_cut)
+    if padding not in PADDING_MODES:
+        raise ValueError(f"Unknown padding mode {padding!r}, expected one of {list(PADDING_MODES)}")
+    if len(images) == 0:
+        raise ValueError("The batch has no images")
+    if len({image.shape for image in images}) > 1:
+        raise ValueError("The images of a batch must have the same shape")
+
+    if color:
+        return np.stack(compress_color_images(images, block_size, frequences_cut, subsampling, padding, **options))
+    if images[0].ndim != 2:
+        raise ValueError("Gray-scale images must be 2D arrays, use color=True for images with channels")
+    if padding != "crop":
+        # The images are extended to whole blocks, compressed, and cropped back to their shape
+        return np.stack(compress_planes(list(images), block_size, frequences_cut, padding, **options))
+
+    rows, columns = images[0].shape
+    blocks_per_row, blocks_per_column = count_blocks(rows, columns, block_size)
+    height, width = blocks_per_row * block_size, blocks_per_column * block_size
+
+    # The images are stacked one above the other, so that their blocks form a single block view: a single image
+    # is read without copies, and the rebuilt blocks are written straight into the block view of the output
+    with stage("split"):
+        if isinstance(images, np.ndarray):
+            stacked = images[:, :height, :width].reshape(-1, width)
+        else:
+            stacked = np.concatenate([image[:height, :width] for image in images])
+        final_images = np.empty((len(images), height, width), dtype=np.uint8)
+        blocks, rebuilt_blocks = block_view(stacked, block_size), block_view(final_images.reshape(-1, width), block_size)
+    with stage("compress"):
+        compress_all_blocks(blocks, frequences_cut, rebuilt_blocks, **options)
+    return final_images
+
+
+def read_image(image_path, color=False):
+    """
+    Read an image file, in gray-scale unless color is set.
+
+    Uncompressed BMP files are memory-mapped by bitmap.read_bmp, without a decode through PIL: the 8-bit
+    gray-scale ones are returned as a read-only view of the file. The other formats are read with imageio.
+    """
+    if not color and is_bmp(image_path):
+        try:
+            return read_bmp(image_path)
+        except ValueError:
+            # Compressed or unusual BMP variants are left to imageio
+            pass
+    return iio.imread(image_path) if color else iio.imread(image_path, pilmode='L')
+
+
+def decode_image(data, color=False):
+    """Decode an image held in memory (bytes, in any format readable by imageio), in gray-scale unless color is set."""
+    return iio.imread(data) if color else iio.imread(data, pilmode='L')
+
+
+def encode_image(image, output_format="bmp"):
+    """Encode an image in memory, returning the bytes of the file that save_image would write."""
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format {output_format!r}, expected one of {list(OUTPUT_FORMATS)}")
+    return iio.imwrite("<bytes>", image, extension=f".{output_format}")
+
+
+def compress_bytes(data, block_size, frequences_cut, output_format="bmp", color=False, subsampling="4:4:4",
+                   padding="crop", **options):
+    """
+    Compress an encoded image held in memory, returning the encoded compressed image.
+
+    Args:
+        data (bytes): Encoded image, in any format readable by imageio.
+        output_format (str): Format of the result, see OUTPUT_FORMATS.
+        Other arguments: See compress_image.
+
+    Returns:
+        bytes: The encoded compressed image.
+    """
+    image = decode_image(data, color)
+    final_image = compress_image(image, block_size, frequences_cut, color, subsampling, padding, **options)
+    return encode_image(final_image, output_format)
+
+
+# Options of compression() that the coefficient cache and the incremental compressor cannot honour
+# (they run sequentially), with their default values
+SEQUENTIAL_OPTIONS = {"workers": 1, "chunk_size": None, "executor": "thread"}
+
+# Flat blocks modes giving the output of the full transform, the only one the cache and the incremental compressor give
+EXACT_FLAT_MODES = ("off", "constant")
+
+
+def check_shared_options(cache, incremental, padding, color, options):
+    """
+    Raise ValueError when an option of compression() cannot be honoured by the cache or the incremental compressor
+    it was given: they compress cropped gray-scale images, sequentially, with their own backend and precision.
+
+    Args:
+        cache (CoefficientCache): Coefficient cache of the call, or None.
+        incremental (IncrementalCompressor): Incremental compressor of the call, or None.
+        padding (str): Padding mode of the call.
+        color (bool): Whether the colors are kept.
+        options (dict): Other options of the call, see compression.
+    """
+    if cache is None and incremental is None:
+        return
+    if cache is not None and incremental is not None:
+        raise ValueError("cache and incremental cannot be used together")
+    name, instance = ("cache", cache) if cache is not None else ("incremental", incremental)
+
+    if padding != "crop":
+        raise ValueError(f"padding={padding!r} is not supported with {name}, only 'crop' is")
+    if color:
+        raise ValueError(f"color is not supported with {name}")
+    if options["backend"] != DEFAULT_BACKEND and options["backend"] != instance.backend:
+        raise ValueError(f"backend={options['backend']!r} conflicts with the backend of {name} ({instance.backend!r}), "
+                         f"set it when creating {name}")
+    # The gray-scale images are read as uint8, see read_image
+    if options["precision"] is not None and compute_dtype(np.uint8, options["precision"]) != compute_dtype(np.uint8, instance.precision):
+        raise ValueError(f"precision={options['precision']!r} conflicts with the precision of {name} ({instance.precision!r}), "
+                         f"set it when creating {name}")
+    if options["flat_blocks"] not in EXACT_FLAT_MODES:
+        raise ValueError(f"flat_blocks={options['flat_blocks']!r} is not supported with {name}, "
+                         f"which gives the output of the full transform")
+    for option, default in SEQUENTIAL_OPTIONS.items():
+        if options[option] != default:
+            raise ValueError(f"{option}={options[option]!r} is not supported with {name}")
+    if incremental is not None:
+        for option in ("progress", "cancel_event"):
+            if options[option] is not None:
+                raise ValueError(f"{option} is not supported with {name}")
+
+
+def compression(image_path, block_size, frequences_cut, workers=1, chunk_size=None, executor="thread", output_path=None, cache=None,
+                progress=None, cancel_event=None, backend=DEFAULT_BACKEND, precision=None, color=False, subsampling="4:4:4",
+                padding="crop", profile=None, incremental=None, flat_blocks=DEFAULT_FLAT_MODE):
+    check_frequences_cut(block_size, frequences_cut)
+    if padding not in PADDING_MODES:
+        raise ValueError(f"Unknown padding mode {padding!r}, expected one of {list(PADDING_MODES)}")
+    options = {
+        "workers": workers, "chunk_size": chunk_size, "executor": executor, "progress": progress,
+        "cancel_event": cancel_event, "backend": backend, "precision": precision, "flat_blocks": flat_blocks,
+    }
+    check_shared_options(cache, incremental, padding, color, options)
+
+    # Every stage is timed when profiling is on, see instrumentation
+    with profiling(profile), stage("compression"):
+        if cache is not None:
+            # The coefficient cache reuses the forward DCT (and the reconstruction) of previous runs
+            with stage("compress"):
+                final_image = cache.reconstruction(image_path, block_size, frequences_cut, progress, cancel_event)
+        elif incremental is not None:
+            # Only the blocks that changed since the previous run of the same file are transformed again
+            with stage("read"):
+                image = read_image(image_path)
+            with stage("compress"):
+                final_image, _ = incremental.compress(image, block_size, frequences_cut, key=os.path.abspath(image_path))
+        else:
+            # Open the image in a grayscale format, unless its colors are kept
+            with stage("read"):
+                image = read_image(image_path, color)
+            final_image = compress_image(image, block_size, frequences_cut, color, subsampling, padding, **options)
+
+        return save_image(final_image, image_path, output_path)
+
+
+def save_image(final_image, image_path, output_path=None):
+    # Saves the compressed image in the output folder, unless an explicit output path is given
+    if output_path is None:
+        os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+        file_name = os.path.splitext(os.path.basename(image_path))[0]
+        output_path = os.path.join(OUTPUT_FOLDER, f"compressed_{file_name}.bmp")
+    with stage("write"):
+        if final_image.ndim == 2 and final_image.dtype == np.uint8 and is_bmp(output_path):
+            # Gray-scale BMP files are written straight from the pixels, see bitmap.write_bmp
+            write_bmp(output_path, final_image)
+        else:
+            iio.imwrite(output_path, final_image)
+
     return output_path
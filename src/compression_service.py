@@ -0,0 +1,285 @@
+import argparse
+import asyncio
+import concurrent.futures
+import functools
+import json
+import os
+import time
+from collections import deque
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+
+from compression_manager import compress_bytes, OUTPUT_FORMATS, PADDING_MODES
+from custom_exceptions import InvalidBlockSizeError, InvalidFrequenciesNumberError, ServiceBusyError
+from parallel_engine import EXECUTORS
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Requests waiting for a free worker beyond this number are rejected with 503 (Service Unavailable),
+# so that a burst of clients cannot pile up unbounded work and memory
+DEFAULT_MAX_QUEUE = 16
+
+# Largest accepted request body, 64 MiB
+MAX_BODY_BYTES = 64 * 1024 * 1024
+
+# Number of recent requests the latency percentiles are computed on
+LATENCY_WINDOW = 1024
+LATENCY_PERCENTILES = (50, 90, 99)
+
+# Content types of the output formats, the compressed image never touches the disk
+CONTENT_TYPES = {"bmp": "image/bmp", "png": "image/png"}
+
+REASONS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+    422: "Unprocessable Entity", 503: "Service Unavailable",
+}
+
+
+class ServiceStats:
+    """
+    Counters of a CompressionService.
+
+    The latency of a request goes from its arrival to the end of its compression, queueing included,
+    and the percentiles are computed over the last LATENCY_WINDOW completed requests.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def snapshot(self):
+        """Return the counters as a dictionary, with the throughput since the start of the service."""
+        uptime = time.perf_counter() - self.started
+        latencies = np.array(self.latencies) * 1e3
+        percentiles = np.percentile(latencies, LATENCY_PERCENTILES) if len(latencies) else [0.0] * len(LATENCY_PERCENTILES)
+        return {
+            "queue_depth": self.queued,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "uptime": uptime,
+            "requests_per_second": self.completed / uptime if uptime else 0.0,
+            "mb_per_second": self.bytes_in / 1e6 / uptime if uptime else 0.0,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "latency_ms": {f"p{percentile}": float(value) for percentile, value in zip(LATENCY_PERCENTILES, percentiles)},
+        }
+
+
+class CompressionService:
+    """
+    Local asyncio compression service, speaking HTTP/1.1 on a TCP port or on a Unix socket.
+
+    Endpoints:
+        POST /compress?F=8&d=6: the body is an encoded image, the response the compressed image. The optional color
+            (0 or 1), subsampling, padding and format (bmp or png) parameters match compression_manager.compress_bytes.
+        GET /stats: the counters of ServiceStats, in JSON format.
+
+    At most `workers` images are compressed at a time, at most `max_queue` more wait for a worker,
+    and the following requests are rejected with 503 until the queue drains.
+
+    Args:
+        workers (int): Size of the pool.
+        max_queue (int): Number of requests that may wait for a worker.
+        executor (str): "process" (default) or "thread".
+        max_body_bytes (int): Largest accepted request body.
+    """
+
+    def __init__(self, workers=None, max_queue=DEFAULT_MAX_QUEUE, executor="process", max_body_bytes=MAX_BODY_BYTES):
+        if executor not in EXECUTORS:
+            raise ValueError(f"Unknown executor {executor!r}, expected one of {EXECUTORS}")
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.executor = executor
+        self.max_body_bytes = max_body_bytes
+        self.stats = ServiceStats()
+        self._pool = None
+        self._slots = None
+        self._server = None
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT, path=None):
+        """Start listening on host:port, or on the Unix socket path when given, and return the server."""
+        if self.executor == "process":
+            pool_class = concurrent.futures.ProcessPoolExecutor
+        else:
+            pool_class = concurrent.futures.ThreadPoolExecutor
+        self._pool = pool_class(max_workers=self.workers)
+        self._slots = asyncio.Semaphore(self.workers)
+        if path is not None:
+            self._server = await asyncio.start_unix_server(self._handle, path=path)
+        else:
+            self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+
+    async def submit(self, data, block_size, frequences_cut, **options):
+        """
+        Compress an encoded image in the pool, see compression_manager.compress_bytes.
+
+        Raises:
+            ServiceBusyError: If max_queue requests are already waiting for a worker.
+        """
+        stats = self.stats
+        if stats.queued >= self.max_queue and self._slots.locked():
+            stats.rejected += 1
+            raise ServiceBusyError()
+
+        start_time = time.perf_counter()
+        stats.queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            stats.queued -= 1
+
+        stats.running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                self._pool, functools.partial(compress_bytes, data, block_size, frequences_cut, **options)
+            )
+        except Exception:
+            stats.failed += 1
+            raise
+        finally:
+            stats.running -= 1
+            self._slots.release()
+
+        stats.completed += 1
+        stats.bytes_in += len(data)
+        stats.bytes_out += len(result)
+        stats.latencies.append(time.perf_counter() - start_time)
+        return result
+
+    async def _handle(self, reader, writer):
+        try:
+            status, content_type, body = await self._respond(reader)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            status, content_type, body = 400, "text/plain", b"Malformed request"
+
+        headers = [
+            f"HTTP/1.1 {status} {REASONS[status]}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(body)}",
+            "Connection: close",
+        ]
+        if status == 503:
+            headers.append("Retry-After: 1")
+        try:
+            writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, reader):
+        request_line = (await reader.readline()).decode("latin-1").split()
+        if len(request_line) != 3:
+            raise ValueError("Malformed request line")
+        method, target, _ = request_line
+
+        content_length = 0
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            if name.strip().lower() == "content-length":
+                content_length = int(value)
+
+        url = urlsplit(target)
+        if url.path == "/stats":
+            if method != "GET":
+                return 405, "text/plain", b"Use GET"
+            return 200, "application/json", json.dumps(self.stats.snapshot()).encode()
+        if url.path != "/compress":
+            return 404, "text/plain", b"Unknown endpoint"
+        if method != "POST":
+            return 405, "text/plain", b"Use POST"
+        if content_length > self.max_body_bytes:
+            return 413, "text/plain", f"The body exceeds {self.max_body_bytes} bytes".encode()
+
+        try:
+            block_size, frequences_cut, options = parse_parameters(url.query)
+        except ValueError as error:
+            return 400, "text/plain", str(error).encode()
+
+        data = await reader.readexactly(content_length)
+        try:
+            result = await self.submit(data, block_size, frequences_cut, **options)
+        except ServiceBusyError as error:
+            return 503, "text/plain", str(error).encode()
+        except (InvalidBlockSizeError, InvalidFrequenciesNumberError) as error:
+            return 422, "text/plain", str(error).encode()
+        except Exception as error:
+            # Images that imageio cannot decode, for instance
+            return 422, "text/plain", f"{type(error).__name__}: {error}".encode()
+        return 200, CONTENT_TYPES[options["output_format"]], result
+
+
+def parse_parameters(query):
+    """Parse the query string of a compression request into (F, d, options), raising ValueError on invalid values."""
+    parameters = {name: values[-1] for name, values in parse_qs(query).items()}
+    try:
+        block_size, frequences_cut = int(parameters["F"]), int(parameters["d"])
+    except (KeyError, ValueError):
+        raise ValueError("The integer parameters F and d are required")
+
+    options = {
+        "color": parameters.get("color", "0") not in ("0", "false", ""),
+        "subsampling": parameters.get("subsampling", "4:4:4"),
+        "padding": parameters.get("padding", "crop"),
+        "output_format": parameters.get("format", "bmp"),
+    }
+    if options["padding"] not in PADDING_MODES:
+        raise ValueError(f"Unknown padding mode {options['padding']!r}, expected one of {list(PADDING_MODES)}")
+    if options["output_format"] not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown format {options['output_format']!r}, expected one of {list(OUTPUT_FORMATS)}")
+    return block_size, frequences_cut, options
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, path=None, **service_options):
+    service = CompressionService(**service_options)
+    server = await service.start(host, port, path)
+    address = path or f"http://{host}:{port}"
+    print(f"Compression service listening on {address} ({service.workers} workers, queue of {service.max_queue})")
+    try:
+        await server.serve_forever()
+    finally:
+        await service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local compression service: POST an image to /compress?F=8&d=6.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", help="Listen on this Unix socket instead of a TCP port")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1, help="Number of worker processes")
+    parser.add_argument("--max-queue", type=int, default=DEFAULT_MAX_QUEUE,
+                        help="Requests waiting for a worker before new ones are rejected with 503")
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, workers=args.workers, max_queue=args.max_queue))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
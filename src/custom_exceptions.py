@@ -14,4 +14,20 @@ class InvalidFrequenciesNumberError(Exception):
         super().__init__(self.msg)
 
     def __str__(self):
-        return self.msg
\ No newline at end of file
+        return self.msg
+
+class CompressionCancelledError(Exception):
+    def __init__(self, msg="The compression has been cancelled"):
+        self.msg = msg
+        super().__init__(self.msg)
+
+    def __str__(self):
+        return self.msg
+
+class ServiceBusyError(Exception):
+    def __init__(self, msg="The compression service is busy, retry later"):
+        self.msg = msg
+        super().__init__(self.msg)
+
+    def __str__(self):
+        return self.msg
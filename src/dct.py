@@ -1,15 +1,21 @@
 
+import os
+import threading
+from collections import OrderedDict
 import numpy as np
-from scipy.fft import dct, dctn, idctn
+
+from lazy_import import lazy_module
+
+scipy_fft = lazy_module("scipy.fft")
 
 def scipy_dct_fft(func_array):
-    return dct(func_array, type=2, norm="ortho")
+    return scipy_fft.dct(func_array, type=2, norm="ortho")
 
-def scipy_dct2_fft(func_array):
-    return dctn(func_array, type=2, norm="ortho")
+def scipy_dct2_fft(func_array, axes=None, overwrite_x=False):
+    return scipy_fft.dctn(func_array, type=2, norm="ortho", axes=axes, overwrite_x=overwrite_x)
 
-def scipy_idct2_fft(func_array):
-    return idctn(func_array, type=2, norm="ortho")
+def scipy_idct2_fft(func_array, axes=None, overwrite_x=False):
+    return scipy_fft.idctn(func_array, type=2, norm="ortho", axes=axes, overwrite_x=overwrite_x)
 
 def custom_dct(func_array, D = None):
     n = len(func_array)
@@ -19,28 +25,101 @@ def custom_dct(func_array, D = None):
     return coeff_array
 
 def custom_dct2(func_array_2d):
-    coef_array_2d = np.copy(func_array_2d)
-    N = len(func_array_2d)
-    D = _compute_d(N)   
+    # Works on a single (N, M) matrix as well as on a (..., N, M) stack of matrices,
+    # since matmul broadcasts D @ X[k] @ D.T over the leading axes
+    func_array_2d = _as_float_array(func_array_2d)
+    D_rows = _compute_d(func_array_2d.shape[-2], func_array_2d.dtype)
+    D_columns = _compute_d(func_array_2d.shape[-1], func_array_2d.dtype)
+    return D_rows @ func_array_2d @ D_columns.T
+
+def custom_idct2(coef_array_2d):
+    # D is orthogonal, so the inverse transform is D.T @ C @ D
+    coef_array_2d = _as_float_array(coef_array_2d)
+    D_rows = _compute_d(coef_array_2d.shape[-2], coef_array_2d.dtype)
+    D_columns = _compute_d(coef_array_2d.shape[-1], coef_array_2d.dtype)
+    return D_rows.T @ coef_array_2d @ D_columns
 
-    for j in range(N):
-        coef_array_2d[:, j] = custom_dct(coef_array_2d[:, j], D)
-    
-    for j in range(N):
-        coef_array_2d[j, :] = custom_dct(coef_array_2d[j, :], D)
+def _as_float_array(func_array):
+    func_array = np.asarray(func_array)
+    if func_array.dtype not in (np.float32, np.float64):
+        func_array = func_array.astype(np.float64)
+    return func_array
 
-    return coef_array_2d
+def _compute_d(n, dtype=np.float64):
+    return BASIS_CACHE.get(n, dtype)
 
-def _compute_d(n):
-    alpha_array = np.zeros(n)
+def _build_d(n, dtype=np.float64):
+    alpha_array = np.full(n, np.sqrt(2.0 / n))
     alpha_array[0] = 1.0 / np.sqrt(n)
-    alpha_array[1:] = np.sqrt(2.0 / n)
-    D = np.empty([n, n])
 
-    for l in range(n):
-        for j in range(n):
-            D[l][j] = alpha_array[l] * np.cos( l * np.pi * (2*j+1) / (2*n))
-    
-    return D
+    # D[l][j] = alpha[l] * cos(l * pi * (2j + 1) / 2n), evaluated on the whole (l, j) grid
+    l = np.arange(n)[:, None]
+    j = np.arange(n)[None, :]
+    D = alpha_array[:, None] * np.cos(l * np.pi * (2*j+1) / (2*n))
+
+    return D.astype(dtype)
+
+
+class BasisCache:
+    """
+    LRU store of the DCT basis matrices, keyed by (n, dtype).
+
+    Args:
+        maxsize (int): Maximum number of matrices kept in memory, the least recently used one is evicted first.
+        cache_dir (str): Optional folder where the matrices are saved in .npy format and reloaded from.
+
+    Notes:
+        - The returned matrices are read-only, since they are shared between all the callers.
+        - The store is thread-safe: the workers of a thread pool reach it through the matrix backend and the
+          pruned transform. A missing matrix is built (or loaded) under the lock, so it is built only once.
+    """
+
+    def __init__(self, maxsize=32, cache_dir=None):
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self._matrices = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, n, dtype=np.float64):
+        key = (n, np.dtype(dtype).str)
+        with self._lock:
+            D = self._matrices.get(key)
+            if D is not None:
+                self._matrices.move_to_end(key)
+                return D
+
+            D = self._load(n, dtype)
+            D.setflags(write=False)
+            self._matrices[key] = D
+            if len(self._matrices) > self.maxsize:
+                self._matrices.popitem(last=False)
+            return D
+
+    def clear(self):
+        with self._lock:
+            self._matrices.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._matrices)
+
+    def __contains__(self, key):
+        n, dtype = key
+        with self._lock:
+            return (n, np.dtype(dtype).str) in self._matrices
+
+    def _load(self, n, dtype):
+        if self.cache_dir is None:
+            return _build_d(n, dtype)
+
+        path = os.path.join(self.cache_dir, f"dct_basis_{n}_{np.dtype(dtype).name}.npy")
+        if os.path.exists(path):
+            return np.load(path)
+
+        D = _build_d(n, dtype)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        np.save(path, D)
+        return D
 
 
+BASIS_CACHE = BasisCache()
@@ -0,0 +1,336 @@
+import json
+import os
+import threading
+import timeit
+import numpy as np
+
+from dct import _compute_d
+from lazy_import import lazy_module
+
+scipy_fft = lazy_module("scipy.fft")
+
+# The autotuner stores the fastest backend of every (F, batch size, dtype) in this file,
+# unless the DCT_TUNING_FILE environment variable points to another one
+DEFAULT_TUNING_PATH = os.path.join(os.path.expanduser("~"), ".cache", "image_compressor", "dct_tuning.json")
+TUNING_REPEATS = 5
+
+# Largest batch the backends are timed on: bigger batches share its measure, so that the first call on
+# a gigapixel image does not transform a random copy of the whole image several times
+MAX_TUNING_BLOCKS = 4096
+
+
+class DCTBackend:
+    """
+    Common interface of the DCT backends: orthonormal DCT-II and its inverse,
+    1D along an axis and 2D on the last two axes, so that a (n_blocks, F, F) tensor is transformed in a single call.
+    """
+
+    name = None
+
+    def supports(self, size):
+        """Whether the backend can transform blocks of the given size."""
+        return True
+
+    def dct(self, x, axis=-1):
+        raise NotImplementedError
+
+    def idct(self, x, axis=-1):
+        raise NotImplementedError
+
+    def dct2(self, x, overwrite=False):
+        return self.dct(self.dct(x, axis=-1), axis=-2)
+
+    def idct2(self, x, overwrite=False):
+        return self.idct(self.idct(x, axis=-2), axis=-1)
+
+
+class ScipyBackend(DCTBackend):
+    """scipy.fft, the reference backend."""
+
+    name = "scipy"
+
+    def dct(self, x, axis=-1):
+        return scipy_fft.dct(x, type=2, norm="ortho", axis=axis)
+
+    def idct(self, x, axis=-1):
+        return scipy_fft.idct(x, type=2, norm="ortho", axis=axis)
+
+    def dct2(self, x, overwrite=False):
+        return scipy_fft.dctn(x, type=2, norm="ortho", axes=(-2, -1), overwrite_x=overwrite)
+
+    def idct2(self, x, overwrite=False):
+        return scipy_fft.idctn(x, type=2, norm="ortho", axes=(-2, -1), overwrite_x=overwrite)
+
+
+class NumpyFFTBackend(DCTBackend):
+    """
+    DCT computed with a single complex FFT of numpy.fft, using the Makhoul reordering:
+    the even samples followed by the odd samples in reverse order.
+    """
+
+    name = "numpy_fft"
+
+    def dct(self, x, axis=-1):
+        x = np.moveaxis(_as_float(x), axis, -1)
+        n = x.shape[-1]
+
+        reordered = np.concatenate([x[..., ::2], x[..., 1::2][..., ::-1]], axis=-1)
+        twiddles = np.exp(-0.5j * np.pi * np.arange(n) / n)
+        coefficients = 2 * np.real(np.fft.fft(reordered, axis=-1) * twiddles)
+
+        # Orthonormal scaling
+        coefficients[..., 0] *= np.sqrt(1 / (4 * n))
+        coefficients[..., 1:] *= np.sqrt(1 / (2 * n))
+        return np.moveaxis(coefficients.astype(x.dtype, copy=False), -1, axis)
+
+    def idct(self, x, axis=-1):
+        x = np.moveaxis(_as_float(x), axis, -1)
+        n = x.shape[-1]
+
+        # Undo the orthonormal scaling, then rebuild the FFT of the reordered samples from X[k] and X[N - k]
+        unscaled = x * np.sqrt(2 * n)
+        unscaled[..., 0] = x[..., 0] * np.sqrt(4 * n)
+        mirrored = np.concatenate([np.zeros_like(unscaled[..., :1]), unscaled[..., :0:-1]], axis=-1)
+        twiddles = np.exp(0.5j * np.pi * np.arange(n) / n)
+        reordered = np.real(np.fft.ifft(twiddles * (unscaled - 1j * mirrored) / 2, axis=-1))
+
+        samples = np.empty_like(reordered)
+        half = (n + 1) // 2
+        samples[..., ::2] = reordered[..., :half]
+        samples[..., 1::2] = reordered[..., half:][..., ::-1]
+        return np.moveaxis(samples.astype(x.dtype, copy=False), -1, axis)
+
+
+class MatrixBackend(DCTBackend):
+    """Matrix products with the cached DCT basis: D @ X @ D.T."""
+
+    name = "matrix"
+
+    def dct(self, x, axis=-1):
+        x = _as_float(x)
+        D = _compute_d(x.shape[axis], x.dtype)
+        return np.moveaxis(np.moveaxis(x, axis, -1) @ D.T, -1, axis)
+
+    def idct(self, x, axis=-1):
+        x = _as_float(x)
+        D = _compute_d(x.shape[axis], x.dtype)
+        return np.moveaxis(np.moveaxis(x, axis, -1) @ D, -1, axis)
+
+    def dct2(self, x, overwrite=False):
+        x = _as_float(x)
+        return self._product(_compute_d(x.shape[-2], x.dtype), x, _compute_d(x.shape[-1], x.dtype).T, overwrite)
+
+    def idct2(self, x, overwrite=False):
+        x = _as_float(x)
+        return self._product(_compute_d(x.shape[-2], x.dtype).T, x, _compute_d(x.shape[-1], x.dtype), overwrite)
+
+    @staticmethod
+    def _product(left, x, right, overwrite):
+        # When x may be overwritten, the second product is written back into it
+        if overwrite and x.flags.writeable and x.flags.c_contiguous and x.shape[-1] == x.shape[-2]:
+            return np.matmul(left @ x, right, out=x)
+        return left @ x @ right
+
+
+# Scale factors between the AAN outputs and the orthonormal DCT: sqrt(8) for k = 0, 4 * cos(k * pi / 16) otherwise
+_AAN_SCALE = np.sqrt(8) * np.where(np.arange(8) == 0, 1.0, np.sqrt(2) * np.cos(np.arange(8) * np.pi / 16))
+
+
+class AANBackend(DCTBackend):
+    """
+    Arai-Agui-Nakajima fast 8-point DCT (5 multiplications per 1D transform, as in libjpeg),
+    evaluated on all the blocks at once. It supports only 8x8 blocks.
+    """
+
+    name = "aan8"
+
+    def supports(self, size):
+        return size == 8
+
+    def dct(self, x, axis=-1):
+        x = np.moveaxis(_as_float(x), axis, -1)
+        self._check(x)
+        d0, d1, d2, d3, d4, d5, d6, d7 = (x[..., i] for i in range(8))
+
+        tmp0, tmp7 = d0 + d7, d0 - d7
+        tmp1, tmp6 = d1 + d6, d1 - d6
+        tmp2, tmp5 = d2 + d5, d2 - d5
+        tmp3, tmp4 = d3 + d4, d3 - d4
+
+        # Even part
+        tmp10, tmp13 = tmp0 + tmp3, tmp0 - tmp3
+        tmp11, tmp12 = tmp1 + tmp2, tmp1 - tmp2
+        out0, out4 = tmp10 + tmp11, tmp10 - tmp11
+        z1 = (tmp12 + tmp13) * 0.707106781186547524
+        out2, out6 = tmp13 + z1, tmp13 - z1
+
+        # Odd part
+        tmp10, tmp11, tmp12 = tmp4 + tmp5, tmp5 + tmp6, tmp6 + tmp7
+        z5 = (tmp10 - tmp12) * 0.382683432365089772
+        z2 = 0.541196100146196984 * tmp10 + z5
+        z4 = 1.306562964876376527 * tmp12 + z5
+        z3 = tmp11 * 0.707106781186547524
+        z11, z13 = tmp7 + z3, tmp7 - z3
+        out5, out3 = z13 + z2, z13 - z2
+        out1, out7 = z11 + z4, z11 - z4
+
+        out = np.stack([out0, out1, out2, out3, out4, out5, out6, out7], axis=-1)
+        out /= _AAN_SCALE.astype(out.dtype)
+        return np.moveaxis(out, -1, axis)
+
+    def idct(self, x, axis=-1):
+        x = np.moveaxis(_as_float(x), axis, -1)
+        self._check(x)
+        x = x * (_AAN_SCALE / 8).astype(x.dtype)
+
+        # Even part
+        tmp10, tmp11 = x[..., 0] + x[..., 4], x[..., 0] - x[..., 4]
+        tmp13 = x[..., 2] + x[..., 6]
+        tmp12 = (x[..., 2] - x[..., 6]) * 1.414213562373095049 - tmp13
+        tmp0, tmp3 = tmp10 + tmp13, tmp10 - tmp13
+        tmp1, tmp2 = tmp11 + tmp12, tmp11 - tmp12
+
+        # Odd part
+        z13, z10 = x[..., 5] + x[..., 3], x[..., 5] - x[..., 3]
+        z11, z12 = x[..., 1] + x[..., 7], x[..., 1] - x[..., 7]
+        tmp7 = z11 + z13
+        tmp11 = (z11 - z13) * 1.414213562373095049
+        z5 = (z10 + z12) * 1.847759065022573512
+        tmp10 = 1.082392200292393968 * z12 - z5
+        tmp12 = -2.613125929752753055 * z10 + z5
+        tmp6 = tmp12 - tmp7
+        tmp5 = tmp11 - tmp6
+        tmp4 = tmp10 + tmp5
+
+        out = np.stack([
+            tmp0 + tmp7, tmp1 + tmp6, tmp2 + tmp5, tmp3 - tmp4,
+            tmp3 + tmp4, tmp2 - tmp5, tmp1 - tmp6, tmp0 - tmp7
+        ], axis=-1)
+        return np.moveaxis(out, -1, axis)
+
+    def _check(self, x):
+        if x.shape[-1] != 8:
+            raise ValueError(f"The {self.name} backend supports only 8 points transforms, got {x.shape[-1]}")
+
+
+def _as_float(x):
+    x = np.asarray(x)
+    if x.dtype not in (np.float32, np.float64):
+        x = x.astype(np.float64)
+    return x
+
+
+BACKENDS = {}
+
+
+def register_backend(backend):
+    """Add a backend instance to the registry, under its name."""
+    BACKENDS[backend.name] = backend
+    return backend
+
+
+for _backend in (ScipyBackend(), NumpyFFTBackend(), MatrixBackend(), AANBackend()):
+    register_backend(_backend)
+
+
+def available_backends(size):
+    """Names of the registered backends supporting blocks of the given size."""
+    return [name for name, backend in BACKENDS.items() if backend.supports(size)]
+
+
+class Autotuner:
+    """
+    Pick the fastest backend for every (F, batch size, dtype), timing all the backends on the first call.
+
+    Batch sizes are rounded up to a power of two, so that close sizes share the same measure,
+    and every batch above MAX_TUNING_BLOCKS shares the measure of MAX_TUNING_BLOCKS blocks.
+    The winners are saved in a JSON tuning file and reloaded by the next processes.
+
+    Args:
+        tuning_path (str): Path of the tuning file, None to keep the winners only in memory.
+        repeats (int): Number of timed forward and inverse transforms of every backend.
+    """
+
+    def __init__(self, tuning_path=None, repeats=TUNING_REPEATS):
+        self.tuning_path = tuning_path
+        self.repeats = repeats
+        self._lock = threading.Lock()
+        self._tuning = self._load()
+
+    @staticmethod
+    def batch_bucket(batch_size):
+        """Power of two above batch_size, capped at MAX_TUNING_BLOCKS."""
+        return min(1 << max(0, int(batch_size) - 1).bit_length(), MAX_TUNING_BLOCKS)
+
+    @staticmethod
+    def key(size, batch_size, dtype):
+        return f"{size}x{Autotuner.batch_bucket(batch_size)}x{np.dtype(dtype).name}"
+
+    def best_backend(self, size, batch_size, dtype=np.float64):
+        key = self.key(size, batch_size, dtype)
+        with self._lock:
+            entry = self._tuning.get(key)
+            if entry is None or entry["backend"] not in BACKENDS:
+                entry = self._tune(size, batch_size, dtype)
+                self._tuning[key] = entry
+                self._save()
+            return BACKENDS[entry["backend"]]
+
+    def tuning(self):
+        with self._lock:
+            return dict(self._tuning)
+
+    def _tune(self, size, batch_size, dtype):
+        blocks = np.random.default_rng(23).random((self.batch_bucket(batch_size), size, size), dtype=dtype)
+        blocks *= 255
+
+        times = {}
+        for name in available_backends(size):
+            backend = BACKENDS[name]
+            backend.idct2(backend.dct2(blocks))
+            times[name] = min(timeit.repeat(lambda: backend.idct2(backend.dct2(blocks)), number=1, repeat=self.repeats))
+
+        return {"backend": min(times, key=times.get), "times": times}
+
+    def _load(self):
+        if self.tuning_path is None or not os.path.exists(self.tuning_path):
+            return {}
+        try:
+            with open(self.tuning_path) as tuning_file:
+                return json.load(tuning_file)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        if self.tuning_path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.tuning_path)), exist_ok=True)
+            temporary_path = f"{self.tuning_path}.{os.getpid()}.tmp"
+            with open(temporary_path, "w") as tuning_file:
+                json.dump(self._tuning, tuning_file, indent=2)
+            os.replace(temporary_path, self.tuning_path)
+        except OSError:
+            # A read-only location only costs a new tuning in the next process
+            pass
+
+
+AUTOTUNER = Autotuner(os.environ.get("DCT_TUNING_FILE", DEFAULT_TUNING_PATH))
+
+
+def get_backend(name, size, batch_size=1, dtype=np.float64):
+    """
+    Return the backend registered as name, or the autotuned one when name is "auto".
+
+    Raises:
+        ValueError: If the backend is unknown or does not support blocks of the given size.
+    """
+    if name == "auto":
+        return AUTOTUNER.best_backend(size, batch_size, dtype)
+
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown DCT backend {name!r}, expected 'auto' or one of {list(BACKENDS)}")
+    backend = BACKENDS[name]
+    if not backend.supports(size):
+        raise ValueError(f"The {name} backend does not support {size}x{size} blocks")
+    return backend
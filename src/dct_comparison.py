@@ -1,64 +1,33 @@
-import os
-import numpy as np
-import timeit
-import matplotlib.pyplot as plt
+from benchmark import run_benchmarks, RESULTS_PATH
+from lazy_import import lazy_module
 
-from dct import custom_dct2, scipy_dct2_fft
-
-PATH_MATRICES = "benchmark_matrices"
-
-def order_paths(paths):
-    # Order paths by creation time, since the matrices are generated sequentially in crescent order
-    new_paths = []
-    for path in paths:
-        new_paths.append(os.path.join(PATH_MATRICES, path))
-    sorted_files = sorted(new_paths, key=os.path.getctime)
-    return sorted_files
+plt = lazy_module("matplotlib.pyplot")
 
 if __name__ == "__main__":
-    
-    custom_times = []
-    fft_times = []
-    matrix_sizes = []
-    
-    paths = os.listdir(PATH_MATRICES)
-    ordered_paths = order_paths(paths)
-
-    for matrix_path in ordered_paths:
-
-        matrix = np.load(matrix_path)        
-
-        # Perform custom dct2 and track execution time
 
-        start_time_custom = timeit.default_timer()
-        custom_results = custom_dct2(matrix)
-        end_time_custom = timeit.default_timer()
-        elapsed_time_custom = end_time_custom - start_time_custom
-        
-        custom_times.append(elapsed_time_custom)
+    # Time every benchmark matrix with warm-up and repeated runs, saving the results in RESULTS_PATH
+    report = run_benchmarks(suites=["dct"], output_path=RESULTS_PATH)
 
-        # Perform scipy dct2 and track execution time
+    dct_results = [result for result in report["results"] if result["suite"] == "dct"]
+    custom_results = [result for result in dct_results if result["name"] == "custom_dct2"]
+    fft_results = [result for result in dct_results if result["name"] == "scipy_dct2_fft"]
 
-        start_time_fft = timeit.default_timer()
-        fft_results = scipy_dct2_fft(matrix)
-        end_time_fft = timeit.default_timer()
-        elapsed_time_fft = end_time_fft - start_time_fft
-        
-        fft_times.append(elapsed_time_fft)
+    matrix_sizes = [result["params"]["size"] for result in custom_results]
 
-        matrix_sizes.append(len(matrix))
-
-
-
-    # Plot the results
+    # Plot the median times, with the interquartile range as error bar
     plt.figure(figsize=(10, 6))
 
-    plt.plot(matrix_sizes, custom_times , marker='s', label="Custom DCT")
-    plt.plot(matrix_sizes, fft_times, marker='^', label="Scipy DCT with FFT")
+    for results, marker, label in [(custom_results, 's', "Custom DCT"), (fft_results, '^', "Scipy DCT with FFT")]:
+        medians = [result["median"] for result in results]
+        errors = [
+            [result["median"] - result["q1"] for result in results],
+            [result["q3"] - result["median"] for result in results],
+        ]
+        plt.errorbar(matrix_sizes, medians, yerr=errors, marker=marker, capsize=3, label=label)
 
     # Format the plot
     plt.xlabel('Matrix Sizes')
-    plt.ylabel('Execution time (seconds) (log scale)')
+    plt.ylabel('Median execution time (seconds) (log scale)')
     plt.title('Comparison of FFT DCT and Standard DCT by Execution Time')
     plt.yscale('log')
     plt.grid(True)
@@ -66,4 +35,3 @@ if __name__ == "__main__":
     plt.tight_layout()
     plt.savefig("DCT_comparison.png")
     plt.show()
-
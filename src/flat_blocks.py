@@ -0,0 +1,191 @@
+import threading
+from collections import namedtuple
+from functools import lru_cache
+import numpy as np
+
+from dct import _compute_d
+from pruned_dct import pruned_forward, pruned_inverse
+
+# Handling of the flat blocks: "off" transforms every block, "constant" rebuilds the constant blocks from their
+# value (bit-identical to the full transform), "low_energy" also rebuilds the blocks with a low energy from their
+# mean or their first coefficients, within one gray level of the full transform
+FLAT_MODES = ("off", "constant", "low_energy")
+DEFAULT_FLAT_MODE = "constant"
+
+# Orders of the low order route: 1 rebuilds a block from its mean, 2 from its coefficients with k < 2 and l < 2
+LOW_ORDERS = (1, 2)
+
+# Largest error (in gray levels) of the low order route before rounding, kept below 1
+# so that the rounded result is within one gray level of the full transform
+ERROR_MARGIN = 0.99
+
+FlatBlocks = namedtuple("FlatBlocks", ["constant", "values", "orders", "sums", "n_flat"])
+
+
+class FlatBlockStats:
+    """
+    Number of blocks of every route, accumulated by classify_blocks since the last reset.
+
+    Only the blocks classified in this process are counted, not the ones of the workers of a process pool.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.constant = 0
+            self.low_order = 0
+            self.transformed = 0
+
+    def add(self, constant, low_order, transformed):
+        with self._lock:
+            self.constant += constant
+            self.low_order += low_order
+            self.transformed += transformed
+
+    @property
+    def total(self):
+        return self.constant + self.low_order + self.transformed
+
+    @property
+    def skipped_fraction(self):
+        """Fraction of the blocks that skipped the full transform."""
+        return (self.constant + self.low_order) / self.total if self.total else 0.0
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "constant": self.constant,
+                "low_order": self.low_order,
+                "transformed": self.transformed,
+                "skipped_fraction": self.skipped_fraction,
+            }
+
+
+# Counters of every classification, see FlatBlockStats
+stats = FlatBlockStats()
+
+
+@lru_cache(maxsize=64)
+def energy_limits(block_size, frequences_cut):
+    """
+    Largest energy sum((x - mean)^2) of a block rebuilt by each of the LOW_ORDERS, see classify_blocks.
+
+    The low order route drops the coefficients of the cut outside the k < m, l < m square, and the error on
+    a pixel (i, j) is bounded by sqrt(P[i, j]) times the square root of the energy of the block, where P[i, j]
+    is the sum of the squared basis functions of the dropped coefficients at (i, j). The limits keep this
+    bound below ERROR_MARGIN for every pixel.
+
+    Returns:
+        tuple: One limit per order, infinite when the order keeps every coefficient of the cut.
+    """
+    squared_basis = _compute_d(block_size, np.float64) ** 2
+    k, l = np.indices((block_size, block_size))
+    kept = k + l < frequences_cut
+
+    limits = []
+    for order in LOW_ORDERS:
+        dropped = (kept & ((k >= order) | (l >= order))).astype(np.float64)
+        # peak[i, j] = sum over the dropped (k, l) of D[k, i]^2 * D[l, j]^2
+        peak = (squared_basis.T @ dropped @ squared_basis).max()
+        limits.append(ERROR_MARGIN ** 2 / peak if peak > 1e-12 else np.inf)
+    return tuple(limits)
+
+
+def block_ranges(blocks):
+    """
+    Smallest and largest pixel of every block of a (..., block_size, block_size) tensor.
+
+    The rows and then the columns of the blocks are folded with element-wise minimum and maximum, which
+    reads a block view of an image with long vectorized passes instead of a reduction over tiny axes.
+    """
+    largest = blocks[..., 0, :].copy()
+    smallest = largest.copy()
+    for row in range(1, blocks.shape[-2]):
+        np.maximum(largest, blocks[..., row, :], out=largest)
+        np.minimum(smallest, blocks[..., row, :], out=smallest)
+
+    highest = largest[..., 0].copy()
+    lowest = smallest[..., 0].copy()
+    for column in range(1, blocks.shape[-1]):
+        np.maximum(highest, largest[..., column], out=highest)
+        np.minimum(lowest, smallest[..., column], out=lowest)
+    return lowest, highest
+
+
+def classify_blocks(blocks, frequences_cut, mode=DEFAULT_FLAT_MODE):
+    """
+    Find the blocks of a tensor of integer pixels that do not need the full transform.
+
+    Constant blocks are found from the range of their pixels. With mode "low_energy" the blocks whose range
+    allows a low energy get their exact energy, and go to the lowest order whose energy limit they meet.
+
+    Args:
+        blocks (np.ndarray): (..., block_size, block_size) tensor of integer pixels, such as a block view.
+        frequences_cut (int): Frequency threshold (d), at least 1.
+        mode (str): "constant" or "low_energy", see FLAT_MODES.
+
+    Returns:
+        FlatBlocks: constant mask and values, order of the low order route (0 for the full transform) and
+        sum of the pixels of every block, number of blocks that skip the full transform.
+    """
+    block_size = blocks.shape[-1]
+    lowest, highest = block_ranges(blocks)
+    ranges = highest - lowest
+    constant = ranges == 0
+    orders = np.zeros(ranges.shape, dtype=np.int8)
+    sums = None
+
+    if mode == "low_energy":
+        # Two pixels apart by r give an energy of at least r^2 / 2, only the blocks below the largest limit are checked
+        limits = energy_limits(block_size, frequences_cut)
+        candidates = ~constant & (ranges.astype(np.float64) ** 2 / 2 < limits[-1])
+        if candidates.any():
+            pixels = blocks[candidates].reshape(-1, block_size * block_size).astype(np.int64)
+            n_pixels = block_size * block_size
+            sums = np.zeros(ranges.shape, dtype=np.int64)
+            sums[candidates] = pixels.sum(axis=1)
+            # Exact energy times the number of pixels, in integers
+            scaled_energy = n_pixels * np.einsum("ij,ij->i", pixels, pixels) - sums[candidates] ** 2
+            candidate_orders = np.zeros(len(pixels), dtype=np.int8)
+            for order, limit in zip(reversed(LOW_ORDERS), reversed(limits)):
+                candidate_orders[scaled_energy < limit * n_pixels] = order
+            orders[candidates] = candidate_orders
+
+    n_constant = int(np.count_nonzero(constant))
+    n_low_order = int(np.count_nonzero(orders))
+    stats.add(n_constant, n_low_order, constant.size - n_constant - n_low_order)
+    return FlatBlocks(constant, highest, orders, sums, n_constant + n_low_order)
+
+
+def rebuild_flat_blocks(blocks, flat_blocks, frequences_cut, out, dtype=np.float64):
+    """
+    Write the rebuilt pixels of the blocks that skip the full transform into out, rounded and clipped.
+
+    Args:
+        blocks (np.ndarray): (..., block_size, block_size) tensor of pixels.
+        flat_blocks (FlatBlocks): Routes of the blocks, see classify_blocks.
+        frequences_cut (int): Frequency threshold (d).
+        out (np.ndarray): Tensor with the shape of blocks, the other blocks are left untouched.
+        dtype: Compute type of the low order route.
+    """
+    block_size = blocks.shape[-1]
+    # Clipped like the full transform, for the pixels outside [0, 255] of the types wider than uint8
+    values = np.clip(flat_blocks.values[flat_blocks.constant], 0, 255)
+    out[flat_blocks.constant] = values[:, np.newaxis, np.newaxis]
+
+    for order in LOW_ORDERS:
+        selected = flat_blocks.orders == order
+        if not selected.any():
+            continue
+        if order == 1:
+            # The DC coefficient alone rebuilds the mean of the block
+            rebuilt = np.around(flat_blocks.sums[selected] / (block_size * block_size))
+            out[selected] = np.clip(rebuilt, 0, 255)[:, np.newaxis, np.newaxis]
+        else:
+            pixels = blocks[selected].astype(dtype)
+            rebuilt = pruned_inverse(pruned_forward(pixels, frequences_cut, n_rows=order), block_size)
+            np.around(rebuilt, 0, out=rebuilt)
+            out[selected] = np.clip(rebuilt, 0, 255, out=rebuilt)
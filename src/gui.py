@@ -2,11 +2,26 @@ import tkinter as tk
 from tkinter import ttk
 from tkinter import filedialog as fd
 import os
-
-from compression_manager import compression
-from PIL import Image, ImageTk
-
-from custom_exceptions import InvalidBlockSizeError, InvalidFrequenciesNumberError
+import queue
+import threading
+import time
+
+from custom_exceptions import InvalidBlockSizeError, InvalidFrequenciesNumberError, CompressionCancelledError
+from lazy_import import lazy_module, preload
+
+# The numerical stack (numpy, scipy.fft, imageio) and PIL are imported in the background once the window
+# is shown, see GUI.run, instead of delaying its first appearance
+compression_manager = lazy_module("compression_manager")
+coefficient_cache = lazy_module("coefficient_cache")
+metrics_module = lazy_module("metrics")
+np = lazy_module("numpy")
+preview_module = lazy_module("preview")
+Image = lazy_module("PIL.Image")
+ImageTk = lazy_module("PIL.ImageTk")
+
+# Modules imported by the background thread, in the order of their first use
+PRELOADED_MODULES = ("numpy", "compression_manager", "scipy.fft", "imageio.v3", "preview", "coefficient_cache",
+                     "metrics", "PIL.Image", "PIL.ImageTk")
 
 class GUI:
     """GUI for image compression."""
@@ -26,9 +41,22 @@ class GUI:
         'error': ('TimesNewRoman', 16)
     }
 
+    # Interval (in milliseconds) between two checks of the background compression
+    POLL_INTERVAL = 50
+
     def __init__(self):
         self.root = tk.Tk()
         self.selected_file = None
+        # Messages sent by the background compression to the Tk main thread, as (job_id, kind, payload)
+        self.messages = queue.Queue()
+        self.job_id = 0
+        self.cancel_event = None
+        self.job_start_time = None
+        self.polling = False
+        # Forward DCT coefficients are reused when only d changes between two compressions,
+        # the cache is created by the first compression, see the cache property
+        self._cache = None
+        self.cache_lock = threading.Lock()
         self.setup_interface()
         self.max_size = (700, 700)
 
@@ -178,12 +206,34 @@ class GUI:
         )
         start_button.pack(side=tk.LEFT, padx=(0, 10))
         
+        self.cancel_button = ttk.Button(
+            button_frame,
+            text='Cancel',
+            command=self.cancel_compression,
+            state=tk.DISABLED
+        )
+        self.cancel_button.pack(side=tk.LEFT, padx=(0, 10))
+
         clear_button = ttk.Button(
             button_frame,
             text='Clear All',
             command=self.clear_all
         )
         clear_button.pack(side=tk.LEFT)
+
+        # Progress section
+        progress_frame = ttk.Frame(main_frame, style="BG.TFrame")
+        progress_frame.pack(fill=tk.X, pady=(15, 0))
+
+        self.progress_bar = ttk.Progressbar(progress_frame, orient=tk.HORIZONTAL, mode='determinate', maximum=100)
+        self.progress_bar.pack(fill=tk.X)
+
+        self.label_progress = ttk.Label(
+            progress_frame,
+            anchor="center",
+            style="BG_LABEL.TLabel"
+        )
+        self.label_progress.pack(fill=tk.X, pady=(5, 0))
         
         # IMAGES SECTION
 
@@ -243,53 +293,210 @@ class GUI:
 
 
     def start_compression(self):
-        """Validate compression parameters and compress the image."""
+        """Validate compression parameters and compress the image on a background worker."""
         f_value = self.f_entry.get().strip()
         d_value = self.d_entry.get().strip()
 
         try:
             f = int(f_value)
             d = int(d_value)
-            
-            self.label_errors.config(text = f"Starting compression with F={f}, d={d}, file={self.selected_file} ...", foreground=self.COLORS['text_primary'])            
-            self.label_errors.update()
-            
-            # Validate the F and d values
-            if d < 0 or d > 2*f-2:
-                self.label_errors.config(text=f"Invalid d value. Must be between 0 and {2*f-2}.", foreground=self.COLORS['error'])
-                return
-                
-            output_path = compression(self.selected_file, f, d)
-
-            # Check if the image exists and load it 
-            if self.selected_file:
-                original_image = Image.open(self.selected_file)
-                compressed_image = Image.open(output_path)
-
-                original_image.thumbnail(self.max_size)
-                compressed_image.thumbnail(self.max_size)
-
-            else:
-                self.label_errors.config(text="A problem occurred while loading the inserted file, please retry or change", foreground=self.COLORS['error'])
-
-            # Convert the images in a tkinter format
-            self.original_photo_tk = ImageTk.PhotoImage(original_image)
-            self.compressed_photo_tk = ImageTk.PhotoImage(compressed_image)
-            
-            # Load the images in the GUI
+        except ValueError:
+            self.label_errors.config(text="Invalid values. F and d must be integers.", foreground=self.COLORS['error'])
+            return
+
+        # Validate the F and d values
+        if d < 0 or d > 2*f-2:
+            self.label_errors.config(text=f"Invalid d value. Must be between 0 and {2*f-2}.", foreground=self.COLORS['error'])
+            return
+
+        if not self.selected_file:
+            self.label_errors.config(text="A problem occurred while loading the inserted file, please retry or change", foreground=self.COLORS['error'])
+            return
+
+        # A new job supersedes the one in flight, which stops at its next chunk of blocks
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+
+        self.job_id += 1
+        self.cancel_event = threading.Event()
+        self.job_start_time = time.perf_counter()
+
+        self.label_errors.config(text = f"Starting compression with F={f}, d={d}, file={self.selected_file} ...", foreground=self.COLORS['text_primary'])
+        self.progress_bar.configure(value=0)
+        self.label_progress.config(text="")
+        self.cancel_button.configure(state=tk.NORMAL)
+
+        worker = threading.Thread(
+            target=self.run_compression,
+            args=(self.job_id, self.selected_file, f, d, self.cancel_event),
+            daemon=True
+        )
+        worker.start()
+
+        if not self.polling:
+            self.polling = True
+            self.root.after(self.POLL_INTERVAL, self.poll_compression)
+
+    @property
+    def cache(self):
+        """Coefficient cache of the compressions, created at its first use."""
+        with self.cache_lock:
+            if self._cache is None:
+                self._cache = coefficient_cache.CoefficientCache()
+            return self._cache
+
+    def run_compression(self, job_id, file_path, f, d, cancel_event):
+        """Compress the image, running on the background worker: the results are sent to the main thread as messages."""
+
+        def progress(done_rows, total_rows):
+            self.messages.put((job_id, "progress", (done_rows, total_rows)))
+
+        try:
+            # Reduced resolution previews, from the DC coefficients up to the resolution of the display,
+            # are shown while the full resolution compression runs
+            original = compression_manager.read_image(file_path)
+            for order, preview in preview_module.previews(original, f, d, self.max_size):
+                if cancel_event.is_set():
+                    raise CompressionCancelledError
+                self.messages.put((job_id, "preview", (original, preview, order, f)))
+
+            # The coefficients are kept for the rate of the metrics, even when the cache cannot hold them
+            coefficients = self.cache.coefficients(file_path, f, progress, cancel_event)
+            compressed = self.cache.reconstruction(file_path, f, d, progress, cancel_event, coefficients)
+            compression_manager.save_image(compressed, file_path)
+            metrics = self.compute_metrics(original, compressed, coefficients[0], d, cancel_event)
+            self.messages.put((job_id, "done", (original, compressed, metrics)))
+
+        except CompressionCancelledError as e:
+            self.messages.put((job_id, "cancelled", e.msg))
+
+        except (InvalidBlockSizeError, InvalidFrequenciesNumberError) as e:
+            self.messages.put((job_id, "error", e.msg))
+
+        except (OSError, ValueError):
+            self.messages.put((job_id, "error", "A problem occurred while loading the inserted file, please retry or change"))
+
+        except Exception as e:
+            # Any other failure (MemoryError on a large image, for instance) must still end the job,
+            # otherwise the main thread keeps polling with the Cancel button enabled
+            self.messages.put((job_id, "error", f"The compression failed: {type(e).__name__}: {e}"))
+
+    def compute_metrics(self, original, compressed, coef_blocks, d, cancel_event):
+        """
+        Quality and rate of the compression, stopped by cancel_event between two steps.
+
+        The MSE and PSNR are computed at full resolution, the SSIM on the images at the size they are shown
+        (its gaussian filters would take several times the compression on a large image), and the rate of d only.
+        """
+        original = original[:compressed.shape[0], :compressed.shape[1]]
+        error = metrics_module.mse(original, compressed)
+        bpp = metrics_module.cut_bpp(coef_blocks, d, cancel_event=cancel_event)
+        if cancel_event.is_set():
+            raise CompressionCancelledError
+
+        size = self.display_size(compressed.shape)
+        ssim = metrics_module.ssim(self.display_pixels(original, size), self.display_pixels(compressed, size))
+        return metrics_module.Metrics(coef_blocks.shape[-1], d, error, metrics_module.psnr(original, compressed), ssim, bpp)
+
+    def poll_compression(self):
+        """Handle the messages of the background worker, ignoring the ones of superseded jobs."""
+        job_running = self.cancel_event is not None
+
+        while True:
+            try:
+                job_id, kind, payload = self.messages.get_nowait()
+            except queue.Empty:
+                break
+
+            if job_id != self.job_id:
+                continue
+
+            if kind == "progress":
+                self.show_progress(*payload)
+            elif kind == "preview":
+                self.show_preview(*payload)
+            elif kind == "done":
+                self.show_images(*payload)
+                job_running = False
+            elif kind == "cancelled":
+                self.label_errors.config(text=payload, foreground=self.COLORS['text_primary'])
+                job_running = False
+            elif kind == "error":
+                self.label_errors.config(text=payload, foreground=self.COLORS['error'])
+                job_running = False
+
+        if job_running:
+            self.root.after(self.POLL_INTERVAL, self.poll_compression)
+        else:
+            self.polling = False
+            self.cancel_event = None
+            self.cancel_button.configure(state=tk.DISABLED)
+
+    def show_progress(self, done_rows, total_rows):
+        """Show the fraction of block rows done, the elapsed time and the throughput."""
+        elapsed_time = time.perf_counter() - self.job_start_time
+        self.progress_bar.configure(value=100 * done_rows / total_rows)
+        self.label_progress.config(
+            text=f"{done_rows}/{total_rows} block rows - {elapsed_time:.2f} s - {done_rows / max(elapsed_time, 1e-9):.0f} rows/s"
+        )
+
+    def display_size(self, shape):
+        """Size (width, height) of an image of the given shape in the window, see preview.display_size."""
+        return preview_module.display_size(shape, self.max_size)
+
+    def display_pixels(self, pixels, size):
+        """Pixels reduced to size (width, height) with a box filter, or unchanged when they already fit."""
+        if pixels.shape[1] <= size[0] and pixels.shape[0] <= size[1]:
+            return pixels
+        return np.asarray(Image.fromarray(pixels).resize(size, Image.BOX))
+
+    def photo_image(self, pixels, size):
+        """Tkinter image of an array of pixels, resized to size (width, height) without touching the disk."""
+        image = Image.fromarray(pixels)
+        if image.width > size[0] or image.height > size[1]:
+            image.thumbnail(size)
+        else:
+            image = image.resize(size, Image.BILINEAR)
+        return ImageTk.PhotoImage(image)
+
+    def show_preview(self, original, preview, order, f):
+        """Show the original image and a reduced resolution preview of the compressed one."""
+        if order == 1:
+            self.original_photo_tk = self.photo_image(original, self.display_size(original.shape))
             self.label_original_image.configure(image=self.original_photo_tk)
-            self.label_compressed_image.configure(image=self.compressed_photo_tk)    
-            
-            self.label_errors.config(text = "The Image has been compressed !", foreground=self.COLORS['text_primary'])
 
-        except InvalidBlockSizeError as e:
-            self.label_errors.config(text=e.msg, foreground=self.COLORS['error'])
-        
-        except InvalidFrequenciesNumberError as e:
-            self.label_errors.config(text=e.msg, foreground=self.COLORS['error'])
+        # The preview is stretched to the size of the final image
+        size = self.display_size((preview.shape[0] * f // order, preview.shape[1] * f // order))
+        self.compressed_photo_tk = self.photo_image(preview, size)
+        self.label_compressed_image.configure(image=self.compressed_photo_tk)
+        resolution = "DC coefficients" if order == 1 else f"{order}x{order} coefficients"
+        self.label_progress.config(text=f"Preview at {order}/{f} of the resolution ({resolution}) ...")
+
+    def show_images(self, original, compressed, metrics):
+        """Show the original and the compressed image in the GUI."""
+        elapsed_time = time.perf_counter() - self.job_start_time
+        megapixels = compressed.size / 1e6
+
+        # Convert the images in a tkinter format, straight from the arrays in memory
+        self.original_photo_tk = self.photo_image(original, self.display_size(original.shape))
+        self.compressed_photo_tk = self.photo_image(compressed, self.display_size(compressed.shape))
+
+        # Load the images in the GUI
+        self.label_original_image.configure(image=self.original_photo_tk)
+        self.label_compressed_image.configure(image=self.compressed_photo_tk)
+
+        self.progress_bar.configure(value=100)
+        self.label_progress.config(
+            text=f"{elapsed_time:.2f} s - {megapixels / max(elapsed_time, 1e-9):.2f} MP/s - "
+                 f"PSNR {metrics.psnr:.2f} dB - SSIM {metrics.ssim:.3f} (as shown) - {metrics.bpp:.2f} bpp (estimated)"
+        )
+        self.label_errors.config(text = "The Image has been compressed !", foreground=self.COLORS['text_primary'])
 
-        except ValueError:
-            self.label_errors.config(text="Invalid values. F and d must be integers.", foreground=self.COLORS['error'])
+    def cancel_compression(self):
+        """Stop the compression in flight between two chunks of blocks."""
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+            self.label_errors.config(text="Cancelling the compression ...", foreground=self.COLORS['text_primary'])
 
 
     def select_file(self):
@@ -312,6 +519,13 @@ class GUI:
 
     def clear_all(self):
         """Clear all inputs, selections, and displayed content."""
+
+        # Stop the compression in flight, its results are not shown anymore
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+        self.cancel_event = None
+        self.job_id += 1
+        self.cancel_button.configure(state=tk.DISABLED)
         
         # Clear file selection
         self.selected_file = None
@@ -323,6 +537,8 @@ class GUI:
         
         #Clear error/status messages
         self.label_errors.config(text="")
+        self.label_progress.config(text="")
+        self.progress_bar.configure(value=0)
         
         # Clear images
         self.label_original_image.configure(image="")
@@ -335,7 +551,9 @@ class GUI:
             del self.compressed_photo_tk         
 
     def run(self):
-        """Start the GUI main loop."""
+        """Show the window, then start the GUI main loop while the numerical stack is imported in the background."""
+        self.root.update()
+        preload(*PRELOADED_MODULES)
         self.root.mainloop()
 
 def load_gui():
@@ -0,0 +1,168 @@
+import threading
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+import numpy as np
+
+from compression_manager import (
+    block_view, check_frequences_cut, compress_blocks, compress_image, compute_dtype, count_blocks, resolve_backend,
+    CHUNK_BLOCKS, DEFAULT_BACKEND
+)
+
+# Number of previous runs kept, the least recently used ones are evicted first
+DEFAULT_MAX_ENTRIES = 8
+
+# Seed of the hash weights, fixed so that the hashes of a block are the same in every process
+HASH_SEED = 0x5DC7
+HASH_WORDS = 2
+
+IncrementalReport = namedtuple("IncrementalReport", ["reused", "recomputed", "full"])
+
+
+@lru_cache(maxsize=16)
+def hash_weights(block_size):
+    """Random odd 64-bit weights of the block hash, one column for every hash word."""
+    rng = np.random.default_rng(HASH_SEED)
+    weights = rng.integers(0, 2 ** 64, size=(block_size * block_size, HASH_WORDS), dtype=np.uint64, endpoint=False) | 1
+    weights.setflags(write=False)
+    return weights
+
+
+def hash_blocks(blocks):
+    """
+    128-bit multilinear hash of every block of a (..., block_size, block_size) uint8 tensor.
+
+    Every hash word is the sum of the pixels times random odd 64-bit weights, modulo 2^64:
+    two different blocks have the same hash with a probability below 2^-100.
+
+    Returns:
+        np.ndarray: (..., 2) uint64 array of the hashes.
+    """
+    block_size = blocks.shape[-1]
+    pixels = blocks.reshape(*blocks.shape[:-2], block_size * block_size).astype(np.uint64)
+    return pixels @ hash_weights(block_size)
+
+
+def block_hashes(image, block_size):
+    """Hashes of the whole blocks of an image, a chunk of block rows at a time to bound the memory of the 64-bit pixels."""
+    blocks = block_view(image, block_size)
+    blocks_per_row, blocks_per_column = blocks.shape[:2]
+    hashes = np.empty((blocks_per_row, blocks_per_column, HASH_WORDS), dtype=np.uint64)
+
+    rows_per_chunk = max(1, CHUNK_BLOCKS // blocks_per_column)
+    for first_row in range(0, blocks_per_row, rows_per_chunk):
+        rows = slice(first_row, first_row + rows_per_chunk)
+        hashes[rows] = hash_blocks(blocks[rows])
+    return hashes
+
+
+def dirty_blocks(dirty_rects, blocks_per_row, blocks_per_column, block_size):
+    """
+    Mask of the blocks touched by a list of (top, left, height, width) rectangles, in pixels.
+
+    Returns:
+        np.ndarray: (blocks_per_row, blocks_per_column) boolean mask.
+    """
+    mask = np.zeros((blocks_per_row, blocks_per_column), dtype=bool)
+    for top, left, height, width in dirty_rects:
+        if height <= 0 or width <= 0:
+            continue
+        first_row, first_column = max(0, top) // block_size, max(0, left) // block_size
+        last_row, last_column = -(-(top + height) // block_size), -(-(left + width) // block_size)
+        mask[first_row:last_row, first_column:last_column] = True
+    return mask
+
+
+class IncrementalCompressor:
+    """
+    Recompresses only the blocks of an image that changed since its previous run.
+
+    The blocks are independent, so after a local edit only the blocks it touches need a new transform: the
+    changed blocks are found by comparing the block hashes with the ones of the previous run (or taken from
+    a list of dirty rectangles), transformed in a single batch, and patched into a copy of the previous output.
+    The result is bit-identical to a full compression with the same backend.
+
+    Args:
+        max_entries (int): Number of previous runs kept, keyed by (key, F, d).
+        backend (str): Name of the DCT backend used for the transforms.
+        precision (str): "float32" or "float64", see compute_dtype.
+
+    Notes:
+        - Only gray-scale images cut to whole blocks (padding "crop") are supported.
+        - The returned images are read-only, since they are the base of the next run.
+        - With the "auto" backend the changed blocks use the backend picked for the whole image, see resolve_backend.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, backend=DEFAULT_BACKEND, precision=None):
+        self.max_entries = max_entries
+        self.backend = backend
+        self.precision = precision
+        self.last_report = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def compress(self, image, block_size, frequences_cut, key=None, dirty_rects=None):
+        """
+        Compress a gray-scale image, reusing the blocks of the previous run with the same key, F and d.
+
+        Args:
+            image (np.ndarray): 2D uint8 image.
+            block_size (int): Size of the square blocks (F).
+            frequences_cut (int): Frequency threshold (d).
+            key: Identifier of the image across runs, such as its path.
+            dirty_rects (list): (top, left, height, width) rectangles holding every change since the previous run,
+                the block hashes are compared when it is not given.
+
+        Returns:
+            tuple: The compressed (uint8) image, cut to whole blocks, and the IncrementalReport of the run.
+        """
+        check_frequences_cut(block_size, frequences_cut)
+        blocks_per_row, blocks_per_column = count_blocks(*image.shape, block_size)
+        n_blocks = blocks_per_row * blocks_per_column
+        backend = resolve_backend(self.backend, block_size, n_blocks, compute_dtype(image.dtype, self.precision), frequences_cut)
+
+        entry_key = (key, block_size, frequences_cut)
+        with self._lock:
+            previous = self._entries.get(entry_key)
+            if previous is not None:
+                self._entries.move_to_end(entry_key)
+        if previous is not None and previous[0].shape[:2] != (blocks_per_row, blocks_per_column):
+            previous = None
+
+        if previous is None:
+            hashes = block_hashes(image, block_size)
+            final_image = compress_image(image, block_size, frequences_cut, backend=backend, precision=self.precision)
+            report = IncrementalReport(0, n_blocks, True)
+        else:
+            previous_hashes, previous_image = previous
+            blocks = block_view(image, block_size)
+            if dirty_rects is None:
+                hashes = block_hashes(image, block_size)
+                changed = np.any(hashes != previous_hashes, axis=-1)
+            else:
+                changed = dirty_blocks(dirty_rects, blocks_per_row, blocks_per_column, block_size)
+                hashes = previous_hashes.copy()
+                hashes[changed] = hash_blocks(blocks[changed])
+
+            # The changed blocks are gathered in a single tensor, and rebuilt straight into their place in the output
+            final_image = previous_image.copy()
+            changed_blocks = blocks[changed]
+            if len(changed_blocks):
+                rebuilt_blocks = compress_blocks(
+                    changed_blocks, frequences_cut, backend, self.precision,
+                    out=np.empty(changed_blocks.shape, dtype=np.uint8)
+                )
+                block_view(final_image, block_size)[changed] = rebuilt_blocks
+            report = IncrementalReport(n_blocks - len(changed_blocks), len(changed_blocks), False)
+
+        final_image.setflags(write=False)
+        with self._lock:
+            self._entries[entry_key] = (hashes, final_image)
+            self._entries.move_to_end(entry_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self.last_report = report
+        return final_image, report
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,247 @@
+import contextvars
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import namedtuple
+from contextlib import contextmanager, nullcontext
+
+# Profiling switch of the calls that do not choose explicitly: unset, "" or "0" leaves profiling off,
+# "1" turns it on, any other value turns it on and is the path where every report is exported (see export_path),
+# in Chrome trace format when it ends with ".trace.json", as a JSON report otherwise
+ENV_VARIABLE = "IMAGE_COMPRESSOR_PROFILE"
+CHROME_TRACE_SUFFIX = ".trace.json"
+
+Stage = namedtuple(
+    "Stage",
+    ["name", "depth", "start", "wall", "cpu", "peak_bytes", "allocated_bytes", "allocated_blocks", "thread"]
+)
+
+# Profiler of the running call, stages outside a profiled call are not recorded
+_current = contextvars.ContextVar("profiler", default=None)
+_NULL_STAGE = nullcontext()
+# Report of the last profiled call of every thread (and asyncio task), so that concurrent calls do not overwrite it
+_last_report = contextvars.ContextVar("last_report", default=None)
+# Number of the reports exported by this process, part of their file names
+_export_counter = itertools.count(1)
+
+
+class ProfileReport:
+    """
+    Stages recorded by a Profiler.
+
+    Every stage has its wall-clock and CPU time (of the whole process, so that the work of a pool of threads is
+    included), the peak of the memory traced by tracemalloc above its starting level, the net traced bytes and the
+    net number of blocks of the Python allocator it left allocated. Nested stages are included in their parents.
+    """
+
+    def __init__(self, stages, wall):
+        self.stages = stages
+        self.wall = wall
+
+    def totals(self):
+        """Stages aggregated by name, in order of first appearance, as {name: {count, wall, cpu, peak_bytes}}."""
+        totals = {}
+        for stage in self.stages:
+            total = totals.setdefault(stage.name, {"count": 0, "wall": 0.0, "cpu": 0.0, "peak_bytes": 0})
+            total["count"] += 1
+            total["wall"] += stage.wall
+            total["cpu"] += stage.cpu
+            total["peak_bytes"] = max(total["peak_bytes"], stage.peak_bytes)
+        return totals
+
+    def to_dict(self):
+        return {"wall": self.wall, "stages": [stage._asdict() for stage in self.stages], "totals": self.totals()}
+
+    def to_json(self, path=None):
+        """Return the report in JSON format, writing it in path when given."""
+        return _dump(self.to_dict(), path)
+
+    def to_chrome_trace(self, path=None):
+        """Return the stages in Chrome trace format (chrome://tracing, Perfetto), writing them in path when given."""
+        events = [
+            {
+                "name": stage.name,
+                "cat": "compression",
+                "ph": "X",
+                "ts": stage.start * 1e6,
+                "dur": stage.wall * 1e6,
+                "pid": os.getpid(),
+                "tid": stage.thread,
+                "args": {
+                    "cpu_ms": stage.cpu * 1e3,
+                    "peak_bytes": stage.peak_bytes,
+                    "allocated_bytes": stage.allocated_bytes,
+                    "allocated_blocks": stage.allocated_blocks,
+                },
+            }
+            for stage in self.stages
+        ]
+        return _dump({"traceEvents": events, "displayTimeUnit": "ms"}, path)
+
+    def __str__(self):
+        lines = [f"{'stage':<12}{'count':>6}{'wall ms':>11}{'cpu ms':>11}{'peak MB':>10}"]
+        for name, total in self.totals().items():
+            lines.append(
+                f"{name:<12}{total['count']:>6}{total['wall'] * 1e3:>11.3f}{total['cpu'] * 1e3:>11.3f}"
+                f"{total['peak_bytes'] / 1e6:>10.2f}"
+            )
+        lines.append(f"{'total':<12}{'':>6}{self.wall * 1e3:>11.3f}")
+        return "\n".join(lines)
+
+
+class Profiler:
+    """
+    Records the stages of the calls profiled with it, see profiling.
+
+    Args:
+        memory (bool): Whether to trace the memory with tracemalloc, which slows down the allocations.
+
+    Notes:
+        - Stages are recorded only in the thread (or task) running the profiled call: the work handed to a pool
+          is measured by the stage that waits for it.
+    """
+
+    def __init__(self, memory=True):
+        self.memory = memory
+        self.stages = []
+        self._stack = []
+        self._origin = time.perf_counter()
+        self._started_tracing = False
+
+    @contextmanager
+    def stage(self, name):
+        parent_peak = self._memory_peak()
+        frame = {"peak": 0}
+        self._stack.append(frame)
+        current_bytes = self._memory_current()
+        blocks = sys.getallocatedblocks()
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - start_wall, time.process_time() - start_cpu
+            peak = max(self._memory_peak(), frame["peak"])
+            self._stack.pop()
+            if self._stack:
+                # The parent stage keeps the highest peak of its children
+                self._stack[-1]["peak"] = max(self._stack[-1]["peak"], parent_peak, peak)
+
+            self.stages.append(Stage(
+                name, len(self._stack), start_wall - self._origin, wall, cpu,
+                max(0, peak - current_bytes), self._memory_current() - current_bytes,
+                sys.getallocatedblocks() - blocks, threading.get_ident()
+            ))
+
+    def report(self):
+        stages = sorted(self.stages, key=lambda stage: stage.start)
+        return ProfileReport(stages, time.perf_counter() - self._origin)
+
+    def _start(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def _stop(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def _memory_current(self):
+        return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+    def _memory_peak(self):
+        # The peak is reset at every stage boundary, so that each stage measures its own
+        if not tracemalloc.is_tracing():
+            return 0
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        return peak
+
+
+def stage(name):
+    """Context manager recording a stage in the profiler of the running call, a shared no-op when profiling is off."""
+    profiler = _current.get()
+    if profiler is None:
+        return _NULL_STAGE
+    return profiler.stage(name)
+
+
+def resolve_profiler(profile=None):
+    """
+    Profiler of a call.
+
+    Args:
+        profile: None follows the IMAGE_COMPRESSOR_PROFILE environment variable, False and True turn profiling off
+            and on, a Profiler records the stages in it.
+    """
+    if isinstance(profile, Profiler):
+        return profile
+    if profile is None:
+        profile = os.environ.get(ENV_VARIABLE, "") not in ("", "0")
+    return Profiler() if profile else None
+
+
+@contextmanager
+def profiling(profile=None):
+    """
+    Profile the calls made inside the block, see resolve_profiler.
+
+    The report is available from last_report() once the block ends, in the same thread, and it is
+    exported to the path set in the IMAGE_COMPRESSOR_PROFILE environment variable, if any, see export_path.
+    Passing a Profiler is the most reliable way of getting the report of a given call.
+    """
+    profiler = resolve_profiler(profile)
+    if profiler is None or _current.get() is not None:
+        # Profiling is off, or this call is part of a call that is already profiled
+        yield profiler
+        return
+
+    token = _current.set(profiler)
+    profiler._start()
+    try:
+        yield profiler
+    finally:
+        profiler._stop()
+        _current.reset(token)
+        report = profiler.report()
+        _last_report.set(report)
+        _export(report)
+
+
+def last_report():
+    """ProfileReport of the last profiled call of the current thread (or asyncio task), or None."""
+    return _last_report.get()
+
+
+def export_path(path):
+    """
+    Path of an exported report: the process id and the number of the report are inserted before the extension,
+    so that the reports of several calls and of the workers of a pool do not overwrite each other.
+
+    For example compression.trace.json becomes compression.<pid>-<n>.trace.json.
+    """
+    suffix = CHROME_TRACE_SUFFIX if path.endswith(CHROME_TRACE_SUFFIX) else os.path.splitext(path)[1]
+    return f"{path[:len(path) - len(suffix)]}.{os.getpid()}-{next(_export_counter)}{suffix}"
+
+
+def _export(report):
+    path = os.environ.get(ENV_VARIABLE, "")
+    if path in ("", "0", "1"):
+        return
+    path = export_path(path)
+    if path.endswith(CHROME_TRACE_SUFFIX):
+        report.to_chrome_trace(path)
+    else:
+        report.to_json(path)
+
+
+def _dump(data, path):
+    text = json.dumps(data, indent=2)
+    if path is not None:
+        with open(path, "w") as output_file:
+            output_file.write(text)
+    return text
@@ -0,0 +1,71 @@
+import importlib
+import sys
+import threading
+
+
+class LazyModule:
+    """
+    Module imported at the first access to one of its attributes.
+
+    Heavy dependencies (scipy.fft, imageio, PIL, matplotlib) take hundreds of milliseconds to import,
+    which dominates the start of the GUI and of short-lived worker processes: with
+    `iio = lazy_module("imageio.v3")` the cost is only paid by the code that reads an image.
+
+    Args:
+        name (str): Absolute name of the module, such as "scipy.fft".
+    """
+
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def load(self):
+        """Import the module, if needed, and return it."""
+        module = self.__dict__["_module"]
+        if module is None:
+            module = importlib.import_module(self._name)
+            self.__dict__["_module"] = module
+        return module
+
+    @property
+    def loaded(self):
+        return self.__dict__["_module"] is not None or self._name in sys.modules
+
+    def __getattr__(self, attribute):
+        return getattr(self.load(), attribute)
+
+    def __setattr__(self, attribute, value):
+        # unittest.mock.patch and friends set the attributes of the real module
+        setattr(self.load(), attribute, value)
+
+    def __delattr__(self, attribute):
+        delattr(self.load(), attribute)
+
+    def __dir__(self):
+        return dir(self.load())
+
+    def __repr__(self):
+        state = "loaded" if self.loaded else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_module(name):
+    """Return a LazyModule proxy of a module, or the module itself when it is already imported."""
+    module = sys.modules.get(name)
+    return module if module is not None else LazyModule(name)
+
+
+def preload(*names):
+    """
+    Import modules in a background daemon thread, so that they are ready by the time they are used.
+
+    Returns:
+        threading.Thread: The started thread.
+    """
+    def import_all():
+        for name in names:
+            importlib.import_module(name)
+
+    thread = threading.Thread(target=import_all, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,265 @@
+import argparse
+import sys
+from collections import namedtuple
+import numpy as np
+
+from codec import DEFAULT_QUANTIZATION_STEP
+from custom_exceptions import CompressionCancelledError
+from compression_manager import (
+    block_view, check_frequences_cut, count_blocks, compute_dtype, forward_blocks, reconstruct_blocks, merge_blocks,
+    DEFAULT_BACKEND
+)
+from lazy_import import lazy_module
+
+iio = lazy_module("imageio.v3")
+ndimage = lazy_module("scipy.ndimage")
+
+# Peak value of 8-bit pixels
+PEAK = 255.0
+
+# Gaussian window and stabilizing constants of SSIM (Wang et al., 2004)
+SSIM_SIGMA = 1.5
+SSIM_TRUNCATE = 3.5
+SSIM_K1 = 0.01
+SSIM_K2 = 0.03
+
+# Block sizes tried by the parameters search
+SEARCH_BLOCK_SIZES = (4, 8, 16, 32)
+
+Metrics = namedtuple("Metrics", ["block_size", "frequences_cut", "mse", "psnr", "ssim", "bpp"])
+
+
+def mse(original, compressed):
+    """Mean squared error between two images of the same shape."""
+    difference = original.astype(np.float64) - compressed
+    return float(np.mean(difference * difference))
+
+
+def psnr(original, compressed, peak=PEAK):
+    """Peak signal to noise ratio (in dB), infinite for identical images."""
+    error = mse(original, compressed)
+    return float("inf") if error == 0 else float(10 * np.log10(peak * peak / error))
+
+
+def ssim(original, compressed, peak=PEAK):
+    """
+    Mean structural similarity between two gray-scale images, with an 11x11 gaussian window (sigma 1.5).
+
+    Every local statistic is computed for all the pixels at once with separable gaussian filters.
+    """
+    x = original.astype(np.float64)
+    y = compressed.astype(np.float64)
+
+    def local_mean(values):
+        return ndimage.gaussian_filter(values, SSIM_SIGMA, truncate=SSIM_TRUNCATE)
+
+    mean_x, mean_y = local_mean(x), local_mean(y)
+    variance_x = local_mean(x * x) - mean_x * mean_x
+    variance_y = local_mean(y * y) - mean_y * mean_y
+    covariance = local_mean(x * y) - mean_x * mean_y
+
+    c1, c2 = (SSIM_K1 * peak) ** 2, (SSIM_K2 * peak) ** 2
+    ssim_map = ((2 * mean_x * mean_y + c1) * (2 * covariance + c2)) / (
+        (mean_x * mean_x + mean_y * mean_y + c1) * (variance_x + variance_y + c2)
+    )
+    return float(ssim_map.mean())
+
+
+def forward_coefficients(image, block_size, backend=DEFAULT_BACKEND, precision=None):
+    """
+    Forward DCT of the whole blocks of a gray-scale image, the single transform shared by every value of d.
+
+    Returns:
+        tuple: (n_blocks, block_size, block_size) coefficients tensor, blocks_per_row, blocks_per_column.
+    """
+    blocks_per_row, blocks_per_column = count_blocks(*image.shape, block_size)
+    coef_blocks = block_view(image, block_size).astype(compute_dtype(image.dtype, precision))
+    coef_blocks = forward_blocks(coef_blocks.reshape(-1, block_size, block_size), backend, overwrite=True)
+    return coef_blocks, blocks_per_row, blocks_per_column
+
+
+def rate_distortion_curve(coef_blocks, quantization_step=DEFAULT_QUANTIZATION_STEP):
+    """
+    Predicted distortion and estimated rate of every frequences cut, from the forward coefficients alone.
+
+    The DCT is orthonormal, so the squared error of a cut equals the energy of the coefficients it removes
+    (Parseval): the energy of every diagonal k + l is summed once, and the error of every d follows from a
+    cumulative sum. The rate is the zeroth order entropy of the quantized coefficients of every diagonal,
+    an estimate of the size of the .dctc container.
+
+    Args:
+        coef_blocks (np.ndarray): (n_blocks, F, F) coefficients tensor.
+        quantization_step (float): Step of the quantizer of the coefficients, see codec.encode.
+
+    Returns:
+        tuple: mse and bpp arrays indexed by d, from 0 to 2F - 2. The mse leaves out the rounding of the pixels.
+    """
+    block_size = coef_blocks.shape[-1]
+    n_pixels = coef_blocks.size
+    diagonals = np.add.outer(np.arange(block_size), np.arange(block_size)).ravel()
+    n_diagonals = 2 * block_size - 1
+
+    coefficients = coef_blocks.reshape(len(coef_blocks), -1)
+    energy = np.einsum("ij,ij->j", coefficients, coefficients, dtype=np.float64)
+    diagonal_energy = np.bincount(diagonals, weights=energy, minlength=n_diagonals)
+
+    # Energy removed by every cut: the diagonals from d onwards
+    removed_energy = np.cumsum(diagonal_energy[::-1])[::-1]
+    mse_curve = removed_energy / n_pixels
+
+    diagonal_bits = [_diagonal_bits(coefficients[:, diagonals == diagonal], quantization_step) for diagonal in range(n_diagonals)]
+
+    # Bits kept by every cut: the diagonals before d
+    kept_bits = np.concatenate([[0.0], np.cumsum(diagonal_bits)])
+    bpp_curve = kept_bits[:n_diagonals] / n_pixels
+    return mse_curve, bpp_curve
+
+
+def cut_bpp(coef_blocks, frequences_cut, quantization_step=DEFAULT_QUANTIZATION_STEP, cancel_event=None):
+    """
+    Estimated rate of a single frequences cut, see rate_distortion_curve: only the kept diagonals are quantized.
+
+    Args:
+        cancel_event (threading.Event): When it is set, CompressionCancelledError is raised before the next diagonal.
+    """
+    block_size = coef_blocks.shape[-1]
+    diagonals = np.add.outer(np.arange(block_size), np.arange(block_size)).ravel()
+    coefficients = coef_blocks.reshape(len(coef_blocks), -1)
+
+    kept_bits = 0.0
+    for diagonal in range(min(frequences_cut, 2 * block_size - 1)):
+        if cancel_event is not None and cancel_event.is_set():
+            raise CompressionCancelledError
+        kept_bits += _diagonal_bits(coefficients[:, diagonals == diagonal], quantization_step)
+    return float(kept_bits / coef_blocks.size)
+
+
+def _diagonal_bits(coefficients, quantization_step):
+    # Zeroth order entropy (in bits) of the quantized coefficients of a diagonal
+    values = np.rint(coefficients / quantization_step).astype(np.int64).ravel()
+    counts = np.bincount(values - values.min())
+    counts = counts[counts > 0]
+    probabilities = counts / len(values)
+    return -(counts * np.log2(probabilities)).sum()
+
+
+def evaluate(image, block_size, frequences_cut, coefficients=None, backend=DEFAULT_BACKEND, precision=None):
+    """
+    Metrics of the compression of a gray-scale image.
+
+    Args:
+        image (np.ndarray): 2D uint8 image.
+        block_size (int): Size of the square blocks (F).
+        frequences_cut (int): Frequency threshold (d).
+        coefficients (tuple): Result of forward_coefficients for this image and F, reused instead of a new transform.
+
+    Returns:
+        Metrics: mse, psnr and ssim of the reconstruction against the image cut to whole blocks,
+        and estimated bits per pixel.
+    """
+    check_frequences_cut(block_size, frequences_cut)
+    if coefficients is None:
+        coefficients = forward_coefficients(image, block_size, backend, precision)
+    _, bpp_curve = rate_distortion_curve(coefficients[0])
+    return _reconstruction_metrics(image, coefficients, frequences_cut, bpp_curve, backend)
+
+
+def compression_metrics(original, compressed, coef_blocks, frequences_cut, bpp_curve=None):
+    """
+    Metrics of a compression run.
+
+    Args:
+        original (np.ndarray): 2D uint8 image, cut to the shape of the compressed one.
+        compressed (np.ndarray): 2D uint8 compressed image.
+        coef_blocks (np.ndarray): (n_blocks, F, F) forward coefficients of the image, used for the rate.
+        frequences_cut (int): Frequency threshold (d).
+        bpp_curve (np.ndarray): Rate of every d, see rate_distortion_curve, computed when not given.
+    """
+    original = original[:compressed.shape[0], :compressed.shape[1]]
+    if bpp_curve is None:
+        _, bpp_curve = rate_distortion_curve(coef_blocks)
+
+    return Metrics(
+        coef_blocks.shape[-1], frequences_cut, mse(original, compressed), psnr(original, compressed),
+        ssim(original, compressed), float(bpp_curve[frequences_cut])
+    )
+
+
+def _reconstruction_metrics(image, coefficients, frequences_cut, bpp_curve, backend):
+    coef_blocks, blocks_per_row, blocks_per_column = coefficients
+    compressed = merge_blocks(reconstruct_blocks(coef_blocks, frequences_cut, backend=backend), blocks_per_row, blocks_per_column)
+    return compression_metrics(image, compressed, coef_blocks, frequences_cut, bpp_curve)
+
+
+def search_parameters(image, target_psnr=None, target_bpp=None, block_sizes=SEARCH_BLOCK_SIZES, backend=DEFAULT_BACKEND,
+                      precision=None):
+    """
+    Find the (F, d) pair that best meets a target quality or size, with a single forward transform per F.
+
+    Every d of a block size is ranked with rate_distortion_curve. With target_psnr the smallest d whose predicted
+    PSNR reaches the target is checked against the real reconstruction (moving to the next d while it falls short),
+    and the pair with the lowest rate wins. With target_bpp the largest d within the rate wins, by real PSNR.
+
+    Args:
+        image (np.ndarray): 2D uint8 image.
+        target_psnr (float): Minimum PSNR (in dB).
+        target_bpp (float): Maximum estimated bits per pixel, the size of the image is target_bpp * pixels / 8 bytes.
+        block_sizes (tuple): Candidate values of F, the ones larger than the image are skipped.
+
+    Returns:
+        Metrics: The metrics of the best pair, or None if no pair meets the target.
+    """
+    if (target_psnr is None) == (target_bpp is None):
+        raise ValueError("Exactly one of target_psnr and target_bpp must be given")
+
+    candidates = []
+    for block_size in block_sizes:
+        if min(image.shape) < block_size:
+            continue
+        coefficients = forward_coefficients(image, block_size, backend, precision)
+        mse_curve, bpp_curve = rate_distortion_curve(coefficients[0])
+
+        if target_psnr is not None:
+            predicted_psnr = 10 * np.log10(PEAK * PEAK / np.maximum(mse_curve, 1e-12))
+            reached = np.flatnonzero(predicted_psnr >= target_psnr)
+            frequences_cut = int(reached[0]) if len(reached) else len(mse_curve) - 1
+            metrics = _reconstruction_metrics(image, coefficients, frequences_cut, bpp_curve, backend)
+            while metrics.psnr < target_psnr and frequences_cut < len(mse_curve) - 1:
+                frequences_cut += 1
+                metrics = _reconstruction_metrics(image, coefficients, frequences_cut, bpp_curve, backend)
+            if metrics.psnr >= target_psnr:
+                candidates.append(metrics)
+        else:
+            within = np.flatnonzero(bpp_curve <= target_bpp)
+            if len(within):
+                candidates.append(_reconstruction_metrics(image, coefficients, int(within[-1]), bpp_curve, backend))
+
+    if not candidates:
+        return None
+    if target_psnr is not None:
+        return min(candidates, key=lambda metrics: metrics.bpp)
+    return max(candidates, key=lambda metrics: metrics.psnr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find the block size and frequences cut meeting a target quality or size.")
+    parser.add_argument("image", help="Path of the image, compressed in gray-scale")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--target-psnr", type=float, help="Minimum PSNR in dB")
+    target.add_argument("--target-bpp", type=float, help="Maximum estimated bits per pixel")
+    parser.add_argument("--block-sizes", type=int, nargs="+", default=list(SEARCH_BLOCK_SIZES))
+    args = parser.parse_args(argv)
+
+    image = iio.imread(args.image, pilmode='L')
+    metrics = search_parameters(image, args.target_psnr, args.target_bpp, args.block_sizes)
+    if metrics is None:
+        print("No (F, d) pair meets the target")
+        return 1
+
+    print(f"F={metrics.block_size} d={metrics.frequences_cut}  PSNR {metrics.psnr:.2f} dB  SSIM {metrics.ssim:.4f}  "
+          f"MSE {metrics.mse:.2f}  {metrics.bpp:.3f} bpp (about {metrics.bpp * image.size / 8 / 1024:.1f} KiB)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+import os
+import timeit
+import numpy as np
+import imageio.v3 as iio
+
+from compression_manager import split_blocks, compress_blocks, parallel_compress_blocks
+from parallel_engine import EXECUTORS
+
+PATH_IMAGE = os.path.join("images", "640x640.bmp")
+
+# Sizes of the synthetic images, generated with a given seed (23) to grant reproducibility
+SYNTHETIC_SIZES = [2048, 4096]
+BLOCK_SIZE = 8
+FREQUENCES_CUT = 6
+REPEATS = 3
+
+
+def best_time(function, *args):
+    # Best of REPEATS runs, after a warm-up run that also starts the pools
+    function(*args)
+    return min(timeit.repeat(lambda: function(*args), number=1, repeat=REPEATS))
+
+
+def load_images():
+    images = {"640x640.bmp": iio.imread(PATH_IMAGE, pilmode='L')}
+    rng = np.random.default_rng(23)
+    for size in SYNTHETIC_SIZES:
+        images[f"synthetic {size}x{size}"] = rng.integers(0, 256, size=(size, size), dtype=np.uint8)
+    return images
+
+
+if __name__ == "__main__":
+    max_workers = os.cpu_count() or 1
+    print(f"Available cores: {max_workers}")
+    print(f"{'image':<22}{'executor':>10}{'workers':>9}{'time (s)':>12}{'speedup':>10}")
+
+    for image_name, image in load_images().items():
+        blocks = split_blocks(image, BLOCK_SIZE)
+        serial_result = compress_blocks(blocks, FREQUENCES_CUT)
+        serial_time = best_time(compress_blocks, blocks, FREQUENCES_CUT)
+        print(f"{image_name:<22}{'serial':>10}{1:>9}{serial_time:>12.5f}{1.0:>9.2f}x")
+
+        for executor in EXECUTORS:
+            for workers in range(1, max_workers + 1):
+                # A single chunk per worker, even when there is only one worker
+                chunk_size = -(-len(blocks) // workers)
+                result = parallel_compress_blocks(blocks, FREQUENCES_CUT, workers, chunk_size, executor)
+                assert np.array_equal(serial_result, result)
+
+                elapsed_time = best_time(parallel_compress_blocks, blocks, FREQUENCES_CUT, workers, chunk_size, executor)
+                print(f"{image_name:<22}{executor:>10}{workers:>9}{elapsed_time:>12.5f}{serial_time / elapsed_time:>9.2f}x")
@@ -0,0 +1,129 @@
+import atexit
+import concurrent.futures
+import numpy as np
+
+from lazy_import import lazy_module
+
+# The process pools and their shared memory are only imported by the "process" executor
+shared_memory = lazy_module("multiprocessing.shared_memory")
+
+# Supported executors: "thread" shares the block tensor between threads (the FFT releases the GIL),
+# "process" shares it between processes through shared memory, so that pixels are never pickled
+EXECUTORS = ("thread", "process")
+
+# Pools are reused between calls, keyed by (executor, workers)
+_pools = {}
+
+
+def get_pool(executor, workers):
+    """Return a reusable pool of the given kind and size."""
+    if executor not in EXECUTORS:
+        raise ValueError(f"Unknown executor {executor!r}, expected one of {EXECUTORS}")
+
+    key = (executor, workers)
+    if key not in _pools:
+        if executor == "thread":
+            pool_class = concurrent.futures.ThreadPoolExecutor
+        else:
+            pool_class = concurrent.futures.ProcessPoolExecutor
+        _pools[key] = pool_class(max_workers=workers)
+    return _pools[key]
+
+
+@atexit.register
+def shutdown_pools():
+    for pool in _pools.values():
+        pool.shutdown(wait=True, cancel_futures=True)
+    _pools.clear()
+
+
+def chunk_bounds(n_blocks, workers, chunk_size=None):
+    """
+    Split n_blocks into contiguous (start, end) chunks.
+
+    Args:
+        n_blocks (int): Number of blocks of the tensor.
+        workers (int): Number of workers, used to size the chunks when chunk_size is not given.
+        chunk_size (int): Number of blocks of every chunk (the last one may be smaller).
+
+    Returns:
+        list: (start, end) bounds of every chunk.
+    """
+    if chunk_size is None:
+        chunk_size = -(-n_blocks // workers)
+    chunk_size = max(1, chunk_size)
+    return [(start, min(start + chunk_size, n_blocks)) for start in range(0, n_blocks, chunk_size)]
+
+
+def map_chunks(function, blocks, out, args=(), workers=1, chunk_size=None, executor="thread"):
+    """
+    Apply function(blocks[start:end], *args) to every chunk of a block tensor, in parallel.
+
+    Args:
+        function (callable): Transform of a (n, F, F) tensor returning a tensor of the same shape.
+            With the "process" executor it must be a module level function.
+        blocks (np.ndarray): (n_blocks, F, F) input tensor.
+        out (np.ndarray): (n_blocks, F, F) output tensor, the results are cast to its dtype.
+        args (tuple): Extra positional arguments of function.
+        workers (int): Number of workers.
+        chunk_size (int): Number of blocks handed to a worker at a time.
+        executor (str): "thread" or "process".
+
+    Returns:
+        np.ndarray: The out tensor.
+
+    Notes:
+        - Every chunk is transformed exactly as it would be in a serial call, so the output is
+          bit-identical to function(blocks, *args).
+    """
+    bounds = chunk_bounds(len(blocks), workers, chunk_size)
+    pool = get_pool(executor, workers)
+
+    if executor == "thread":
+        futures = [pool.submit(_run_chunk, function, args, blocks, out, start, end) for start, end in bounds]
+        for future in futures:
+            future.result()
+        return out
+
+    # Input and output tensors are placed in shared memory, workers attach to them by name
+    input_memory = shared_memory.SharedMemory(create=True, size=max(1, blocks.nbytes))
+    output_memory = shared_memory.SharedMemory(create=True, size=max(1, out.nbytes))
+    try:
+        shared_blocks = np.ndarray(blocks.shape, dtype=blocks.dtype, buffer=input_memory.buf)
+        shared_blocks[...] = blocks
+
+        input_spec = (input_memory.name, blocks.shape, blocks.dtype.str)
+        output_spec = (output_memory.name, out.shape, out.dtype.str)
+        futures = [
+            pool.submit(_run_shared_chunk, function, args, input_spec, output_spec, start, end)
+            for start, end in bounds
+        ]
+        for future in futures:
+            future.result()
+
+        out[...] = np.ndarray(out.shape, dtype=out.dtype, buffer=output_memory.buf)
+        del shared_blocks
+    finally:
+        input_memory.close()
+        input_memory.unlink()
+        output_memory.close()
+        output_memory.unlink()
+
+    return out
+
+
+def _run_chunk(function, args, blocks, out, start, end):
+    np.copyto(out[start:end], function(blocks[start:end], *args), casting='unsafe')
+
+
+def _run_shared_chunk(function, args, input_spec, output_spec, start, end):
+    input_memory = shared_memory.SharedMemory(name=input_spec[0])
+    output_memory = shared_memory.SharedMemory(name=output_spec[0])
+    try:
+        blocks = np.ndarray(input_spec[1], dtype=input_spec[2], buffer=input_memory.buf)
+        out = np.ndarray(output_spec[1], dtype=output_spec[2], buffer=output_memory.buf)
+        _run_chunk(function, args, blocks, out, start, end)
+        del blocks, out
+    finally:
+        input_memory.close()
+        output_memory.close()
@@ -0,0 +1,93 @@
+import numpy as np
+
+from compression_manager import block_view, check_frequences_cut, count_blocks, compute_dtype
+from pruned_dct import pruned_forward, pruned_inverse
+
+# Largest size (width, height) of the images shown by the GUI
+DEFAULT_MAX_SIZE = (700, 700)
+
+
+def display_size(shape, max_size=DEFAULT_MAX_SIZE):
+    """(width, height) of an image of the given (rows, columns) shape shrunk to fit max_size, keeping its aspect ratio."""
+    rows, columns = shape[:2]
+    scale = min(1.0, max_size[0] / columns, max_size[1] / rows)
+    return max(1, round(columns * scale)), max(1, round(rows * scale))
+
+
+def preview_order(shape, block_size, max_size=DEFAULT_MAX_SIZE):
+    """
+    Number of pixels per block side of a preview that fills max_size: 1 keeps only the DC coefficients,
+    block_size is the full resolution.
+    """
+    blocks_per_row, blocks_per_column = count_blocks(*shape[:2], block_size)
+    max_width, max_height = max_size
+    order = min(-(-max_height // blocks_per_row), -(-max_width // blocks_per_column))
+    return int(np.clip(order, 1, block_size))
+
+
+def block_means(image, block_size):
+    """
+    Mean of every whole block of a gray-scale image, rounded: the DC-only reconstruction at 1 / F of its size.
+
+    The pixels are summed over the rows of every block row first, then over the columns, in two contiguous passes.
+    """
+    blocks_per_row, blocks_per_column = count_blocks(*image.shape, block_size)
+    cropped = image[:blocks_per_row * block_size, :blocks_per_column * block_size]
+    row_sums = cropped.reshape(blocks_per_row, block_size, -1).sum(axis=1, dtype=np.uint32)
+    sums = row_sums.reshape(blocks_per_row, blocks_per_column, block_size).sum(axis=2)
+    return np.around(sums / (block_size * block_size)).astype(np.uint8)
+
+
+def low_order_preview(image, block_size, frequences_cut, order=1, precision=None):
+    """
+    Reduced resolution reconstruction of the compression of a gray-scale image, at order / F of its size.
+
+    Every block is rebuilt with an order x order IDCT of its lowest coefficients (the ones kept by the cut):
+    with order 1 every block becomes the pixel of its DC coefficient (its mean), with order F the preview is the
+    compressed image itself. Only the order x order coefficients are computed, see pruned_dct.
+
+    Args:
+        image (np.ndarray): 2D uint8 image.
+        block_size (int): Size of the square blocks (F).
+        frequences_cut (int): Frequency threshold (d).
+        order (int): Pixels per block side of the preview, from 1 to F.
+        precision (str): "float32" or "float64", see compute_dtype.
+
+    Returns:
+        np.ndarray: (blocks_per_row * order, blocks_per_column * order) uint8 image.
+    """
+    check_frequences_cut(block_size, frequences_cut)
+    if not 1 <= order <= block_size:
+        raise ValueError(f"The order of the preview must be between 1 and {block_size}")
+
+    blocks = block_view(image, block_size)
+    blocks_per_row, blocks_per_column = blocks.shape[:2]
+    if frequences_cut == 0:
+        return np.zeros((blocks_per_row * order, blocks_per_column * order), dtype=np.uint8)
+
+    if order == 1:
+        return block_means(image, block_size)
+
+    blocks = blocks.astype(compute_dtype(image.dtype, precision))
+    coefficients = pruned_forward(blocks, frequences_cut, n_rows=order)
+
+    # The orthonormal DCT of a smaller block has its coefficients scaled by order / F
+    preview_blocks = pruned_inverse(coefficients, order)
+    preview_blocks *= order / block_size
+    np.around(preview_blocks, 0, out=preview_blocks)
+    np.clip(preview_blocks, 0, 255, out=preview_blocks)
+
+    preview = np.empty((blocks_per_row * order, blocks_per_column * order), dtype=np.uint8)
+    np.copyto(block_view(preview, order), preview_blocks, casting='unsafe')
+    return preview
+
+
+def previews(image, block_size, frequences_cut, max_size=DEFAULT_MAX_SIZE, precision=None):
+    """
+    Yield the previews of the compression of an image from the coarsest one to the one filling max_size:
+    the DC-only preview, then the low order preview at the resolution of the display, as (order, preview).
+    """
+    order = preview_order(image.shape, block_size, max_size)
+    yield 1, low_order_preview(image, block_size, frequences_cut, 1, precision)
+    if order > 1:
+        yield order, low_order_preview(image, block_size, frequences_cut, order, precision)
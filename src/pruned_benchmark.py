@@ -0,0 +1,87 @@
+import argparse
+import timeit
+import numpy as np
+
+from compression_manager import compress_blocks
+from dct_backends import available_backends
+from pruned_dct import PRUNED_CROSSOVER, pruned_reconstruction
+
+BLOCK_SIZES = (4, 8, 16, 32)
+N_BLOCKS = 4096
+REPEATS = 7
+
+# Minimum speedup of the pruned transform over the fastest full transform counted as a win
+MIN_SPEEDUP = 1.2
+
+
+def full_reconstruction(blocks, frequences_cut, backend="scipy"):
+    # Full transform of every coefficient, then the frequences cut, in the type of the blocks like the pruned one
+    return compress_blocks(blocks, frequences_cut, backend=backend, precision=blocks.dtype.name)
+
+
+def pruned_compression(blocks, frequences_cut):
+    # Same steps as compress_blocks (copy in the compute type, transform, rounding) with the pruned transform
+    rebuilt_blocks = pruned_reconstruction(blocks.copy(), frequences_cut, overwrite=True)
+    np.around(rebuilt_blocks, 0, out=rebuilt_blocks)
+    return np.clip(rebuilt_blocks, 0, 255, out=rebuilt_blocks)
+
+
+def best_time(function, *args):
+    # Best of REPEATS runs, after a warm-up run that fills the caches
+    function(*args)
+    return min(timeit.repeat(lambda: function(*args), number=1, repeat=REPEATS))
+
+
+def measure_crossovers(block_sizes=BLOCK_SIZES, n_blocks=N_BLOCKS, dtype=np.float32, verbose=True):
+    """
+    Time the pruned transform for every d of every block size, against the full FFT transform and the fastest
+    full transform of all the backends. The cost of a full transform does not depend on d, it is timed once.
+
+    Returns:
+        dict: Largest d of every block size up to which the pruned transform is at least MIN_SPEEDUP times
+        faster than the fastest full transform.
+    """
+    rng = np.random.default_rng(21)
+    crossovers = {}
+    for block_size in block_sizes:
+        blocks = rng.uniform(0, 255, size=(n_blocks, block_size, block_size)).astype(dtype)
+        full_times = {
+            backend: best_time(full_reconstruction, blocks, block_size, backend) for backend in available_backends(block_size)
+        }
+        fastest_time = min(full_times.values())
+        crossovers[block_size] = 0
+
+        for frequences_cut in range(1, 2 * block_size - 1):
+            # The rounding of the two transforms may differ by one on the pixels that fall on .5
+            difference = full_reconstruction(blocks, frequences_cut) - pruned_compression(blocks, frequences_cut)
+            assert np.abs(difference).max() <= 1
+
+            pruned_time = best_time(pruned_compression, blocks, frequences_cut)
+            speedup = fastest_time / pruned_time
+            if speedup >= MIN_SPEEDUP and crossovers[block_size] == frequences_cut - 1:
+                crossovers[block_size] = frequences_cut
+
+            if verbose:
+                kept = sum(1 for k in range(block_size) for l in range(block_size) if k + l < frequences_cut)
+                print(f"{block_size:>4}{frequences_cut:>4}{kept / block_size ** 2:>8.1%}{full_times['scipy'] * 1e3:>11.3f}"
+                      f"{fastest_time * 1e3:>13.3f}{pruned_time * 1e3:>12.3f}{full_times['scipy'] / pruned_time:>11.1f}x"
+                      f"{speedup:>12.1f}x")
+    return crossovers
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Full FFT against pruned low frequency transform, for every (F, d).")
+    parser.add_argument("--block-sizes", type=int, nargs="+", default=list(BLOCK_SIZES))
+    parser.add_argument("--blocks", type=int, default=N_BLOCKS, help="Number of blocks of every batch")
+    parser.add_argument("--precision", choices=["float32", "float64"], default="float32")
+    args = parser.parse_args(argv)
+
+    print(f"{'F':>4}{'d':>4}{'kept':>8}{'fft (ms)':>11}{'fastest (ms)':>13}{'pruned (ms)':>12}{'vs fft':>12}{'vs fastest':>13}")
+    crossovers = measure_crossovers(args.block_sizes, args.blocks, np.dtype(args.precision))
+    print(f"Measured crossovers: {crossovers}")
+    print(f"Crossovers in use:   { {size: PRUNED_CROSSOVER[args.precision].get(size) for size in args.block_sizes} }")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,120 @@
+from functools import lru_cache
+import numpy as np
+
+from dct import _compute_d
+
+# Largest frequences cut up to which the pruned transform is at least 1.2x faster than the fastest full transform,
+# for every compute type and block size, measured with pruned_benchmark.py on batches of 4096 blocks.
+# For F=4 (and F=8 in float32) the few large products of the pruned transform beat the small full transforms for every d,
+# while from F=16 on it only pays for the lower values of d, fewer of them in float64
+PRUNED_CROSSOVER = {
+    "float32": {4: 6, 8: 14, 16: 9, 32: 23},
+    "float64": {4: 6, 8: 5, 16: 8, 32: 8},
+}
+
+
+@lru_cache(maxsize=64)
+def pruned_basis(block_size, frequences_cut, dtype=np.float64):
+    """
+    First rows of the DCT basis needed by a frequences cut: the coefficients with k + l < d have k < d and l < d.
+
+    Returns:
+        np.ndarray: Read-only (min(d, F), F) slice of the basis of dct._compute_d.
+    """
+    n_rows = min(frequences_cut, block_size)
+    basis = np.ascontiguousarray(_compute_d(block_size, dtype)[:n_rows])
+    basis.setflags(write=False)
+    return basis
+
+
+@lru_cache(maxsize=64)
+def triangle_mask(n_rows, frequences_cut, dtype=np.float64):
+    """(n_rows, n_rows) mask of the k + l < d triangle, as 0 and 1 of the given type."""
+    mask = (np.add.outer(np.arange(n_rows), np.arange(n_rows)) < frequences_cut).astype(dtype)
+    mask.setflags(write=False)
+    return mask
+
+
+def use_pruned(block_size, frequences_cut, dtype=np.float32):
+    """
+    Whether the pruned transform is faster than the full one for (F, d) in the given type, see PRUNED_CROSSOVER.
+
+    Block sizes that were not measured keep the full transform: the crossover does not scale with F
+    (the pruned transform costs O(F^2 d) per block against O(F^2 log F) for the FFT), so it cannot be extrapolated.
+    """
+    crossover = PRUNED_CROSSOVER[np.dtype(dtype).name].get(block_size)
+    return crossover is not None and frequences_cut <= crossover
+
+
+def pruned_forward(blocks, frequences_cut, n_rows=None):
+    """
+    Forward DCT of the coefficients kept by a frequences cut only.
+
+    The d x F basis is applied to the rows and then to the columns of the blocks, each time as a single
+    matrix product over the whole batch, and the coefficients outside the k + l < d triangle are zeroed.
+
+    Args:
+        blocks (np.ndarray): (..., F, F) float tensor of pixels.
+        frequences_cut (int): Frequency threshold (d), at least 1.
+        n_rows (int): Number of rows and columns of coefficients to compute, by default all the ones the cut keeps.
+
+    Returns:
+        np.ndarray: (..., m, m) tensor of the transposed coefficients (indexed [l, k]), with m = min(d, F, n_rows).
+    """
+    block_size = blocks.shape[-1]
+    basis = pruned_basis(block_size, min(frequences_cut, n_rows or frequences_cut), blocks.dtype)
+    n_rows = len(basis)
+    leading_shape = blocks.shape[:-2]
+
+    # partial[..., i, l] = sum_j X[..., i, j] * D[l, j]
+    partial = blocks.reshape(-1, block_size) @ basis.T
+    # coefficients[..., l, k] = sum_i partial[..., i, l] * D[k, i]
+    partial = partial.reshape(-1, block_size, n_rows).swapaxes(1, 2).reshape(-1, block_size)
+    coefficients = (partial @ basis.T).reshape(*leading_shape, n_rows, n_rows)
+    coefficients *= triangle_mask(n_rows, frequences_cut, blocks.dtype)
+    return coefficients
+
+
+def pruned_inverse(coefficients, block_size, out=None):
+    """
+    Rebuild the (..., F, F) pixels of a tensor of truncated coefficients, see pruned_forward.
+
+    Args:
+        coefficients (np.ndarray): (..., m, m) tensor of the transposed coefficients.
+        block_size (int): Size of the square blocks (F).
+        out (np.ndarray): Contiguous (..., F, F) float tensor receiving the pixels.
+    """
+    n_rows = coefficients.shape[-1]
+    basis = pruned_basis(block_size, n_rows, coefficients.dtype)
+    leading_shape = coefficients.shape[:-2]
+
+    # partial[..., l, i] = sum_k C[..., k, l] * D[k, i]
+    partial = coefficients.reshape(-1, n_rows) @ basis
+    # pixels[..., i, j] = sum_l partial[..., l, i] * D[l, j]
+    partial = partial.reshape(-1, n_rows, block_size).swapaxes(1, 2).reshape(-1, n_rows)
+    if out is None:
+        return (partial @ basis).reshape(*leading_shape, block_size, block_size)
+    np.matmul(partial, basis, out=out.reshape(-1, block_size))
+    return out
+
+
+def pruned_reconstruction(blocks, frequences_cut, overwrite=False):
+    """
+    Frequences cut of a tensor of blocks through the pruned transforms, the same as a full DCT, cut and IDCT.
+
+    Args:
+        blocks (np.ndarray): (..., F, F) float tensor of pixels.
+        frequences_cut (int): Frequency threshold (d).
+        overwrite (bool): Whether the rebuilt pixels may be written into blocks.
+
+    Returns:
+        np.ndarray: (..., F, F) float tensor of the rebuilt pixels, not rounded.
+    """
+    block_size = blocks.shape[-1]
+    out = blocks if overwrite and blocks.flags.c_contiguous and blocks.flags.writeable else None
+    if frequences_cut == 0:
+        if out is None:
+            return np.zeros(blocks.shape, dtype=blocks.dtype)
+        out.fill(0)
+        return out
+    return pruned_inverse(pruned_forward(blocks, frequences_cut), block_size, out)
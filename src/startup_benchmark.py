@@ -0,0 +1,150 @@
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+SOURCE_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+REPEATS = 5
+
+# Modules imported by the GUI, the command-line tools and the worker processes
+STARTUP_MODULES = ("compression_manager", "streaming", "incremental", "metrics", "codec", "compression_service", "gui")
+
+# Dependencies that must only be imported at their first use, see lazy_import
+HEAVY_MODULES = ("scipy", "imageio", "PIL", "matplotlib")
+
+# Largest median import time (in seconds, as reported by python -X importtime) of every module, numpy included.
+# With the heavy dependencies imported eagerly both compression_manager and gui took about 0.45 s
+IMPORT_THRESHOLDS = {"gui": 0.1}
+DEFAULT_IMPORT_THRESHOLD = 0.25
+
+# Largest median time from the start of the interpreter to the first drawing of the GUI window
+FIRST_WINDOW_THRESHOLD = 0.5
+
+# Draws the GUI window once, then prints the names of the imported packages and leaves
+FIRST_WINDOW_SCRIPT = (
+    "import sys, gui; app = gui.GUI(); app.root.update(); "
+    "print(','.join(name for name in sys.modules if '.' not in name), flush=True); app.root.destroy()"
+)
+
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+
+
+def parse_import_time(stderr, module):
+    """Cumulative import time of a top-level module (in seconds) in the output of python -X importtime."""
+    for line in stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match and match.group(4) == module and len(match.group(3)) == 1:
+            return int(match.group(2)) / 1e6
+    raise ValueError(f"{module} is not in the import times")
+
+
+def heavy_modules(module_names):
+    """Heavy dependencies among the names of the imported modules, see HEAVY_MODULES."""
+    return sorted({name.split(".")[0] for name in module_names} & set(HEAVY_MODULES))
+
+
+def measure_import(module, repeats=REPEATS):
+    """
+    Import a module in fresh interpreters with python -X importtime.
+
+    Returns:
+        dict: median import time (in seconds), every run time and the heavy dependencies imported along.
+    """
+    code = f"import sys, {module}; print(','.join(sys.modules))"
+    times = []
+    for _ in range(repeats):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code], cwd=SOURCE_FOLDER, capture_output=True, text=True, check=True
+        )
+        times.append(parse_import_time(result.stderr, module))
+    return {
+        "median": statistics.median(times),
+        "times": times,
+        "heavy_modules": heavy_modules(result.stdout.strip().split(",")),
+    }
+
+
+def measure_first_window(repeats=REPEATS):
+    """
+    Time from the start of a fresh interpreter to the first drawing of the GUI window.
+
+    Returns:
+        dict: median time (in seconds), every run time and the heavy dependencies imported by then,
+        or None when no display is available.
+    """
+    times = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-c", FIRST_WINDOW_SCRIPT], cwd=SOURCE_FOLDER,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        )
+        modules = process.stdout.readline().strip()
+        times.append(time.perf_counter() - start_time)
+        if process.wait() != 0 or not modules:
+            # Tk cannot open a window without a display
+            return None
+    return {"median": statistics.median(times), "times": times, "heavy_modules": heavy_modules(modules.split(","))}
+
+
+def check_result(result, threshold):
+    """Flag a measure as a regression when its median is above threshold or when it imported a heavy dependency."""
+    result["threshold"] = threshold
+    result["regression"] = result["median"] > threshold or bool(result["heavy_modules"])
+    return result
+
+
+def run_startup_benchmark(modules=STARTUP_MODULES, repeats=REPEATS, first_window=True):
+    """
+    Measure the import time of every module and the time to the first GUI window.
+
+    Returns:
+        list: One dict per measure, with its name, median, threshold and regression flag.
+    """
+    results = []
+    for module in modules:
+        result = measure_import(module, repeats)
+        result["name"] = f"import {module}"
+        results.append(check_result(result, IMPORT_THRESHOLDS.get(module, DEFAULT_IMPORT_THRESHOLD)))
+
+    if first_window:
+        result = measure_first_window(repeats)
+        if result is not None:
+            result["name"] = "first window"
+            results.append(check_result(result, FIRST_WINDOW_THRESHOLD))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import time and time to the first GUI window, with regression thresholds.")
+    parser.add_argument("--modules", nargs="+", default=list(STARTUP_MODULES))
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--no-window", action="store_true", help="Skip the time to the first GUI window")
+    parser.add_argument("-o", "--output", help="Save the results in this JSON file")
+    args = parser.parse_args(argv)
+
+    results = run_startup_benchmark(args.modules, args.repeats, not args.no_window)
+    if not args.no_window and not any(result["name"] == "first window" for result in results):
+        print("No display available, the time to the first window is not measured")
+
+    for result in results:
+        flag = "REGRESSION" if result["regression"] else "ok"
+        heavy = f"  imports {', '.join(result['heavy_modules'])}" if result["heavy_modules"] else ""
+        print(f"{flag:<12}{result['name']:<32}{result['median'] * 1e3:8.1f} ms  (threshold {result['threshold'] * 1e3:.0f} ms){heavy}")
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+    regressions = sum(result["regression"] for result in results)
+    print(f"{regressions} regressions out of {len(results)} measures")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
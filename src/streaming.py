@@ -0,0 +1,135 @@
+import os
+import numpy as np
+
+import compression_manager
+from bitmap import BMPFile, create_bmp, is_bmp
+from compression_manager import check_frequences_cut, count_blocks, block_view, compress_blocks, BlockWorkspace
+from lazy_import import lazy_module
+
+iio = lazy_module("imageio.v3")
+
+# Default amount of memory (in bytes) that a single strip may use while it is transformed
+DEFAULT_STRIP_BUDGET = 64 * 1024 * 1024
+
+# Working memory needed by each pixel of a strip: the uint8 input pages mapped in memory,
+# the coefficients tensor and the scratch buffer of the FFT, in float64 at worst
+BYTES_PER_STRIP_PIXEL = 1 + 8 + 8
+
+
+def open_pixels(image_path, shape=None, offset=0):
+    """
+    Open the pixels of a gray-scale image without loading them in memory, when the format allows it.
+
+    Args:
+        image_path (str): Path of the image. .npy files are memory-mapped with np.load,
+            .raw files are memory-mapped as a headerless uint8 buffer, 8-bit gray-scale .bmp files are
+            memory-mapped through bitmap.BMPFile, any other format is read with imageio.
+        shape (tuple): (rows, columns) of a .raw buffer, ignored for the other formats.
+        offset (int): Number of bytes to skip at the beginning of a .raw buffer.
+
+    Returns:
+        np.ndarray: Read-only 2D array of the pixels (a np.memmap for .npy, .raw and gray-scale .bmp files).
+    """
+    extension = os.path.splitext(image_path)[1].lower()
+
+    if extension == ".npy":
+        pixels = np.load(image_path, mmap_mode='r')
+    elif extension == ".raw":
+        if shape is None:
+            raise ValueError("The shape of a .raw pixel buffer must be given")
+        pixels = np.memmap(image_path, dtype=np.uint8, mode='r', offset=offset, shape=tuple(shape))
+    elif extension == ".bmp":
+        # 24-bit files are converted in memory, see BMPFile.gray
+        pixels = BMPFile(image_path).gray()
+    else:
+        # Formats without a plain pixel buffer are decoded in memory
+        pixels = iio.imread(image_path, pilmode='L')
+
+    if pixels.ndim != 2:
+        raise ValueError(f"Expected a gray-scale image, got an array of shape {pixels.shape}")
+    return pixels
+
+
+def rows_per_strip(block_size, columns, strip_budget=DEFAULT_STRIP_BUDGET):
+    """Number of block rows that fit in the strip budget (at least one)."""
+    bytes_per_block_row = block_size * columns * BYTES_PER_STRIP_PIXEL
+    return max(1, strip_budget // bytes_per_block_row)
+
+
+def streaming_compression(image_path, block_size, frequences_cut, output_path=None, shape=None, offset=0,
+                          strip_budget=DEFAULT_STRIP_BUDGET, precision=None):
+    """
+    Compress an image strip by strip, writing the result in a memory-mapped .npy or .bmp file.
+
+    Every strip is made of whole rows of blocks, so that the result is identical to compression(),
+    while the peak memory is bounded by strip_budget instead of the image size.
+
+    Args:
+        image_path (str): Path of the image, see open_pixels for the supported formats.
+        block_size (int): Size of the square blocks (F).
+        frequences_cut (int): Frequency threshold (d).
+        output_path (str): Path of the output .npy or .bmp file, by default compressed_[original_name].npy
+            inside the output folder.
+        shape (tuple): (rows, columns) of a .raw pixel buffer.
+        offset (int): Number of bytes to skip at the beginning of a .raw pixel buffer.
+        strip_budget (int): Memory (in bytes) available to transform a single strip.
+        precision (str): "float32" or "float64", see compute_dtype.
+
+    Returns:
+        str: Path of the compressed image.
+    """
+    check_frequences_cut(block_size, frequences_cut)
+
+    if is_bmp(image_path) and not BMPFile(image_path).is_gray:
+        # Color BMP files are converted to gray levels a strip at a time
+        source = BMPFile(image_path)
+        rows, columns = source.shape
+        read_rows = source.read_rows
+    else:
+        pixels = open_pixels(image_path, shape, offset)
+        rows, columns = pixels.shape
+
+        def read_rows(start, stop):
+            return pixels[start:stop]
+    blocks_per_row, blocks_per_column = count_blocks(rows, columns, block_size)
+
+    if output_path is None:
+        os.makedirs(compression_manager.OUTPUT_FOLDER, exist_ok=True)
+        file_name = os.path.splitext(os.path.basename(image_path))[0]
+        output_path = os.path.join(compression_manager.OUTPUT_FOLDER, f"compressed_{file_name}.npy")
+
+    output_shape = (blocks_per_row * block_size, blocks_per_column * block_size)
+    if is_bmp(output_path):
+        # The compressed blocks are written in place into the pixels of the new file
+        output_file = create_bmp(output_path, *output_shape)
+        output = output_file.pixels
+    else:
+        output_file = None
+        output = np.lib.format.open_memmap(output_path, mode='w+', dtype=np.uint8, shape=output_shape)
+
+    strip_rows = rows_per_strip(block_size, blocks_per_column * block_size, strip_budget)
+
+    # The work buffer of the first strip is reused by all the others
+    workspace = BlockWorkspace()
+
+    for first_row in range(0, blocks_per_row, strip_rows):
+        last_row = min(first_row + strip_rows, blocks_per_row)
+
+        # The blocks of the strip are read straight from the input pixels and written into the
+        # memory-mapped output, through their block views
+        rows = slice(first_row * block_size, last_row * block_size)
+        compress_blocks(
+            block_view(read_rows(rows.start, rows.stop), block_size),
+            frequences_cut,
+            precision=precision,
+            workspace=workspace,
+            out=block_view(output[rows], block_size),
+        )
+
+    if output_file is not None:
+        output_file.close()
+    else:
+        output.flush()
+    del output
+
+    return output_path
@@ -1,7 +1,66 @@
+import asyncio
+import json
+import os
+import queue
+import tempfile
+import threading
 import unittest
+import unittest.mock
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+import imageio.v3 as iio
 
-from dct import custom_dct, scipy_dct_fft, custom_dct2, scipy_dct2_fft
+import compression_manager
+from compression_manager import (
+    compression, compress_blocks, frequency_mask, merge_blocks, split_blocks, parallel_compress_blocks,
+    for_each_block_rows, compress_color_image, compress_planes, block_view, compress_bytes, compress_image, compress_images
+)
+from color import rgb_to_ycbcr, ycbcr_to_rgb, subsample, upsample
+from parallel_engine import chunk_bounds
+from custom_exceptions import InvalidBlockSizeError, InvalidFrequenciesNumberError, CompressionCancelledError
+from coefficient_cache import CoefficientCache
+from coefficient_store import CoefficientStore, save_coefficients, save_file
+from codec import decode, decode_file, encode, encode_file, huffman_code_lengths, zigzag_indices
+import dct_backends
+from dct_backends import Autotuner, BACKENDS, available_backends, get_backend
+from pruned_dct import pruned_forward, pruned_reconstruction, use_pruned
+from benchmark import compare_results, matrix_paths, measure
+from batch_compression import batch_compression, parse_setting
+from bitmap import BMPFile, create_bmp, read_bmp, read_header, write_bmp
+from streaming import open_pixels, rows_per_strip, streaming_compression
+from metrics import evaluate, forward_coefficients, mse, psnr, rate_distortion_curve, search_parameters, ssim
+import instrumentation
+from instrumentation import Profiler, profiling
+import gui
+from lazy_import import LazyModule, lazy_module
+from startup_benchmark import heavy_modules, measure_import, parse_import_time
+import flat_blocks
+from flat_blocks import block_ranges, classify_blocks, energy_limits
+from incremental import IncrementalCompressor, block_hashes, dirty_blocks
+from preview import block_means, display_size, low_order_preview, preview_order, previews
+from compression_service import CompressionService, parse_parameters
+from custom_exceptions import ServiceBusyError
+from dct import BasisCache, custom_dct, scipy_dct_fft, custom_dct2, custom_idct2, scipy_dct2_fft, scipy_idct2_fft
+
+IMAGES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "images")
+
+
+def reference_compression(image, block_size, frequences_cut, dtype=np.float64):
+    """Block by block compression used as reference for the batched engine."""
+    rows, columns = image.shape[0] // block_size, image.shape[1] // block_size
+    final_image = np.zeros((rows * block_size, columns * block_size))
+    for i in range(rows):
+        for j in range(columns):
+            block = image[i*block_size:(i+1)*block_size, j*block_size:(j+1)*block_size].astype(dtype)
+            coef_matrix = np.array(scipy_dct2_fft(block))
+            coef_matrix_cut = np.zeros(shape=(block_size, block_size), dtype=dtype)
+            for k in range(block_size):
+                for l in range(block_size):
+                    if (k + l) < frequences_cut:
+                        coef_matrix_cut[k, l] = coef_matrix[k, l]
+            ff = np.clip(np.around(np.array(scipy_idct2_fft(coef_matrix_cut)), 0), 0, 255)
+            final_image[i*block_size:(i+1)*block_size, j*block_size:(j+1)*block_size] = ff
+    return final_image.astype(np.uint8)
 
 class TestDct(unittest.TestCase):
     
@@ -65,7 +124,1291 @@ class TestDct(unittest.TestCase):
         ]
         scipy_dct2_result = np.array(scipy_dct2_fft(input_vector))
         np.testing.assert_allclose(expected_result, scipy_dct2_result, rtol=0.1, atol=2.0)
+
+    def test_custom_dct2_batch(self):
+        blocks = np.random.default_rng(23).uniform(0, 255, size=(10, 8, 8))
+        custom_result = custom_dct2(blocks)
+        np.testing.assert_allclose(scipy_dct2_fft(blocks, axes=(1, 2)), custom_result, atol=1e-9)
+        np.testing.assert_allclose(blocks, custom_idct2(custom_result), atol=1e-9)
+
+    def test_custom_dct2_float32(self):
+        blocks = np.random.default_rng(23).uniform(0, 255, size=(4, 8, 8)).astype(np.float32)
+        custom_result = custom_dct2(blocks)
+        self.assertEqual(custom_result.dtype, np.float32)
+        np.testing.assert_allclose(scipy_dct2_fft(blocks.astype(np.float64), axes=(1, 2)), custom_result, atol=1e-3)
+
+    def test_basis_cache(self):
+        cache = BasisCache(maxsize=2)
+        D = cache.get(8)
+        self.assertIs(D, cache.get(8))
+        self.assertFalse(D.flags.writeable)
+        np.testing.assert_allclose(np.eye(8), D @ D.T, atol=1e-12)
+
+        cache.get(4, np.float32)
+        cache.get(8)
+        cache.get(16)
+        # The (4, float32) matrix is the least recently used one, so it is evicted
+        self.assertEqual(len(cache), 2)
+        self.assertNotIn((4, np.float32), cache)
+        self.assertIn((8, np.float64), cache)
+
+    def test_basis_cache_threads(self):
+        # Concurrent lookups with constant evictions, as the workers of a thread pool do
+        cache = BasisCache(maxsize=2)
+        sizes = [2 + index % 6 for index in range(2000)]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            matrices = list(pool.map(cache.get, sizes))
+        for size, D in zip(sizes, matrices):
+            self.assertEqual(D.shape, (size, size))
+        self.assertEqual(len(cache), 2)
+
+    def test_basis_cache_on_disk(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            D = BasisCache(cache_dir=cache_dir).get(8)
+            self.assertTrue(os.path.exists(os.path.join(cache_dir, "dct_basis_8_float64.npy")))
+            np.testing.assert_array_equal(D, BasisCache(cache_dir=cache_dir).get(8))
    
 
+class TestDctBackends(unittest.TestCase):
+
+    def setUp(self):
+        self.blocks = np.random.default_rng(23).uniform(0, 255, size=(6, 8, 8))
+        self.coefficients = scipy_dct2_fft(self.blocks, axes=(1, 2))
+
+    def test_backends_match_scipy(self):
+        for name, backend in BACKENDS.items():
+            with self.subTest(backend=name):
+                np.testing.assert_allclose(self.coefficients, backend.dct2(self.blocks), atol=1e-9)
+                np.testing.assert_allclose(self.blocks, backend.idct2(self.coefficients), atol=1e-9)
+                np.testing.assert_allclose(scipy_dct_fft(self.blocks[0]), backend.dct(self.blocks[0]), atol=1e-9)
+                np.testing.assert_allclose(
+                    scipy_dct_fft(self.blocks.swapaxes(1, 2)).swapaxes(1, 2), backend.dct(self.blocks, axis=1), atol=1e-9
+                )
+
+    def test_odd_sizes(self):
+        blocks = np.random.default_rng(23).uniform(0, 255, size=(3, 7, 7))
+        for name in available_backends(7):
+            backend = BACKENDS[name]
+            np.testing.assert_allclose(scipy_dct2_fft(blocks, axes=(1, 2)), backend.dct2(blocks), atol=1e-9)
+            np.testing.assert_allclose(blocks, backend.idct2(backend.dct2(blocks)), atol=1e-9)
+
+    def test_get_backend(self):
+        self.assertEqual(get_backend("aan8", 8).name, "aan8")
+        self.assertNotIn("aan8", available_backends(16))
+        with self.assertRaises(ValueError):
+            get_backend("aan8", 16)
+        with self.assertRaises(ValueError):
+            get_backend("cuda", 8)
+
+    def test_autotuner(self):
+        with tempfile.TemporaryDirectory() as folder:
+            tuning_path = os.path.join(folder, "tuning.json")
+            autotuner = Autotuner(tuning_path, repeats=1)
+            backend = autotuner.best_backend(8, 100)
+            self.assertIn(backend.name, available_backends(8))
+
+            tuning = autotuner.tuning()
+            self.assertEqual(list(tuning), ["8x128xfloat64"])
+            self.assertEqual(set(tuning["8x128xfloat64"]["times"]), set(available_backends(8)))
+
+            # A new process reloads the winner instead of timing again
+            self.assertEqual(Autotuner(tuning_path).tuning(), tuning)
+            self.assertIs(Autotuner(tuning_path).best_backend(8, 120), backend)
+
+        # Every batch above the cap shares a single measure
+        self.assertEqual(Autotuner.key(8, 10 ** 6, np.float32), f"8x{dct_backends.MAX_TUNING_BLOCKS}xfloat32")
+        self.assertEqual(Autotuner.key(8, 5000, np.float32), Autotuner.key(8, 10 ** 6, np.float32))
+
+    def test_compression_backends(self):
+        image = np.random.default_rng(23).integers(0, 256, size=(64, 64), dtype=np.uint8)
+        blocks = split_blocks(image, 8)
+        expected_blocks = compress_blocks(blocks, 6)
+
+        default_autotuner = dct_backends.AUTOTUNER
+        dct_backends.AUTOTUNER = Autotuner(None, repeats=1)
+        try:
+            for backend in list(BACKENDS) + ["auto"]:
+                # Backends differ only by floating point rounding, moving a pixel by one grey level at most
+                result_blocks = compress_blocks(blocks, 6, backend=backend)
+                self.assertLessEqual(np.abs(expected_blocks - result_blocks).max(), 1)
+        finally:
+            dct_backends.AUTOTUNER = default_autotuner
+
+    def test_auto_backend_resolved_once(self):
+        # The autotuner picks a different backend for the whole image and for its chunks
+        image = np.random.default_rng(23).integers(0, 256, size=(1024, 1024), dtype=np.uint8)
+        with tempfile.TemporaryDirectory() as folder:
+            tuning_path = os.path.join(folder, "tuning.json")
+            with open(tuning_path, "w") as tuning_file:
+                json.dump({"16x4096xfloat32": {"backend": "scipy"}, "16x256xfloat32": {"backend": "matrix"}}, tuning_file)
+
+            default_autotuner = dct_backends.AUTOTUNER
+            dct_backends.AUTOTUNER = Autotuner(tuning_path)
+            try:
+                expected_image = compress_image(image, 16, 20, backend="auto")
+                for options in ({"workers": 16}, {"workers": 16, "executor": "process"}, {"cancel_event": threading.Event()}):
+                    with self.subTest(**options):
+                        np.testing.assert_array_equal(expected_image, compress_image(image, 16, 20, backend="auto", **options))
+                np.testing.assert_array_equal(expected_image, compress_image(image, 16, 20, backend="scipy"))
+
+                # The changed blocks of an incremental run use the backend of the whole image too
+                compressor = IncrementalCompressor(backend="auto")
+                compressor.compress(image, 16, 20, key="image")
+                edited = image.copy()
+                edited[:100, :100] = 255 - edited[:100, :100]
+                np.testing.assert_array_equal(
+                    compress_image(edited, 16, 20, backend="auto"), compressor.compress(edited, 16, 20, key="image")[0]
+                )
+            finally:
+                dct_backends.AUTOTUNER = default_autotuner
+
+    def test_pruned_transform(self):
+        for block_size in [4, 8, 16]:
+            blocks = np.random.default_rng(23).uniform(0, 255, size=(5, block_size, block_size))
+            coefficients = scipy_dct2_fft(blocks, axes=(1, 2))
+            for frequences_cut in range(2 * block_size - 1):
+                with self.subTest(block_size=block_size, frequences_cut=frequences_cut):
+                    cut = np.where(frequency_mask(block_size, frequences_cut), coefficients, 0)
+                    if frequences_cut > 0:
+                        n_rows = min(frequences_cut, block_size)
+                        np.testing.assert_allclose(
+                            pruned_forward(blocks, frequences_cut).swapaxes(1, 2), cut[:, :n_rows, :n_rows], atol=1e-9
+                        )
+                    np.testing.assert_allclose(
+                        pruned_reconstruction(blocks, frequences_cut), scipy_idct2_fft(cut, axes=(1, 2)), atol=1e-9
+                    )
+
+    def test_pruned_dispatch(self):
+        self.assertTrue(use_pruned(8, 2, np.float64))
+        self.assertFalse(use_pruned(8, 12, np.float64))
+        self.assertFalse(use_pruned(64, 10, np.float64))
+        self.assertFalse(use_pruned(2, 1))
+
+        blocks = np.random.default_rng(23).integers(0, 256, size=(50, 8, 8), dtype=np.uint8)
+        expected_blocks = compress_blocks(blocks, 3)
+        self.assertLessEqual(np.abs(expected_blocks - compress_blocks(blocks, 3, backend="auto")).max(), 1)
+
+
+class TestCompression(unittest.TestCase):
+
+    def setUp(self):
+        self.output_folder = tempfile.TemporaryDirectory()
+        self.default_output_folder = compression_manager.OUTPUT_FOLDER
+        compression_manager.OUTPUT_FOLDER = self.output_folder.name
+        self.image = np.random.default_rng(23).integers(0, 256, size=(48, 40), dtype=np.uint8)
+
+    def tearDown(self):
+        compression_manager.OUTPUT_FOLDER = self.default_output_folder
+        self.output_folder.cleanup()
+
+    def test_frequency_mask(self):
+        mask = frequency_mask(4, 3)
+        expected_mask = [
+            [True, True, True, False],
+            [True, True, False, False],
+            [True, False, False, False],
+            [False, False, False, False]
+        ]
+        np.testing.assert_array_equal(expected_mask, mask)
+        self.assertIs(mask, frequency_mask(4, 3))
+
+    def test_split_merge_blocks(self):
+        blocks = split_blocks(self.image, 8)
+        self.assertEqual(blocks.shape, (30, 8, 8))
+        np.testing.assert_array_equal(self.image[8:16, 16:24], blocks[7])
+        np.testing.assert_array_equal(self.image, merge_blocks(blocks, 6, 5))
+
+    def test_block_view(self):
+        # A cropped image is not contiguous, its blocks are still read without copies
+        image = self.image[:45, :37]
+        blocks = block_view(image, 8)
+        self.assertEqual(blocks.shape, (5, 4, 8, 8))
+        self.assertTrue(np.shares_memory(blocks, self.image))
+        np.testing.assert_array_equal(split_blocks(self.image[:40, :32], 8), blocks.reshape(-1, 8, 8))
+
+        # Writing into the block view of an output writes its pixels
+        output = np.zeros((48, 48), dtype=np.uint8)
+        block_view(output[8:, 8:], 8)[1, 2] = 7
+        self.assertEqual(np.count_nonzero(output), 64)
+        self.assertTrue((output[16:24, 24:32] == 7).all())
+
+    def test_compress_into_block_view(self):
+        expected_image = merge_blocks(compress_blocks(split_blocks(self.image, 8), 6), 6, 5)
+        final_image = np.zeros((64, 64), dtype=np.uint8)
+        region = final_image[8:56, 16:56]
+        out = block_view(region, 8)
+        self.assertIs(compress_blocks(block_view(self.image, 8), 6, out=out), out)
+        np.testing.assert_array_equal(expected_image, region)
+
+        # merge_blocks writes into non contiguous outputs as well
+        region[...] = 0
+        merge_blocks(split_blocks(expected_image, 8), 6, 5, out=region)
+        np.testing.assert_array_equal(expected_image, region)
+
+        for executor in ["thread", "process"]:
+            out = np.empty((6, 5, 8, 8), dtype=np.uint8)
+            parallel_compress_blocks(block_view(self.image, 8), 6, workers=2, chunk_size=10, executor=executor, out=out)
+            np.testing.assert_array_equal(expected_image, merge_blocks(out, 6, 5))
+
+    def test_batched_blocks_match_reference(self):
+        for block_size, frequences_cut in [(8, 0), (8, 5), (8, 14), (4, 3)]:
+            blocks = compress_blocks(split_blocks(self.image, block_size), frequences_cut, precision="float64")
+            rows, columns = self.image.shape[0] // block_size, self.image.shape[1] // block_size
+            np.testing.assert_array_equal(
+                reference_compression(self.image, block_size, frequences_cut),
+                merge_blocks(blocks, rows, columns)
+            )
+
+    def test_float32_precision(self):
+        image = iio.imread(os.path.join(IMAGES_PATH, "deer.bmp"), pilmode='L')
+        rows, columns = (image.shape[0] // 8) * 8, (image.shape[1] // 8) * 8
+        blocks = split_blocks(image[:rows, :columns], 8)
+        for frequences_cut in [2, 6, 14]:
+            float32_blocks = compress_blocks(blocks, frequences_cut)
+            float64_blocks = compress_blocks(blocks, frequences_cut, precision="float64")
+            self.assertEqual(float32_blocks.dtype, np.float32)
+            # Only the pixels whose value lies next to a .5 rounding boundary can differ, by a single level
+            difference = np.abs(float32_blocks - float64_blocks)
+            self.assertLessEqual(difference.max(), 1)
+            self.assertLess(np.count_nonzero(difference) / difference.size, 1e-3)
+        with self.assertRaises(ValueError):
+            compress_blocks(blocks, 6, precision="float16")
+
+    def test_block_workspace(self):
+        blocks = split_blocks(self.image, 8)
+        workspace = compression_manager.BlockWorkspace()
+        first = compress_blocks(blocks, 6, workspace=workspace)
+        expected = first.copy()
+        second = compress_blocks(blocks[:10], 6, workspace=workspace)
+        # The second chunk is transformed in the buffer of the first one
+        self.assertTrue(np.shares_memory(first, second))
+        np.testing.assert_array_equal(expected[:10], second)
+
+    def test_padding(self):
+        image = self.image[:45, :37]
+        for padding, numpy_mode in [("edge", "edge"), ("reflect", "symmetric"), ("zero", "constant")]:
+            padded_image = np.pad(image, ((0, 3), (0, 3)), mode=numpy_mode)
+            expected_image = merge_blocks(compress_blocks(split_blocks(padded_image, 8), 6), 6, 5)[:45, :37]
+            np.testing.assert_array_equal(expected_image, compress_planes([image], 8, 6, padding)[0])
+        with self.assertRaises(ValueError):
+            compress_planes([image], 8, 6, "wrap")
+
+        # The whole blocks are compressed from the plane itself, only the border blocks are copied
+        with unittest.mock.patch("compression_manager.compress_all_blocks", wraps=compression_manager.compress_all_blocks) as mock:
+            compress_planes([image, image[:40, :32]], 8, 6, "edge")
+        batch_shapes = [call.args[0].shape for call in mock.call_args_list]
+        self.assertEqual(batch_shapes, [(5, 4, 8, 8), (5, 4, 8, 8), (10, 1, 8, 8)])
+        self.assertTrue(np.shares_memory(mock.call_args_list[0].args[0], image))
+
+        reports = []
+        compress_planes([image], 8, 6, "edge", progress=lambda done, total: reports.append((done, total)))
+        self.assertEqual(reports[-1], (30, 30))
+        self.assertEqual(reports, sorted(reports))
+
+    def test_compression_padding(self):
+        image_path = os.path.join(IMAGES_PATH, "deer.bmp")
+        output_path = compression(image_path, 8, 6, padding="reflect")
+        self.assertEqual(iio.imread(output_path).shape, iio.imread(image_path, pilmode='L').shape)
+        # Images smaller than a block are extended to a single block
+        output_path = compression(os.path.join(IMAGES_PATH, "20x20.bmp"), 32, 10, padding="edge")
+        self.assertEqual(iio.imread(output_path).shape, (20, 20))
+
+    def test_compression(self):
+        image_path = os.path.join(IMAGES_PATH, "deer.bmp")
+        output_path = compression(image_path, 8, 6, precision="float64")
+        self.assertEqual(os.path.join(self.output_folder.name, "compressed_deer.bmp"), output_path)
+
+        expected_image = reference_compression(iio.imread(image_path, pilmode='L'), 8, 6)
+        np.testing.assert_array_equal(expected_image, iio.imread(output_path))
+
+    def test_in_memory_compression(self):
+        image = iio.imread(os.path.join(IMAGES_PATH, "20x20.bmp"), pilmode='L')
+        expected_image = reference_compression(image, 8, 6)
+        np.testing.assert_array_equal(compress_image(image, 8, 6, precision="float64"), expected_image)
+
+        result = iio.imread(compress_bytes(iio.imwrite("<bytes>", image, extension=".bmp"), 8, 6, "png", precision="float64"))
+        np.testing.assert_array_equal(result, expected_image)
+        self.assertEqual(os.listdir(self.output_folder.name), [])
+
+        with self.assertRaises(ValueError):
+            compress_image(np.dstack([image] * 3), 8, 6)
+
+    def test_compress_images(self):
+        rng = np.random.default_rng(4)
+        images = rng.integers(0, 256, size=(3, 21, 19), dtype=np.uint8)
+        expected_images = np.stack([reference_compression(image, 4, 3) for image in images])
+        np.testing.assert_array_equal(compress_images(images, 4, 3, precision="float64"), expected_images)
+        np.testing.assert_array_equal(compress_images(list(images), 4, 3, precision="float64"), expected_images)
+
+        padded_images = compress_images(images, 4, 3, padding="edge")
+        self.assertEqual(padded_images.shape, images.shape)
+        np.testing.assert_array_equal(padded_images[1], compress_image(images[1], 4, 3, padding="edge"))
+
+        color_images = rng.integers(0, 256, size=(2, 16, 16, 3), dtype=np.uint8)
+        np.testing.assert_array_equal(
+            compress_images(color_images, 8, 6, color=True)[1], compress_color_image(color_images[1], 8, 6)
+        )
+
+        with self.assertRaises(ValueError):
+            compress_images([images[0], images[0][:20]], 4, 3)
+
+    def test_compression_workers(self):
+        image_path = os.path.join(IMAGES_PATH, "shoe.bmp")
+        serial_image = iio.imread(compression(image_path, 8, 6))
+        parallel_image = iio.imread(compression(image_path, 8, 6, workers=2, chunk_size=100))
+        np.testing.assert_array_equal(serial_image, parallel_image)
+
+    def test_for_each_block_rows(self):
+        chunks = []
+        progress = []
+        for_each_block_rows(lambda start, end: chunks.append((start, end)), 5, 10, progress=lambda *done: progress.append(done), chunk_blocks=20)
+        self.assertEqual(chunks, [(0, 20), (20, 40), (40, 50)])
+        self.assertEqual(progress, [(2, 5), (4, 5), (5, 5)])
+
+    def test_compression_progress(self):
+        image_path = os.path.join(IMAGES_PATH, "deer.bmp")
+        progress = []
+        output_path = compression(image_path, 8, 6, progress=lambda *done: progress.append(done), precision="float64")
+        self.assertEqual(progress[-1], (82, 82))
+        self.assertGreater(len(progress), 1)
+
+        expected_image = reference_compression(iio.imread(image_path, pilmode='L'), 8, 6)
+        np.testing.assert_array_equal(expected_image, iio.imread(output_path))
+
+    def test_compression_cancelled(self):
+        cancel_event = threading.Event()
+
+        def progress(done_rows, total_rows):
+            cancel_event.set()
+
+        with self.assertRaises(CompressionCancelledError):
+            compression(os.path.join(IMAGES_PATH, "deer.bmp"), 8, 6, progress=progress, cancel_event=cancel_event)
+        self.assertFalse(os.path.exists(os.path.join(self.output_folder.name, "compressed_deer.bmp")))
+
+    def test_compression_invalid_parameters(self):
+        image_path = os.path.join(IMAGES_PATH, "20x20.bmp")
+        with self.assertWarns(UserWarning), self.assertRaises(InvalidFrequenciesNumberError):
+            compression(image_path, 8, 15)
+        with self.assertWarns(UserWarning), self.assertRaises(InvalidBlockSizeError):
+            compression(image_path, 32, 4)
+
+
+class TestColor(unittest.TestCase):
+
+    def setUp(self):
+        self.image = iio.imread(os.path.join(IMAGES_PATH, "shoe.bmp"))
+
+    def test_ycbcr_round_trip(self):
+        rgb = np.random.default_rng(23).integers(0, 256, size=(16, 12, 3), dtype=np.uint8)
+        difference = np.abs(ycbcr_to_rgb(*rgb_to_ycbcr(rgb)).astype(int) - rgb)
+        self.assertLessEqual(difference.max(), 2)
+
+    def test_subsample_upsample(self):
+        plane = np.arange(35, dtype=np.uint8).reshape(5, 7)
+        subsampled = subsample(plane, (2, 2))
+        self.assertEqual(subsampled.shape, (3, 4))
+        self.assertEqual(subsampled[0, 0], np.around(plane[:2, :2].mean()))
+        # The last row and column are replicated to fill the border groups
+        self.assertEqual(subsampled[2, 3], plane[4, 6])
+        self.assertEqual(upsample(subsampled, (2, 2), plane.shape).shape, plane.shape)
+
+    def test_gray_content(self):
+        # With R = G = B the chroma planes are flat, so the result is the gray-scale one
+        gray = np.random.default_rng(23).integers(0, 256, size=(48, 40), dtype=np.uint8)
+        rgb = np.repeat(gray[..., np.newaxis], 3, axis=2)
+        expected_image = compress_color_image(gray, 8, 6)
+        np.testing.assert_array_equal(expected_image, compress_color_image(rgb, 8, 6)[..., 0])
+        np.testing.assert_array_equal(expected_image, compress_color_image(rgb, 8, 6, "4:2:0")[..., 2])
+
+    def test_subsampling(self):
+        rows, columns = (self.image.shape[0] // 8) * 8, (self.image.shape[1] // 8) * 8
+        for subsampling in ["4:4:4", "4:2:2", "4:2:0"]:
+            final_image = compress_color_image(self.image, 8, 14, subsampling)
+            self.assertEqual(final_image.shape, (rows, columns, 3))
+            self.assertLess(np.abs(final_image.astype(int) - self.image[:rows, :columns]).mean(), 1)
+        with self.assertRaises(ValueError):
+            compress_color_image(self.image, 8, 14, "4:1:1")
+
+    def test_alpha_channel(self):
+        alpha = np.random.default_rng(23).integers(0, 256, size=self.image.shape[:2], dtype=np.uint8)
+        rgba = np.dstack([self.image, alpha])
+        final_image = compress_color_image(rgba, 8, 14, "4:2:0")
+        self.assertEqual(final_image.shape[-1], 4)
+        np.testing.assert_array_equal(alpha[:final_image.shape[0], :final_image.shape[1]], final_image[..., 3])
+
+    def test_compression_color(self):
+        with tempfile.TemporaryDirectory() as output_folder:
+            output_path = compression(os.path.join(IMAGES_PATH, "shoe.bmp"), 8, 10, color=True, subsampling="4:2:0",
+                                      output_path=os.path.join(output_folder, "shoe.bmp"))
+            self.assertEqual(iio.imread(output_path).shape, (256, 256, 3))
+
+
+class TestStreaming(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.image = np.random.default_rng(23).integers(0, 256, size=(70, 45), dtype=np.uint8)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_rows_per_strip(self):
+        self.assertEqual(rows_per_strip(8, 1000, 8 * 1000 * 17 * 3), 3)
+        self.assertEqual(rows_per_strip(8, 1000, 1), 1)
+
+    def test_streaming_npy(self):
+        image_path = os.path.join(self.folder.name, "image.npy")
+        output_path = os.path.join(self.folder.name, "output.npy")
+        np.save(image_path, self.image)
+
+        # A budget of a single block row forces a strip for every row of blocks
+        streaming_compression(image_path, 8, 5, output_path=output_path, strip_budget=1)
+        np.testing.assert_array_equal(reference_compression(self.image, 8, 5), np.load(output_path))
+
+    def test_streaming_raw(self):
+        image_path = os.path.join(self.folder.name, "image.raw")
+        output_path = os.path.join(self.folder.name, "output.npy")
+        with open(image_path, "wb") as raw_file:
+            raw_file.write(b"HEAD")
+            raw_file.write(self.image.tobytes())
+
+        pixels = open_pixels(image_path, shape=self.image.shape, offset=4)
+        self.assertIsInstance(pixels, np.memmap)
+        np.testing.assert_array_equal(self.image, pixels)
+        del pixels
+
+        streaming_compression(image_path, 4, 3, output_path=output_path, shape=self.image.shape, offset=4, strip_budget=4000)
+        np.testing.assert_array_equal(reference_compression(self.image, 4, 3), np.load(output_path, mmap_mode='r'))
+
+    def test_streaming_raw_without_shape(self):
+        image_path = os.path.join(self.folder.name, "image.raw")
+        self.image.tofile(image_path)
+        with self.assertRaises(ValueError):
+            streaming_compression(image_path, 8, 5)
+
+    def test_streaming_bmp(self):
+        image_path = os.path.join(self.folder.name, "image.bmp")
+        output_path = os.path.join(self.folder.name, "output.bmp")
+        iio.imwrite(image_path, self.image)
+
+        # The input strips are read from the mapped file and the blocks written into the mapped output
+        streaming_compression(image_path, 8, 5, output_path=output_path, strip_budget=1)
+        np.testing.assert_array_equal(reference_compression(self.image, 8, 5), iio.imread(output_path))
+
+
+class TestBitmap(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        # An odd width pads every row of the file
+        self.image = np.random.default_rng(29).integers(0, 256, size=(13, 21), dtype=np.uint8)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_read_matches_imageio(self):
+        for file_name in ["20x20.bmp", "deer.bmp"]:
+            image_path = os.path.join(IMAGES_PATH, file_name)
+            with self.subTest(file_name=file_name):
+                np.testing.assert_array_equal(iio.imread(image_path, pilmode='L'), read_bmp(image_path))
+
+        # Gray-scale files are mapped without copies
+        self.assertIsInstance(read_bmp(os.path.join(IMAGES_PATH, "20x20.bmp")), np.memmap)
+
+    def test_write_round_trip(self):
+        image_path = write_bmp(os.path.join(self.folder.name, "image.bmp"), self.image)
+        np.testing.assert_array_equal(self.image, iio.imread(image_path))
+        np.testing.assert_array_equal(self.image, read_bmp(image_path))
+        self.assertFalse(read_header(image_path).top_down)
+
+    def test_color_file(self):
+        rgb = np.random.default_rng(31).integers(0, 256, size=(13, 21, 3), dtype=np.uint8)
+        image_path = os.path.join(self.folder.name, "color.bmp")
+        iio.imwrite(image_path, rgb)
+        with BMPFile(image_path) as bmp_file:
+            self.assertFalse(bmp_file.is_gray)
+            np.testing.assert_array_equal(rgb, bmp_file.pixels)
+            np.testing.assert_array_equal(iio.imread(image_path, pilmode='L')[4:9], bmp_file.read_rows(4, 9))
+            with self.assertRaises(ValueError):
+                bmp_file.write_rows(0, self.image)
+
+    def test_top_down_rows(self):
+        image_path = write_bmp(os.path.join(self.folder.name, "image.bmp"), self.image)
+        # A negative height stores the rows from top to bottom
+        with open(image_path, "r+b") as bmp_file:
+            bmp_file.seek(22)
+            bmp_file.write((-13).to_bytes(4, "little", signed=True))
+        self.assertTrue(read_header(image_path).top_down)
+        np.testing.assert_array_equal(self.image[::-1], read_bmp(image_path))
+
+    def test_write_strips(self):
+        image_path = os.path.join(self.folder.name, "image.bmp")
+        with create_bmp(image_path, *self.image.shape) as bmp_file:
+            for start in range(0, 13, 5):
+                bmp_file.write_rows(start, self.image[start:start + 5])
+        with BMPFile(image_path) as bmp_file:
+            np.testing.assert_array_equal(self.image[5:10], bmp_file.read_rows(5, 10))
+        np.testing.assert_array_equal(self.image, iio.imread(image_path))
+
+    def test_unsupported_file(self):
+        image_path = os.path.join(self.folder.name, "image.bmp")
+        with open(image_path, "wb") as bmp_file:
+            bmp_file.write(b"not a bitmap")
+        with self.assertRaises(ValueError):
+            read_bmp(image_path)
+
+        # The compression falls back to imageio for the files bitmap cannot map
+        png_path = os.path.join(self.folder.name, "image.png")
+        iio.imwrite(png_path, self.image)
+        np.testing.assert_array_equal(self.image, compression_manager.read_image(png_path))
+
+
+class TestParallelEngine(unittest.TestCase):
+
+    def setUp(self):
+        image = np.random.default_rng(23).integers(0, 256, size=(64, 96), dtype=np.uint8)
+        self.blocks = split_blocks(image, 8)
+
+    def test_chunk_bounds(self):
+        self.assertEqual(chunk_bounds(10, 3), [(0, 4), (4, 8), (8, 10)])
+        self.assertEqual(chunk_bounds(10, 1, chunk_size=6), [(0, 6), (6, 10)])
+        self.assertEqual(chunk_bounds(0, 2), [])
+
+    def test_thread_executor(self):
+        expected_blocks = compress_blocks(self.blocks, 5)
+        parallel_blocks = parallel_compress_blocks(self.blocks, 5, workers=3, chunk_size=7, executor="thread")
+        self.assertEqual(parallel_blocks.dtype, np.uint8)
+        np.testing.assert_array_equal(expected_blocks, parallel_blocks)
+
+    def test_process_executor(self):
+        expected_blocks = compress_blocks(self.blocks, 5)
+        parallel_blocks = parallel_compress_blocks(self.blocks, 5, workers=2, executor="process")
+        np.testing.assert_array_equal(expected_blocks, parallel_blocks)
+
+    def test_unknown_executor(self):
+        with self.assertRaises(ValueError):
+            parallel_compress_blocks(self.blocks, 5, workers=2, executor="gpu")
+
+
+class TestBatchCompression(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.source_folder = os.path.join(self.folder.name, "source")
+        self.output_folder = os.path.join(self.folder.name, "output")
+        os.makedirs(self.source_folder)
+        for image_name in ["20x20.bmp", "40x40.bmp"]:
+            image = iio.imread(os.path.join(IMAGES_PATH, image_name), pilmode='L')
+            iio.imwrite(os.path.join(self.source_folder, image_name), image)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_parse_setting(self):
+        self.assertEqual(parse_setting("8:6"), (8, 6))
+        with self.assertRaises(Exception):
+            parse_setting("8")
+
+    def test_batch_compression(self):
+        manifest = batch_compression(self.source_folder, [(8, 6), (4, 2)], jobs=2, output_folder=self.output_folder)
+        self.assertEqual(manifest["summary"]["compressed"], 4)
+        self.assertTrue(os.path.exists(os.path.join(self.output_folder, "manifest.json")))
+
+        entry = manifest["files"][0]
+        self.assertEqual(entry["output"], os.path.join(self.output_folder, "compressed_20x20_F4_d2.bmp"))
+        self.assertEqual(entry["blocks"], 25)
+        expected_image = reference_compression(iio.imread(os.path.join(self.source_folder, "20x20.bmp")), 4, 2, np.float32)
+        np.testing.assert_array_equal(expected_image, iio.imread(entry["output"]))
+
+    def test_batch_compression_skips_up_to_date_outputs(self):
+        for skip_mode in ["mtime", "hash"]:
+            batch_compression(self.source_folder, [(8, 6)], output_folder=self.output_folder, skip_mode=skip_mode)
+            manifest = batch_compression(self.source_folder, [(8, 6)], output_folder=self.output_folder, skip_mode=skip_mode)
+            self.assertEqual(manifest["summary"]["compressed"], 0)
+            self.assertEqual(manifest["summary"]["skipped"], 2)
+
+        # A changed source is compressed again
+        image_path = os.path.join(self.source_folder, "40x40.bmp")
+        iio.imwrite(image_path, 255 - iio.imread(image_path))
+        manifest = batch_compression(self.source_folder, [(8, 6)], output_folder=self.output_folder, skip_mode="hash")
+        self.assertEqual(manifest["summary"]["compressed"], 1)
+
+    def test_batch_compression_resumes(self):
+        # A run killed before writing its manifest leaves the entries of its finished jobs in the journal
+        with unittest.mock.patch("batch_compression.json.dump", side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                batch_compression(self.source_folder, [(8, 6)], output_folder=self.output_folder, skip_mode="hash")
+        manifest = batch_compression(self.source_folder, [(8, 6)], output_folder=self.output_folder, skip_mode="hash")
+        self.assertEqual(manifest["summary"]["skipped"], 2)
+        self.assertFalse(os.path.exists(os.path.join(self.output_folder, "manifest.json.journal")))
+
+        # An output cut by a killed job is newer than its source, but not of the recorded size
+        output_path = os.path.join(self.output_folder, "compressed_40x40_F8_d6.bmp")
+        with open(output_path, "r+b") as output_file:
+            output_file.truncate(100)
+        manifest = batch_compression(self.source_folder, [(8, 6)], output_folder=self.output_folder, skip_mode="mtime")
+        self.assertEqual((manifest["summary"]["compressed"], manifest["summary"]["skipped"]), (1, 1))
+        self.assertEqual(iio.imread(output_path).shape, (40, 40))
+        self.assertFalse([name for name in os.listdir(self.output_folder) if ".partial-" in name])
+
+    def test_batch_compression_errors(self):
+        manifest = batch_compression(self.source_folder, [(32, 4)], output_folder=self.output_folder)
+        self.assertEqual(manifest["summary"]["errors"], 1)
+        self.assertEqual(manifest["summary"]["compressed"], 1)
+
+
+class TestCodec(unittest.TestCase):
+
+    def setUp(self):
+        self.image = iio.imread(os.path.join(IMAGES_PATH, "shoe.bmp"), pilmode='L')
+
+    def test_zigzag_indices(self):
+        rows, columns = zigzag_indices(4, 4)
+        expected_positions = [(0, 0), (0, 1), (1, 0), (2, 0), (1, 1), (0, 2), (0, 3), (1, 2), (2, 1), (3, 0)]
+        self.assertEqual(expected_positions, list(zip(rows.tolist(), columns.tolist())))
+        # With d > F the triangle is cut by the block borders
+        self.assertEqual(len(zigzag_indices(4, 6)[0]), 15)
+
+    def test_huffman_code_lengths(self):
+        # Fibonacci counts produce the deepest Huffman tree, which must be limited to 16 bits
+        counts = [1, 1]
+        while len(counts) < 26:
+            counts.append(counts[-1] + counts[-2])
+        lengths = huffman_code_lengths(counts)
+        self.assertLessEqual(lengths.max(), 16)
+        self.assertLessEqual(np.sum(2.0 ** -lengths), 1.0)
+        np.testing.assert_array_equal([1], huffman_code_lengths([5]))
+
+    def test_round_trip(self):
+        for block_size, frequences_cut in [(8, 6), (8, 14), (16, 10)]:
+            data = encode(self.image, block_size, frequences_cut)
+            decoded_image = decode(data)
+            expected_image = reference_compression(self.image, block_size, frequences_cut)
+            self.assertEqual(expected_image.shape, decoded_image.shape)
+            # The quantization with step 1 moves the pixels by a couple of grey levels at most
+            self.assertLessEqual(np.abs(expected_image.astype(int) - decoded_image).max(), 2)
+            self.assertLess(len(data), self.image.size // 4)
+
+    def test_sync_points(self):
+        # The segments between two sync points are decoded together, whatever their number and the length of the last one
+        expected_image = decode(encode(self.image, 8, 10))
+        for sync_interval in (1, 7, 1 << 20):
+            with self.subTest(sync_interval=sync_interval):
+                with unittest.mock.patch("codec.SYNC_INTERVAL", sync_interval):
+                    data = encode(self.image, 8, 10)
+                np.testing.assert_array_equal(expected_image, decode(data))
+
+    def test_quantization_step(self):
+        fine_data = encode(self.image, 8, 10, quantization_step=1.0)
+        coarse_data = encode(self.image, 8, 10, quantization_step=8.0)
+        self.assertLess(len(coarse_data), len(fine_data))
+        expected_image = reference_compression(self.image, 8, 10).astype(int)
+        self.assertLess(np.abs(expected_image - decode(coarse_data)).mean(), 4)
+
+    def test_constant_image(self):
+        image = np.full((16, 24), 77, dtype=np.uint8)
+        np.testing.assert_array_equal(image, decode(encode(image, 8, 1)))
+        np.testing.assert_array_equal(np.zeros_like(image), decode(encode(image, 8, 0)))
+
+    def test_files(self):
+        with tempfile.TemporaryDirectory() as folder:
+            output_path = encode_file(os.path.join(IMAGES_PATH, "shoe.bmp"), 8, 6, output_path=os.path.join(folder, "shoe.dctc"))
+            np.testing.assert_array_equal(decode(encode(self.image, 8, 6)), decode_file(output_path))
+
+    def test_invalid_data(self):
+        with self.assertRaises(ValueError):
+            decode(b"BM" + bytes(40))
+
+
+class TestCoefficientCache(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.image_path = os.path.join(self.folder.name, "shoe.bmp")
+        self.image = iio.imread(os.path.join(IMAGES_PATH, "shoe.bmp"), pilmode='L')
+        iio.imwrite(self.image_path, self.image)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_reconstruction(self):
+        cache = CoefficientCache(precision="float64")
+        for frequences_cut in [6, 3, 6]:
+            np.testing.assert_array_equal(
+                reference_compression(self.image, 8, frequences_cut),
+                cache.reconstruction(self.image_path, 8, frequences_cut)
+            )
+
+        info = cache.cache_info()
+        self.assertEqual((info.coefficient_hits, info.coefficient_misses), (1, 1))
+        self.assertEqual((info.reconstruction_hits, info.reconstruction_misses), (1, 2))
+        self.assertEqual(info.entries, 3)
+
+    def test_compression_with_cache(self):
+        cache = CoefficientCache(precision="float64")
+        output_path = os.path.join(self.folder.name, "compressed.bmp")
+        compression(self.image_path, 8, 6, output_path=output_path, cache=cache)
+        np.testing.assert_array_equal(reference_compression(self.image, 8, 6), iio.imread(output_path))
+        self.assertEqual(cache.cache_info().reconstruction_misses, 1)
+
+        # The settings of the cache win, conflicting options of the call are refused instead of ignored
+        compression(self.image_path, 8, 6, output_path=output_path, cache=cache, precision="float64", backend="scipy",
+                    flat_blocks="off")
+        for options in ({"precision": "float32"}, {"backend": "matrix"}, {"workers": 2}, {"executor": "process"},
+                        {"chunk_size": 16}, {"flat_blocks": "low_energy"}, {"padding": "edge"}, {"color": True},
+                        {"incremental": IncrementalCompressor(precision="float64")}):
+            with self.subTest(**options), self.assertRaises(ValueError):
+                compression(self.image_path, 8, 6, output_path=output_path, cache=cache, **options)
+
+    def test_reconstruction_from_coefficients(self):
+        # Coefficients larger than the cache are never stored, the ones of the caller are used instead
+        cache = CoefficientCache(max_bytes=1, precision="float64")
+        coefficients = cache.coefficients(self.image_path, 8)
+        with unittest.mock.patch.object(cache, "coefficients") as coefficients_mock:
+            final_image = cache.reconstruction(self.image_path, 8, 6, coefficients=coefficients)
+        coefficients_mock.assert_not_called()
+        np.testing.assert_array_equal(reference_compression(self.image, 8, 6), final_image)
+
+    def test_eviction(self):
+        # Room for the coefficients of a single F (256x256 float64 values) plus a reconstruction
+        cache = CoefficientCache(max_bytes=256 * 256 * 9, precision="float64")
+        cache.reconstruction(self.image_path, 8, 6)
+        cache.reconstruction(self.image_path, 16, 6)
+        info = cache.cache_info()
+        self.assertLessEqual(info.bytes, info.max_bytes)
+        self.assertEqual(info.entries, 2)
+
+        cache.reconstruction(self.image_path, 8, 5)
+        self.assertEqual(cache.cache_info().coefficient_misses, 3)
+
+    def test_reconstruction_progress_and_cancel(self):
+        cache = CoefficientCache(precision="float64")
+        progress = []
+        final_image = cache.reconstruction(self.image_path, 8, 6, progress=lambda *done: progress.append(done))
+        np.testing.assert_array_equal(reference_compression(self.image, 8, 6), final_image)
+        self.assertEqual(progress[-1], (32, 32))
+
+        cancel_event = threading.Event()
+        cancel_event.set()
+        with self.assertRaises(CompressionCancelledError):
+            cache.reconstruction(self.image_path, 8, 5, cancel_event=cancel_event)
+        self.assertEqual(cache.cache_info().entries, 2)
+
+    def test_modified_file(self):
+        cache = CoefficientCache(precision="float64")
+        cache.reconstruction(self.image_path, 8, 6)
+        iio.imwrite(self.image_path, 255 - self.image)
+        np.testing.assert_array_equal(
+            reference_compression(255 - self.image, 8, 6),
+            cache.reconstruction(self.image_path, 8, 6)
+        )
+
+
+class TestCoefficientStore(unittest.TestCase):
+
+    def setUp(self):
+        self.output_folder = tempfile.TemporaryDirectory()
+        self.image_path = os.path.join(IMAGES_PATH, "shoe.bmp")
+        image = iio.imread(self.image_path, pilmode='L')
+        self.image = image[:256, :256]
+
+    def tearDown(self):
+        self.output_folder.cleanup()
+
+    def test_store(self):
+        store_path = save_file(self.image_path, 8, 10, output_path=os.path.join(self.output_folder.name, "shoe.dcts"))
+        store = CoefficientStore(store_path)
+        self.assertEqual((store.block_size, store.max_frequences_cut, store.rows, store.columns), (8, 10, 256, 256))
+        self.assertIsInstance(store._coefficients, np.memmap)
+
+        # Every d up to the saved one is rebuilt from the store alone, float16 rounding moves a few pixels by one level
+        for frequences_cut in [0, 4, 10]:
+            expected_image = merge_blocks(compress_blocks(split_blocks(self.image, 8), frequences_cut), 32, 32)
+            difference = np.abs(expected_image.astype(int) - store.reconstruction(frequences_cut))
+            self.assertLessEqual(difference.max(), 1)
+            self.assertLess(np.count_nonzero(difference) / difference.size, 0.01)
+        with self.assertRaises(ValueError):
+            store.reconstruction(11)
+
+    def test_int16_store(self):
+        coef_blocks = scipy_dct2_fft(split_blocks(self.image, 8).astype(np.float64), axes=(1, 2))
+        store_path = save_coefficients(os.path.join(self.output_folder.name, "shoe.dcts"), coef_blocks, 32, 32, 6,
+                                       dtype="int16", quantization_step=0.5)
+        # Only the k + l < 6 triangle is saved, after the header
+        self.assertEqual(os.path.getsize(store_path), 64 + 21 * 1024 * 2)
+
+        store = CoefficientStore(store_path)
+        zigzag_rows, zigzag_columns = zigzag_indices(8, 3)
+        np.testing.assert_allclose(
+            coef_blocks[:, zigzag_rows, zigzag_columns], store.coefficients(3)[:, zigzag_rows, zigzag_columns], atol=0.25
+        )
+        self.assertEqual(np.count_nonzero(store.coefficients(3)[:, ~frequency_mask(8, 3)]), 0)
+
+    def test_invalid_store(self):
+        invalid_path = os.path.join(self.output_folder.name, "invalid.dcts")
+        with open(invalid_path, "wb") as invalid_file:
+            invalid_file.write(b"BM" + bytes(100))
+        with self.assertRaises(ValueError):
+            CoefficientStore(invalid_path)
+        with self.assertRaises(ValueError):
+            save_coefficients(invalid_path, np.zeros((4, 8, 8)), 2, 2, 6, dtype="float64")
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.image = iio.imread(os.path.join(IMAGES_PATH, "shoe.bmp"), pilmode='L')
+
+    def test_metrics(self):
+        noisy = np.clip(self.image + np.random.default_rng(23).normal(0, 5, self.image.shape), 0, 255).astype(np.uint8)
+        self.assertEqual(mse(self.image, self.image), 0)
+        self.assertEqual(psnr(self.image, self.image), float("inf"))
+        self.assertAlmostEqual(ssim(self.image, self.image), 1.0)
+        self.assertAlmostEqual(psnr(self.image, noisy), 10 * np.log10(255 ** 2 / mse(self.image, noisy)))
+        self.assertLess(ssim(self.image, noisy), 1.0)
+
+    def test_rate_distortion_curve(self):
+        coefficients = forward_coefficients(self.image, 8)
+        mse_curve, bpp_curve = rate_distortion_curve(coefficients[0])
+        self.assertEqual(len(mse_curve), 15)
+        self.assertEqual(bpp_curve[0], 0)
+        self.assertTrue((np.diff(mse_curve) <= 0).all())
+        self.assertTrue((np.diff(bpp_curve) >= 0).all())
+
+        # The predicted error of every cut matches the one of the real reconstruction, up to the rounding and
+        # the clipping of the pixels
+        for frequences_cut in [2, 6, 10]:
+            metrics = evaluate(self.image, 8, frequences_cut, coefficients)
+            self.assertAlmostEqual(mse_curve[frequences_cut], metrics.mse, delta=0.05 * metrics.mse + 0.5)
+            self.assertEqual(metrics.bpp, bpp_curve[frequences_cut])
+
+    def test_search_parameters(self):
+        metrics = search_parameters(self.image, target_psnr=35)
+        self.assertGreaterEqual(metrics.psnr, 35)
+        self.assertEqual(metrics, evaluate(self.image, metrics.block_size, metrics.frequences_cut))
+
+        metrics = search_parameters(self.image, target_bpp=0.5, block_sizes=(8, 16))
+        self.assertLessEqual(metrics.bpp, 0.5)
+        self.assertIn(metrics.block_size, (8, 16))
+
+        self.assertIsNone(search_parameters(self.image, target_bpp=-1))
+        with self.assertRaises(ValueError):
+            search_parameters(self.image)
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.output_folder = tempfile.TemporaryDirectory()
+        self.image_path = os.path.join(IMAGES_PATH, "20x20.bmp")
+        self.output_path = os.path.join(self.output_folder.name, "output.bmp")
+
+    def tearDown(self):
+        self.output_folder.cleanup()
+
+    def test_profiling_off(self):
+        with unittest.mock.patch.dict(os.environ, {instrumentation.ENV_VARIABLE: "0"}):
+            with profiling() as profiler:
+                self.assertIsNone(profiler)
+                self.assertIs(instrumentation.stage("dct"), instrumentation.stage("idct"))
+
+    def test_profiled_compression(self):
+        profiler = Profiler()
+        compression(self.image_path, 4, 3, output_path=self.output_path, profile=profiler)
+        report = profiler.report()
+
+        totals = report.totals()
+        for name in ["compression", "read", "split", "compress", "convert", "dct", "cut", "idct", "round", "merge", "write"]:
+            self.assertEqual(totals[name]["count"], 1)
+        self.assertEqual(report.stages[0].name, "compression")
+        self.assertEqual({stage.depth for stage in report.stages if stage.name == "dct"}, {2})
+        self.assertGreaterEqual(report.stages[0].peak_bytes, max(stage.peak_bytes for stage in report.stages))
+
+        trace = json.loads(report.to_chrome_trace())
+        self.assertEqual(len(trace["traceEvents"]), len(report.stages))
+        self.assertEqual(trace["traceEvents"][0]["ph"], "X")
+        self.assertEqual(json.loads(report.to_json())["totals"]["dct"]["count"], 1)
+
+    def test_environment_variable(self):
+        trace_path = os.path.join(self.output_folder.name, "compression.trace.json")
+        with unittest.mock.patch.dict(os.environ, {instrumentation.ENV_VARIABLE: trace_path}):
+            compression(self.image_path, 4, 3, output_path=self.output_path)
+            compression(self.image_path, 4, 3, output_path=self.output_path)
+
+        # Every report gets its own file, named after the process and the number of the report
+        trace_names = sorted(name for name in os.listdir(self.output_folder.name) if name.endswith(".trace.json"))
+        self.assertEqual(len(trace_names), 2)
+        self.assertTrue(all(name.startswith(f"compression.{os.getpid()}-") for name in trace_names))
+        with open(os.path.join(self.output_folder.name, trace_names[0])) as trace_file:
+            events = json.load(trace_file)["traceEvents"]
+        self.assertIn("dct", [event["name"] for event in events])
+        self.assertEqual(instrumentation.last_report().totals()["compression"]["count"], 1)
+
+    def test_last_report_per_thread(self):
+        reports = {}
+
+        def profiled_compression(block_size):
+            compression(self.image_path, block_size, 1, output_path=self.output_path + f"{block_size}.bmp", profile=True)
+            reports[block_size] = instrumentation.last_report()
+
+        threads = [threading.Thread(target=profiled_compression, args=(block_size,)) for block_size in (2, 4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Each thread gets the report of its own call
+        self.assertIsNot(reports[2], reports[4])
+        self.assertEqual(reports[2].totals()["compression"]["count"], 1)
+        self.assertEqual(reports[4].totals()["compression"]["count"], 1)
+
+
+class TestIncremental(unittest.TestCase):
+
+    def setUp(self):
+        self.image = iio.imread(os.path.join(IMAGES_PATH, "deer.bmp"), pilmode='L')
+        self.edited = self.image.copy()
+        self.edited[10:20, 30:45] = 255
+
+    def test_block_hashes(self):
+        hashes = block_hashes(self.image, 8)
+        self.assertEqual(hashes.shape, (self.image.shape[0] // 8, self.image.shape[1] // 8, 2))
+        changed = np.any(hashes != block_hashes(self.edited, 8), axis=-1)
+        np.testing.assert_array_equal(changed, dirty_blocks([(10, 30, 10, 15)], *changed.shape, 8))
+        self.assertEqual(int(changed.sum()), 6)
+
+    def test_incremental_compression(self):
+        compressor = IncrementalCompressor(precision="float64")
+        _, report = compressor.compress(self.image, 8, 6, key="deer")
+        self.assertTrue(report.full)
+
+        final_image, report = compressor.compress(self.edited, 8, 6, key="deer")
+        self.assertEqual((report.recomputed, report.full), (6, False))
+        self.assertEqual(report.reused + report.recomputed, (self.image.shape[0] // 8) * (self.image.shape[1] // 8))
+        np.testing.assert_array_equal(final_image, reference_compression(self.edited, 8, 6))
+        self.assertFalse(final_image.flags.writeable)
+
+        # The dirty rectangles replace the comparison of the hashes
+        edited = self.edited.copy()
+        edited[0:4, 0:4] = 0
+        final_image, report = compressor.compress(edited, 8, 6, key="deer", dirty_rects=[(0, 0, 4, 4)])
+        self.assertEqual(report.recomputed, 1)
+        np.testing.assert_array_equal(final_image, reference_compression(edited, 8, 6))
+        self.assertEqual(compressor.compress(edited, 8, 6, key="deer")[1].recomputed, 0)
+
+        # Another d, or another image shape, needs a full run
+        self.assertTrue(compressor.compress(edited, 8, 5, key="deer")[1].full)
+        self.assertTrue(compressor.compress(edited[:64, :64], 8, 6, key="deer")[1].full)
+
+    def test_compression_incremental(self):
+        with tempfile.TemporaryDirectory() as folder:
+            image_path = os.path.join(folder, "deer.bmp")
+            iio.imwrite(image_path, self.image)
+            compressor = IncrementalCompressor()
+            compression(image_path, 8, 6, output_path=os.path.join(folder, "first.bmp"), incremental=compressor)
+            iio.imwrite(image_path, self.edited)
+            output_path = compression(image_path, 8, 6, output_path=os.path.join(folder, "second.bmp"), incremental=compressor)
+            self.assertEqual(compressor.last_report.recomputed, 6)
+
+            # float32 is the default precision of the gray-scale images
+            compression(image_path, 8, 6, output_path=output_path, incremental=compressor, precision="float32")
+            with self.assertRaises(ValueError):
+                compression(image_path, 8, 6, incremental=compressor, precision="float64")
+            with self.assertRaises(ValueError):
+                compression(image_path, 8, 6, incremental=compressor, progress=lambda done, total: None)
+            np.testing.assert_array_equal(iio.imread(output_path), compress_image(self.edited, 8, 6))
+
+
+class TestFlatBlocks(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(37)
+        # A flat page with a textured half, and a band of blocks with a faint noise
+        self.image = np.full((96, 96), 240, dtype=np.uint8)
+        self.image[:48] = rng.integers(0, 256, size=(48, 96))
+        self.image[72:] += rng.integers(0, 2, size=(24, 96)).astype(np.uint8) * (rng.random((24, 96)) < 0.03)
+        flat_blocks.stats.reset()
+
+    def test_block_ranges(self):
+        blocks = block_view(self.image, 8)
+        lowest, highest = block_ranges(blocks)
+        np.testing.assert_array_equal(blocks.min(axis=(-2, -1)), lowest)
+        np.testing.assert_array_equal(blocks.max(axis=(-2, -1)), highest)
+
+    def test_constant_blocks(self):
+        blocks = block_view(self.image, 8)
+        expected = compress_blocks(blocks, 6, out=np.empty(blocks.shape, dtype=np.uint8), flat_blocks="off")
+        result = compress_blocks(blocks, 6, out=np.empty(blocks.shape, dtype=np.uint8))
+        # Constant blocks are rebuilt from their value, bit-identical to the full transform
+        np.testing.assert_array_equal(expected, result)
+
+        snapshot = flat_blocks.stats.snapshot()
+        self.assertGreater(snapshot["constant"], 0)
+        self.assertEqual(snapshot["low_order"], 0)
+        self.assertEqual(snapshot["constant"] + snapshot["transformed"], 144)
+
+    def test_constant_blocks_out_of_range(self):
+        # Pixels outside [0, 255] are clipped like the full transform does
+        for dtype, value, expected_value in [(np.uint16, 1000, 255), (np.int64, -5, 0)]:
+            with self.subTest(dtype=dtype):
+                blocks = np.full((3, 8, 8), value, dtype=dtype)
+                blocks[1] = 100
+                expected = compress_blocks(blocks, 6, flat_blocks="off")
+                np.testing.assert_array_equal(expected, compress_blocks(blocks, 6))
+                self.assertTrue(np.all(expected[[0, 2]] == expected_value))
+
+    def test_low_energy_blocks(self):
+        for block_size, frequences_cut in [(8, 1), (8, 2), (8, 6), (16, 8)]:
+            with self.subTest(block_size=block_size, frequences_cut=frequences_cut):
+                blocks = block_view(self.image, block_size)
+                expected = compress_blocks(blocks, frequences_cut, flat_blocks="off", precision="float64")
+                result = compress_blocks(blocks, frequences_cut, flat_blocks="low_energy", precision="float64")
+                self.assertLessEqual(np.abs(expected - result).max(), 1)
+
+        routes = classify_blocks(block_view(self.image, 8), 2, "low_energy")
+        self.assertTrue(np.all(routes.orders[routes.constant] == 0))
+        self.assertTrue(np.any(routes.orders > 0))
+        self.assertGreater(flat_blocks.stats.skipped_fraction, 0)
+
+    def test_energy_limits(self):
+        # With d <= 2 the coefficients with k < 2 and l < 2 are all the ones the cut keeps
+        self.assertEqual(energy_limits(8, 2)[1], np.inf)
+        self.assertLess(energy_limits(8, 6)[0], energy_limits(8, 6)[1])
+
+        # Blocks with a single pixel one gray level apart (an energy of 63/64) are rebuilt from their mean,
+        # within one gray level of the full transform
+        rng = np.random.default_rng(41)
+        blocks = np.full((2000, 8, 8), 100, dtype=np.uint8)
+        blocks[np.arange(2000), rng.integers(0, 8, 2000), rng.integers(0, 8, 2000)] += 1
+        routes = classify_blocks(blocks, 4, "low_energy")
+        self.assertTrue(np.all(routes.orders == 1))
+        expected = compress_blocks(blocks, 4, flat_blocks="off")
+        self.assertLessEqual(np.abs(expected - compress_blocks(blocks, 4, flat_blocks="low_energy")).max(), 1)
+
+    def test_compression(self):
+        image_path = os.path.join(IMAGES_PATH, "shoe.bmp")
+        with tempfile.TemporaryDirectory() as output_folder:
+            expected = iio.imread(compression(image_path, 8, 6, output_path=os.path.join(output_folder, "off.bmp"),
+                                              flat_blocks="off"))
+            result = iio.imread(compression(image_path, 8, 6, output_path=os.path.join(output_folder, "flat.bmp"),
+                                            workers=2, chunk_size=64))
+        np.testing.assert_array_equal(expected, result)
+        with self.assertRaises(ValueError):
+            compress_blocks(block_view(self.image, 8), 6, flat_blocks="everything")
+
+
+class TestPreview(unittest.TestCase):
+
+    def setUp(self):
+        self.image = iio.imread(os.path.join(IMAGES_PATH, "deer.bmp"), pilmode='L')
+
+    def test_dc_preview(self):
+        rows, columns = self.image.shape[0] // 8, self.image.shape[1] // 8
+        means = self.image[:rows * 8, :columns * 8].reshape(rows, 8, columns, 8).mean(axis=(1, 3))
+        np.testing.assert_array_equal(block_means(self.image, 8), np.around(means))
+        np.testing.assert_array_equal(low_order_preview(self.image, 8, 6, 1), block_means(self.image, 8))
+        self.assertFalse(low_order_preview(self.image, 8, 0, 1).any())
+
+    def test_low_order_preview(self):
+        # At full order the preview is the compressed image
+        full_preview = low_order_preview(self.image, 8, 6, 8, precision="float64")
+        self.assertLessEqual(np.abs(full_preview.astype(int) - reference_compression(self.image, 8, 6)).max(), 1)
+
+        preview = low_order_preview(self.image, 8, 6, 4)
+        self.assertEqual(preview.shape, (self.image.shape[0] // 8 * 4, self.image.shape[1] // 8 * 4))
+        # A half resolution preview is close to the mean of every 2x2 group of the compressed image
+        halved = full_preview.reshape(preview.shape[0], 2, preview.shape[1], 2).mean(axis=(1, 3))
+        self.assertLess(np.abs(preview - halved).mean(), 2)
+
+        with self.assertRaises(ValueError):
+            low_order_preview(self.image, 8, 6, 9)
+
+    def test_preview_sizes(self):
+        self.assertEqual(display_size((1000, 2000), (700, 700)), (700, 350))
+        self.assertEqual(display_size((100, 200), (700, 700)), (200, 100))
+        self.assertEqual(preview_order((4096, 4096), 8, (700, 700)), 2)
+        self.assertEqual(preview_order((64, 64), 8, (700, 700)), 8)
+        self.assertEqual([order for order, _ in previews(self.image, 8, 6)], [1, 6])
+
+
+class TestCompressionService(unittest.TestCase):
+
+    def setUp(self):
+        with open(os.path.join(IMAGES_PATH, "20x20.bmp"), "rb") as image_file:
+            self.data = image_file.read()
+        self.image = iio.imread(self.data, pilmode='L')
+
+    def request(self, port, method, target, body=b""):
+        async def send():
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(f"{method} {target} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+            head, _, payload = response.partition(b"\r\n\r\n")
+            return int(head.split()[1]), payload
+        return send()
+
+    def test_parse_parameters(self):
+        self.assertEqual(parse_parameters("F=8&d=6"), (8, 6, {"color": False, "subsampling": "4:4:4", "padding": "crop", "output_format": "bmp"}))
+        self.assertTrue(parse_parameters("F=8&d=6&color=1")[2]["color"])
+        for query in ["F=8", "F=8&d=x", "F=8&d=6&padding=wrap", "F=8&d=6&format=jpg"]:
+            with self.assertRaises(ValueError):
+                parse_parameters(query)
+
+    def test_service(self):
+        async def scenario():
+            service = CompressionService(workers=2, executor="thread")
+            server = await service.start(port=0)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                responses = await asyncio.gather(*[self.request(port, "POST", "/compress?F=4&d=3", self.data) for _ in range(4)])
+                errors = [
+                    await self.request(port, "POST", "/compress?F=4&d=9", self.data),
+                    await self.request(port, "POST", "/compress?F=4", self.data),
+                    await self.request(port, "GET", "/compress?F=4&d=3"),
+                    await self.request(port, "GET", "/unknown"),
+                ]
+                stats = await self.request(port, "GET", "/stats")
+            finally:
+                await service.close()
+            return responses, errors, stats
+
+        responses, errors, (status, stats) = asyncio.run(scenario())
+        expected = iio.imread(compress_bytes(self.data, 4, 3))
+        for status_code, payload in responses:
+            self.assertEqual(status_code, 200)
+            np.testing.assert_array_equal(iio.imread(payload), expected)
+        self.assertEqual([status_code for status_code, _ in errors], [422, 400, 405, 404])
+
+        stats = json.loads(stats)
+        self.assertEqual(stats["completed"], 4)
+        self.assertEqual(stats["failed"], 1)
+        self.assertEqual(stats["queue_depth"], 0)
+        self.assertGreater(stats["latency_ms"]["p99"], 0)
+        self.assertGreaterEqual(stats["latency_ms"]["p99"], stats["latency_ms"]["p50"])
+
+    def test_backpressure(self):
+        async def scenario():
+            service = CompressionService(workers=1, max_queue=1, executor="thread")
+            await service.start(port=0)
+            try:
+                # The only worker is busy and one request is already waiting for it
+                await service._slots.acquire()
+                waiting = asyncio.ensure_future(service.submit(self.data, 4, 3))
+                await asyncio.sleep(0)
+                self.assertEqual(service.stats.queued, 1)
+                with self.assertRaises(ServiceBusyError):
+                    await service.submit(self.data, 4, 3)
+                service._slots.release()
+                await waiting
+            finally:
+                await service.close()
+            return service.stats
+
+        stats = asyncio.run(scenario())
+        self.assertEqual((stats.rejected, stats.completed, stats.queued), (1, 1, 0))
+
+
+class TestGuiWorker(unittest.TestCase):
+
+    def test_unexpected_error(self):
+        # The worker runs without a window: only its messages to the main thread are checked
+        worker = unittest.mock.Mock(messages=queue.Queue(), max_size=(700, 700))
+        with unittest.mock.patch.object(gui.preview_module, "previews", side_effect=MemoryError("out of memory")):
+            gui.GUI.run_compression(worker, 3, os.path.join(IMAGES_PATH, "20x20.bmp"), 4, 3, threading.Event())
+
+        job_id, kind, payload = worker.messages.get_nowait()
+        self.assertEqual((job_id, kind), (3, "error"))
+        self.assertIn("MemoryError", payload)
+
+    def test_metrics(self):
+        image = iio.imread(os.path.join(IMAGES_PATH, "shoe.bmp"), pilmode='L')
+        coef_blocks = forward_coefficients(image, 8)[0]
+        compressed = compress_image(image, 8, 6)
+        worker = unittest.mock.Mock(max_size=(64, 64))
+        worker.display_size = lambda shape: gui.preview_module.display_size(shape, worker.max_size)
+        worker.display_pixels = lambda pixels, size: gui.GUI.display_pixels(worker, pixels, size)
+
+        metrics = gui.GUI.compute_metrics(worker, image, compressed, coef_blocks, 6, threading.Event())
+        # The rate of the cut alone, and the SSIM of the images as shown
+        self.assertAlmostEqual(metrics.bpp, rate_distortion_curve(coef_blocks)[1][6])
+        self.assertEqual(metrics.psnr, psnr(image[:compressed.shape[0], :compressed.shape[1]], compressed))
+        self.assertLessEqual(metrics.ssim, 1)
+
+        cancel_event = threading.Event()
+        cancel_event.set()
+        with self.assertRaises(CompressionCancelledError):
+            gui.GUI.compute_metrics(worker, image, compressed, coef_blocks, 6, cancel_event)
+
+
+class TestLazyImport(unittest.TestCase):
+
+    def test_lazy_module(self):
+        # Modules already imported are returned as they are
+        self.assertIs(lazy_module("json"), json)
+
+        module = LazyModule("colorsys")
+        self.assertEqual(module.rgb_to_hsv(1.0, 0.0, 0.0), (0.0, 1.0, 1.0))
+        self.assertTrue(module.loaded)
+        self.assertIs(module.load(), __import__("colorsys"))
+
+    def test_parse_import_time(self):
+        stderr = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:      1200 |       1500 |   numpy\n"
+            "import time:       300 |       2000 | compression_manager\n"
+        )
+        self.assertAlmostEqual(parse_import_time(stderr, "compression_manager"), 0.002)
+        # Nested imports are not the top-level module
+        with self.assertRaises(ValueError):
+            parse_import_time(stderr, "numpy")
+        self.assertEqual(heavy_modules(["numpy", "scipy.fft", "PIL", "os"]), ["PIL", "scipy"])
+
+    def test_heavy_modules_not_imported(self):
+        for module in ["compression_manager", "gui"]:
+            with self.subTest(module=module):
+                self.assertEqual(measure_import(module, repeats=1)["heavy_modules"], [])
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_measure(self):
+        calls = []
+        timing = measure(calls.append, 1, warmup=2, repeats=5)
+        self.assertEqual(len(calls), 7)
+        self.assertEqual(len(timing["times"]), 5)
+        self.assertLessEqual(timing["min"], timing["q1"])
+        self.assertLessEqual(timing["q1"], timing["median"])
+        self.assertLessEqual(timing["median"], timing["q3"])
+        self.assertAlmostEqual(timing["iqr"], timing["q3"] - timing["q1"])
+
+    def test_matrix_paths(self):
+        with tempfile.TemporaryDirectory() as folder:
+            for size in [64, 8, 512, 16]:
+                np.save(os.path.join(folder, f"matrix_{size}x{size}.npy"), np.zeros((1, 1)))
+            names = [os.path.basename(path) for path in matrix_paths(folder)]
+        self.assertEqual(names, ["matrix_8x8.npy", "matrix_16x16.npy", "matrix_64x64.npy", "matrix_512x512.npy"])
+
+    def test_compare_results(self):
+        def report(median, iqr, peak_bytes):
+            return {"results": [
+                {"suite": "dct", "name": "scipy_dct2_fft", "params": {"size": 8}, "median": median, "iqr": iqr},
+                {"suite": "memory", "name": "compress_blocks", "params": {"size": 8}, "peak_bytes": peak_bytes},
+                {"suite": "dct", "name": "custom_dct2", "params": {"size": 8}, "median": 1.0, "iqr": 0.0},
+            ]}
+
+        baseline = report(1.0, 0.05, 1000)
+        self.assertFalse(any(row["regression"] for row in compare_results(baseline, report(1.05, 0.05, 1050))))
+
+        comparison = compare_results(baseline, report(1.5, 0.05, 2000))
+        self.assertEqual([row["regression"] for row in comparison], [True, True, False])
+        self.assertAlmostEqual(comparison[0]["ratio"], 1.5)
+
+        # A slowdown inside the baseline interquartile range is noise
+        noisy_baseline = report(1.0, 0.8, 1000)
+        self.assertFalse(compare_results(noisy_baseline, report(1.5, 0.05, 1000))[0]["regression"])
+
+
 if __name__ == '__main__':
     unittest.main()